@@ -1,13 +1,24 @@
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, Response
 from werkzeug.middleware.proxy_fix import ProxyFix
 import tempfile
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
 from bridge_generator import BridgeCADGenerator
 from drawing_engine import BridgeDrawingEngine, BridgeRenderer
+from sheet_composer import TiledSheets
+from corridor import CorridorDocument
+from mesh_builder import BridgeMeshBuilder
+from quantity_takeoff import quantity_takeoff
 from parameter_definitions import PARAMETER_DEFINITIONS, PARAMETER_GROUPS
 from utils.validators import validate_parameters
+from utils.lod import simplify_for_scale
+from utils.mesh import MESH_FORMATS
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,6 +28,93 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-for-bridge-cad")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+class DrawingJSONProvider(DefaultJSONProvider):
+    """JSON provider that also serialises the engine's columnar NumPy arrays"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return DefaultJSONProvider.default(o)
+
+app.json = DrawingJSONProvider(app)
+
+class LRUCache:
+    """Least recently used mapping shared by request threads; every lookup,
+    insert and eviction happens under one lock"""
+    
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Value of key, marked as most recently used, or None"""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        """Store value as most recently used, evicting the least recently used"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+# Defaults applied to drawing-data requests that omit core parameters
+DRAWING_DEFAULTS = {
+    'LBRIDGE': 30000.0, 'NSPAN': 1, 'TOPRL': 110000.0, 'SOFL': 108000.0,
+    'LEFT': 0.0, 'ABTLEN': 10000.0, 'ALFL': 105000.0, 'ARFL': 105000.0
+}
+
+def with_drawing_defaults(parameters):
+    """New parameter dict with DRAWING_DEFAULTS for any core parameter left
+    out; the request's own JSON is never changed"""
+    return {**DRAWING_DEFAULTS, **parameters}
+
+# Recently generated engines, reused by viewport queries on the same parameters
+ENGINE_CACHE_SIZE = 16
+_engine_cache = LRUCache(ENGINE_CACHE_SIZE)
+
+def parameters_hash(parameters):
+    """Stable hash of a parameter set for caching"""
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_drawing_engine(parameters):
+    """Return a generated drawing engine for the parameters, building it only once"""
+    key = parameters_hash(parameters)
+    engine = _engine_cache.get(key)
+    if engine is None:
+        engine = BridgeDrawingEngine(parameters)
+        engine.generate_drawing_data()
+        _engine_cache.put(key, engine)
+    return engine
+
+# Preview tiles: zoom 0 fits the whole drawing into a single square tile
+TILE_SIZE = 256
+MAX_TILE_ZOOM = 8
+TILE_CACHE_SIZE = 512
+_tile_cache = LRUCache(TILE_CACHE_SIZE)
+_tile_parameters = LRUCache(TILE_CACHE_SIZE)
+
+def tile_bbox(bounds, z, x, y):
+    """Drawing-space box (min_x, min_y, max_x, max_y) covered by tile z/x/y"""
+    side = max(bounds['max_x'] - bounds['min_x'], bounds['max_y'] - bounds['min_y'], 1.0)
+    step = side / (2 ** z)
+    min_x = bounds['min_x'] + x * step
+    max_y = bounds['max_y'] - y * step
+    return min_x, max_y - step, min_x + step, max_y
+
+# Raster thumbnails for galleries and dashboards, cached by parameter hash
+THUMBNAIL_MAX_SIZE = 2000
+THUMBNAIL_CACHE_SIZE = 128
+_thumbnail_cache = LRUCache(THUMBNAIL_CACHE_SIZE)
+
 @app.route('/')
 def index():
     """Main page with parameter input form"""
@@ -176,20 +274,20 @@ def preview_bridge():
 def get_drawing_data():
     """Get drawing data for preview rendering"""
     try:
-        parameters = request.get_json()
-        
-        # Add defaults if missing
-        defaults = {
-            'LBRIDGE': 30000.0, 'NSPAN': 1, 'TOPRL': 110000.0, 'SOFL': 108000.0,
-            'LEFT': 0.0, 'ABTLEN': 10000.0, 'ALFL': 105000.0, 'ARFL': 105000.0
-        }
-        for key, default_value in defaults.items():
-            if key not in parameters:
-                parameters[key] = default_value
+        parameters = with_drawing_defaults(request.get_json())
         
         # Generate drawing data
-        engine = BridgeDrawingEngine(parameters)
-        drawing_data = engine.generate_drawing_data()
+        engine = get_drawing_engine(parameters)
+        drawing_data = {'elements': engine.elements, 'texts': engine.texts, 'hatches': engine.hatches,
+                        'bounds': engine.bounds}
+        
+        # Simplify for the preview canvas when its size is given (?width=800&height=400)
+        width = request.args.get('width', type=float)
+        height = request.args.get('height', type=float)
+        if width and height:
+            scale = BridgeRenderer.fit_scale(engine.bounds, width, height)
+            drawing_data['elements'], drawing_data['texts'] = simplify_for_scale(
+                engine.elements, engine.texts, scale, request.args.get('tolerance', 0.5, type=float))
         
         return jsonify(drawing_data)
         
@@ -197,6 +295,276 @@ def get_drawing_data():
         app.logger.error(f"Error getting drawing data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get-drawing-data/viewport', methods=['POST'])
+def get_viewport_drawing_data():
+    """Get only the drawing elements inside the current viewport"""
+    try:
+        payload = request.get_json()
+        parameters = with_drawing_defaults(payload.get('parameters', {}))
+        viewport = payload.get('viewport')
+        
+        engine = get_drawing_engine(parameters)
+        if not viewport:
+            return jsonify({'elements': engine.elements, 'texts': engine.texts, 'bounds': engine.bounds})
+        
+        return jsonify(engine.query_bbox(float(viewport['min_x']), float(viewport['min_y']),
+                                         float(viewport['max_x']), float(viewport['max_y'])))
+        
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid viewport request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error getting viewport data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/drawing-stats', methods=['POST'])
+def get_drawing_stats():
+    """Bounds, paper size, layer counts and levels without generating the drawing.
+    
+    Takes one parameter set, or a list of them for batch pre-flight checks.
+    """
+    try:
+        payload = request.get_json()
+        variants = payload if isinstance(payload, list) else [payload]
+        views = request.args.get('views')
+        views = views.split(',') if views else None
+        
+        results = []
+        for parameters in variants:
+            results.append(BridgeDrawingEngine(with_drawing_defaults(parameters)).drawing_stats(views))
+        
+        return jsonify(results if isinstance(payload, list) else results[0])
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid stats request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error getting drawing stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Partial exports written by /export/<format>
+EXPORT_MIMETYPES = {'dxf': 'application/dxf', 'pdf': 'application/pdf', 'svg': 'image/svg+xml'}
+
+def export_options():
+    """Views and layers of a partial export, from ?views=elevation&layers=STRUCTURE,footing"""
+    views = request.args.get('views')
+    layers = request.args.get('layers')
+    return views.split(',') if views else None, layers.split(',') if layers else None
+
+@app.route('/export/<fmt>', methods=['POST'])
+def export_drawing(fmt):
+    """DXF, PDF or SVG of only the requested views and layers; the engine skips
+    every component that draws on none of them"""
+    try:
+        if fmt not in EXPORT_MIMETYPES:
+            raise ValueError(f"Unknown export format: {fmt}")
+        parameters = with_drawing_defaults(request.get_json())
+        views, layers = export_options()
+        
+        drawing_data = BridgeDrawingEngine(parameters).generate_drawing_data(views=views, layers=layers)
+        if fmt == 'dxf':
+            content = BridgeCADGenerator(parameters).generate_dxf_from_drawing_data(drawing_data)
+        elif fmt == 'pdf':
+            content = BridgeCADGenerator(parameters).generate_pdf_from_drawing_data(drawing_data)
+        else:
+            content = BridgeRenderer(drawing_data).render_to_svg(int(request.args.get('width', 800)),
+                                                                 int(request.args.get('height', 400)))
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid export request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error exporting drawing: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return Response(content, mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=bridge_drawing.{fmt}'})
+
+@app.route('/generate-3d/<fmt>', methods=['POST'])
+def generate_3d(fmt):
+    """3D massing model of deck, piers, footings and abutments as binary glTF or STL"""
+    try:
+        if fmt not in MESH_FORMATS:
+            raise ValueError(f"Unknown 3D format: {fmt}")
+        parameters = with_drawing_defaults(request.get_json())
+        
+        builder = BridgeMeshBuilder(parameters)
+        content = builder.to_glb() if fmt == 'glb' else builder.to_stl()
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid 3D request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error generating 3D model: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return Response(content, mimetype=MESH_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=bridge_model.{fmt}'})
+
+@app.route('/takeoff', methods=['POST'])
+def takeoff():
+    """Concrete volumes and formwork areas of one parameter set, or of a list
+    of design variants with one value per variant"""
+    try:
+        variants = request.get_json()
+        if isinstance(variants, list):
+            variants = [with_drawing_defaults(parameters) for parameters in variants]
+        else:
+            variants = with_drawing_defaults(variants)
+        
+        quantities = quantity_takeoff(variants)
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid takeoff request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error taking off quantities: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(quantities)
+
+# Corridor documents by id, kept so bridges that have not changed are not rebuilt
+CORRIDOR_CACHE_SIZE = 16
+_corridors = LRUCache(CORRIDOR_CACHE_SIZE)
+
+@app.route('/corridor/<corridor_id>', methods=['PUT'])
+def put_corridor(corridor_id):
+    """Set every bridge of a corridor from {name: parameters}; only new or
+    changed bridges are built"""
+    try:
+        bridges = request.get_json()
+        corridor = _corridors.get(corridor_id) or CorridorDocument()
+        for name in [name for name in corridor.bridges if name not in bridges]:
+            corridor.remove_bridge(name)
+        for name, parameters in bridges.items():
+            corridor.set_bridge(name, with_drawing_defaults(parameters))
+        built = corridor.build()
+        
+        _corridors.put(corridor_id, corridor)
+        return jsonify({'built': built, 'bridges': list(corridor.bridges), 'bounds': corridor.bounds})
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid corridor: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error building corridor: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/corridor/<corridor_id>/export/<fmt>')
+def export_corridor(corridor_id, fmt):
+    """DXF, PDF or SVG of a whole corridor, or of the chainages ?start=&end="""
+    corridor = _corridors.get(corridor_id)
+    if corridor is None:
+        return jsonify({'error': f"Unknown corridor: {corridor_id}"}), 404
+    try:
+        content = corridor.export(fmt, request.args.get('start', type=float), request.args.get('end', type=float),
+                                  int(request.args.get('width', 800)), int(request.args.get('height', 400)))
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid corridor export: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error exporting corridor: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return Response(content, mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=corridor_{corridor_id}.{fmt}'})
+
+@app.route('/generate-pdf/tiled', methods=['POST'])
+def generate_tiled_pdf():
+    """Stream the drawing at true SCALE1 on tiled A1/A3 sheets, page by page"""
+    try:
+        parameters = with_drawing_defaults(request.get_json())
+        views, layers = export_options()
+        
+        tiled = TiledSheets(parameters, sheet=request.args.get('sheet', 'A1'), views=views, layers=layers)
+        # Build the drawing before the response starts, so errors still get a status
+        tiled.layout()
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid tiled PDF request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error generating tiled PDF: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return Response(tiled.iter_pdf(), mimetype='application/pdf',
+                    headers={'Content-Disposition': f'attachment; filename=bridge_{tiled.sheet}_tiled.pdf'})
+
+@app.route('/thumbnail', methods=['POST'])
+def get_thumbnail():
+    """PNG or WebP thumbnail of a parameter set, rendered once per size and format"""
+    try:
+        parameters = with_drawing_defaults(request.get_json())
+        width = int(request.args.get('width', 400))
+        height = int(request.args.get('height', 200))
+        dpi = int(request.args.get('dpi', 100))
+        fmt = request.args.get('format', 'png').lower()
+        if not (0 < width <= THUMBNAIL_MAX_SIZE and 0 < height <= THUMBNAIL_MAX_SIZE and dpi > 0):
+            raise ValueError(f"Thumbnail size must be 1-{THUMBNAIL_MAX_SIZE} pixels")
+        
+        cache_key = (parameters_hash(parameters), width, height, dpi, fmt)
+        image = _thumbnail_cache.get(cache_key)
+        if image is None:
+            engine = get_drawing_engine(parameters)
+            renderer = BridgeRenderer({'elements': engine.elements, 'texts': engine.texts,
+                                       'bounds': engine.bounds})
+            image = renderer.render_to_raster(width, height, dpi, fmt)
+            _thumbnail_cache.put(cache_key, image)
+        
+        return Response(image, mimetype=f'image/{fmt}',
+                        headers={'Cache-Control': 'public, max-age=3600'})
+        
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': f"Invalid thumbnail request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error rendering thumbnail: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tiles', methods=['POST'])
+def register_tiles():
+    """Register a parameter set for tiled preview and return the tile grid"""
+    try:
+        # A missing or unparsable body is None, rejected below as a bad request
+        parameters = with_drawing_defaults(request.get_json(silent=True))
+        
+        key = parameters_hash(parameters)
+        _tile_parameters.put(key, parameters)
+        
+        engine = get_drawing_engine(parameters)
+        return jsonify({
+            'key': key,
+            'bounds': engine.bounds,
+            'tile_size': TILE_SIZE,
+            'max_zoom': MAX_TILE_ZOOM
+        })
+        
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid tiles request: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error registering tiles: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>')
+def get_tile(z, x, y):
+    """Render one SVG preview tile of a registered parameter set"""
+    key = request.args.get('key', '')
+    parameters = _tile_parameters.get(key)
+    if parameters is None:
+        return jsonify({'error': 'Unknown tile key'}), 404
+    if z > MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'error': 'Tile out of range'}), 404
+    
+    cache_key = (key, z, x, y)
+    svg = _tile_cache.get(cache_key)
+    if svg is None:
+        engine = get_drawing_engine(parameters)
+        bbox = tile_bbox(engine.bounds, z, x, y)
+        
+        # Pad the query so strokes and labels crossing the tile edge are kept
+        pad = (bbox[2] - bbox[0]) * 0.05
+        tile_data = engine.query_bbox(bbox[0] - pad, bbox[1] - pad, bbox[2] + pad, bbox[3] + pad)
+        
+        # Level of detail: simplify sub-pixel geometry and cull unreadable labels
+        svg = BridgeRenderer(tile_data).render_to_svg(TILE_SIZE, TILE_SIZE, viewport=bbox,
+                                                      lod_tolerance_px=0.5)
+        _tile_cache.put(cache_key, svg)
+    
+    return Response(svg, mimetype='image/svg+xml',
+                    headers={'Cache-Control': 'public, max-age=3600'})
+
 @app.route('/validate-parameters', methods=['POST'])
 def validate_parameters_ajax():
     """AJAX endpoint for real-time parameter validation"""
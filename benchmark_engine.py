@@ -0,0 +1,333 @@
+"""
+Timing benchmarks for the bridge drawing engine.
+
+Run with: python benchmark_engine.py
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from drawing_engine import BridgeDrawingEngine
+from utils.survey import SurveyFile, write_survey
+
+BASE_PARAMS = {
+    'LBRIDGE': 30000,
+    'NSPAN': 3,
+    'SPAN1': 10000,
+    'TOPRL': 110000,
+    'SOFL': 108000,
+    'LEFT': 0,
+    'XINCR': 1000,
+    'SCALE1': 100,
+    'SCALE2': 1,
+}
+
+
+def timed(label, func, repeat=3):
+    """Run func repeat times and print the best wall-clock time"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<50} {best * 1000:10.1f} ms")
+    return result
+
+
+def synthetic_profile(n, left=-5000.0, right=35000.0):
+    """River cross-section with n survey points between two chainages (mm)"""
+    chainages = np.linspace(left, right, n)
+    levels = 100000 + 3000 * np.sin(chainages / 3000) - 2000 * np.exp(-((chainages - 15000) / 4000) ** 2)
+    return chainages, levels
+
+
+def bench_ground_profile(n=100000):
+    chainages, levels = synthetic_profile(n)
+
+    def run():
+        engine = BridgeDrawingEngine(BASE_PARAMS)
+        engine.draw_ground_profile(chainages, levels)
+        return engine
+
+    timed(f"ground profile component, {n} points", run)
+    timed(f"full drawing with ground profile, {n} points",
+          lambda: BridgeDrawingEngine(BASE_PARAMS, ground_profile=(chainages, levels)).generate_drawing_data())
+
+
+def bench_axes(length=10000000, xincr=100):
+    """Chainage and level axes of a long corridor with a fine increment"""
+    params = dict(BASE_PARAMS, RIGHT=length, XINCR=xincr, YINCR=100, DATUM=100000)
+
+    def run():
+        engine = BridgeDrawingEngine(params)
+        engine.draw_axes()
+        return engine
+
+    timed(f"axes, {length // xincr} chainage ticks", run)
+
+
+def bench_plan(nspan=500):
+    """Plan view of a long viaduct, square and skewed"""
+    for skew in (0, 30):
+        params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, SKEW=skew)
+        timed(f"plan of {nspan} spans, skew {skew}", lambda: BridgeDrawingEngine(params).generate_drawing_data(
+            merge=False, labels=False, views=['plan']))
+
+
+def bench_drawing_stats(nspan=500):
+    """Analytic bounds and counts against generating the drawing for them"""
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    timed(f"drawing stats, {nspan} spans", lambda: BridgeDrawingEngine(params).drawing_stats())
+    timed(f"generated bounds, {nspan} spans", lambda: BridgeDrawingEngine(params).generate_drawing_data())
+
+
+def bench_span_table(spans=(100, 500)):
+    """Viaducts from a span table of varying lengths and footing levels, with
+    two pier types: generation, plan instancing and SVG should grow linearly"""
+    from drawing_engine import BridgeRenderer
+
+    rng = np.random.default_rng(0)
+    for nspan in spans:
+        table = [{'length': length, 'pier': 'wide' if i % 4 == 0 else None, 'footing_level': level}
+                 for i, (length, level) in enumerate(zip(rng.uniform(8000, 16000, nspan),
+                                                         rng.uniform(96000, 100000, nspan)))]
+        params = dict(BASE_PARAMS, SPAN_TABLE=table, PIER_TYPES={'wide': {'PIERTW': 1800, 'FUTW': 4000}})
+        timed(f"span table drawing data, {nspan} spans", lambda: BridgeDrawingEngine(params).generate_drawing_data())
+        timed(f"span table plan, {nspan} spans", lambda: BridgeDrawingEngine(params).generate_drawing_data(
+            merge=False, labels=False, views=['plan']))
+        data = BridgeDrawingEngine(params).generate_drawing_data()
+        timed(f"span table SVG, {nspan} spans", lambda: BridgeRenderer(data).render_to_svg())
+
+
+def bench_sheet_views(nspan=200):
+    """Sheet views built one after another and concurrently"""
+    from sheet_composer import SheetComposer, SHEET_VIEWS, build_view
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    for name, _, _ in SHEET_VIEWS:
+        timed(f"sheet view {name}, {nspan} spans", lambda: build_view(params, name))
+    timed("all sheet views serially", lambda: [build_view(params, name) for name, _, _ in SHEET_VIEWS])
+    timed("all sheet views, thread pool", lambda: SheetComposer(params).build_views())
+    timed("all sheet views, process pool", lambda: SheetComposer(params, processes=True).build_views())
+
+
+def bench_dxf_dimensions(nspan=200):
+    """Native DXF dimensions of a long viaduct, rendered one by one and through blocks"""
+    import ezdxf
+    from utils.dimensions import write_dxf_dimensions
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000)
+    dims = BridgeDrawingEngine(params).generate_drawing_data()['dimensions']
+    for reuse in (False, True):
+        def run():
+            doc = ezdxf.new('R2010')
+            return write_dxf_dimensions(doc, doc.modelspace(), dims, reuse_blocks=reuse)
+
+        timed(f"{len(dims)} DXF dimensions, reuse_blocks={reuse}", run, repeat=1)
+
+
+def bench_pdf(nspan=200):
+    """PDF of a long viaduct with fine chainage labels from prepared drawing data"""
+    from bridge_generator import BridgeCADGenerator
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    data = BridgeDrawingEngine(params).generate_drawing_data()
+    pdf = timed(f"PDF of {nspan} spans", lambda: BridgeCADGenerator(params).generate_pdf_from_drawing_data(data))
+    print(f"{'':<50} PDF size {len(pdf) / 1024:.0f} KiB")
+
+
+def bench_pdf_forms(nspan=500):
+    """Vector part of a long viaduct PDF with repeated components as forms and without"""
+    import io
+    from reportlab.pdfgen import canvas
+    from utils.pdf_writer import draw_elements
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000)
+    data = BridgeDrawingEngine(params).generate_drawing_data()
+    for forms in (False, True):
+        def run():
+            c = canvas.Canvas(io.BytesIO())
+            draw_elements(c, data['elements'], lambda x: x / 1000, lambda y: (y - 60000) / 1000, forms)
+            return c.getpdfdata()
+
+        pdf = timed(f"PDF vectors of {nspan} spans, forms={forms}", run)
+        print(f"{'':<50} PDF size {len(pdf) / 1024:.0f} KiB")
+
+
+def bench_tiled_pdf(nspan=200):
+    """True-scale tiled A1 sheets of a long viaduct, time to first page and in total"""
+    from sheet_composer import TiledSheets
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    for processes in (False, True):
+        tiled = TiledSheets(params, processes=processes)
+        tiled.layout()
+
+        def first_page():
+            chunks = tiled.iter_pdf()
+            next(chunks)
+            page = next(chunks)
+            chunks.close()
+            return page
+
+        timed(f"first tiled sheet of {nspan} spans, processes={processes}", first_page, repeat=1)
+        pdf = timed(f"tiled PDF of {nspan} spans, processes={processes}", tiled.generate_pdf, repeat=1)
+        print(f"{'':<50} PDF size {len(pdf) / 1024:.0f} KiB")
+
+
+def bench_thumbnail(nspan=500):
+    """Raster thumbnail of a long viaduct from prepared drawing data, PNG and WebP"""
+    from drawing_engine import BridgeRenderer
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    renderer = BridgeRenderer(BridgeDrawingEngine(params).generate_drawing_data())
+    for fmt in ('png', 'webp'):
+        image = timed(f"{fmt} thumbnail of {nspan} spans", lambda: renderer.render_to_raster(400, 200, fmt=fmt))
+        print(f"{'':<50} {fmt} size {len(image) / 1024:.1f} KiB")
+
+
+def bench_partial_export(nspan=500):
+    """Drawing data and SVG of a long viaduct for the whole drawing and for layer subsets"""
+    from drawing_engine import BridgeRenderer
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, XINCR=100)
+    for layers in (None, ['STRUCTURE'], ['FOUNDATION', 'HATCHING'], ['deck', 'approach_slab']):
+        def run():
+            return BridgeRenderer(BridgeDrawingEngine(params).generate_drawing_data(layers=layers)).render_to_svg()
+
+        svg = timed(f"SVG of {nspan} spans, layers {','.join(layers or ['all'])}", run)
+        print(f"{'':<50} SVG size {len(svg) / 1024:.0f} KiB")
+
+
+def bench_corridor(count=40, nspan=20):
+    """A highway corridor of many bridges: full and incremental builds, whole and windowed SVG"""
+    from corridor import CorridorDocument
+
+    bridges = {f"B{i}": dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, LEFT=i * 300000,
+                             RIGHT=i * 300000 + nspan * 10000 + 10000) for i in range(count)}
+    for processes in (False, True):
+        timed(f"corridor of {count} bridges, processes={processes}",
+              lambda: CorridorDocument(bridges, processes=processes).build(), repeat=1)
+
+    corridor = CorridorDocument(bridges)
+    corridor.build()
+
+    def change_one():
+        corridor.set_bridge('B7', dict(bridges['B7'], TOPRL=corridor.bridges['B7']['TOPRL'] + 1))
+        return corridor.build()
+
+    timed("corridor rebuild after one bridge changed", change_one)
+    svg = timed("corridor SVG, whole", lambda: corridor.export('svg'))
+    print(f"{'':<50} SVG size {len(svg) / 1024:.0f} KiB")
+    svg = timed("corridor SVG, one 500 m window", lambda: corridor.export('svg', 1000000, 1500000))
+    print(f"{'':<50} SVG size {len(svg) / 1024:.0f} KiB")
+
+
+def bench_mesh(nspan=500):
+    """3D massing model of a long viaduct and its binary glTF and STL"""
+    from mesh_builder import BridgeMeshBuilder
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, SKEW=15)
+    parts = timed(f"mesh of {nspan} spans", lambda: BridgeMeshBuilder(params).build())
+    print(f"{'':<50} {sum(len(t) for _, _, t in parts)} triangles")
+    for fmt in ('glb', 'stl'):
+        model = timed(f"{fmt} of {nspan} spans", getattr(BridgeMeshBuilder(params), f"to_{fmt}"))
+        print(f"{'':<50} {fmt} size {len(model) / 1024:.0f} KiB")
+
+
+def bench_takeoff(n=100000):
+    """Quantity takeoff of one bridge and of a design matrix of n variants"""
+    from quantity_takeoff import quantity_takeoff
+
+    rng = np.random.default_rng(0)
+    variants = {
+        'NSPAN': rng.integers(1, 20, n), 'LBRIDGE': rng.uniform(20000, 200000, n),
+        'PIERTW': rng.uniform(1000, 2500, n), 'SLBTHC': rng.uniform(800, 1400, n),
+        'SKEW': rng.uniform(0, 30, n),
+    }
+    timed("takeoff of one bridge", lambda: quantity_takeoff(BASE_PARAMS))
+    timed(f"takeoff of {n} design variants", lambda: quantity_takeoff(variants))
+
+
+def bench_profile_decimation(n=100000):
+    """Generation plus SVG and PDF output, with and without profile decimation"""
+    from bridge_generator import BridgeCADGenerator
+    from drawing_engine import BridgeRenderer
+
+    chainages, levels = synthetic_profile(n)
+    for tolerance in (None, 0.1):
+        def run():
+            engine = BridgeDrawingEngine(BASE_PARAMS, ground_profile=(chainages, levels),
+                                         profile_tolerance=tolerance)
+            data = engine.generate_drawing_data()
+            BridgeRenderer(data).render_to_svg()
+            return BridgeCADGenerator(BASE_PARAMS).generate_pdf_from_drawing_data(data)
+
+        pdf = timed(f"generate + SVG + PDF, {n} points, tolerance {tolerance}", run, repeat=1)
+        print(f"{'':<50} PDF size {len(pdf) / 1024:.0f} KiB")
+
+
+def bench_streamed_svg(nspan=500, n=200000):
+    """Whole-drawing SVG of a long viaduct against the streamed export, with peak memory"""
+    import tracemalloc
+    from drawing_engine import BridgeRenderer
+
+    params = dict(BASE_PARAMS, NSPAN=nspan, LBRIDGE=nspan * 10000, RIGHT=nspan * 10000, XINCR=100)
+    chainages, levels = synthetic_profile(n, right=nspan * 10000.0)
+
+    def full():
+        data = BridgeDrawingEngine(params, ground_profile=(chainages, levels)).generate_drawing_data()
+        return BridgeRenderer(data).render_to_svg()
+
+    def streamed():
+        engine = BridgeDrawingEngine(params, ground_profile=(chainages, levels))
+        bounds = engine.stream_bounds()
+        with open(os.devnull, 'w') as out:
+            return BridgeRenderer.stream_svg(engine.iter_items(), bounds, out)
+
+    for label, func in (('in memory', full), ('streamed', streamed)):
+        tracemalloc.start()
+        timed(f"SVG of {nspan} spans, {n} profile points, {label}", func, repeat=1)
+        print(f"{'':<50} peak {tracemalloc.get_traced_memory()[1] / 1e6:.0f} MB")
+        tracemalloc.stop()
+
+
+def bench_survey_window(n=10000000):
+    """A long corridor survey where the bridge only covers a small window"""
+    chainages, levels = synthetic_profile(n, left=-2000000.0, right=2000000.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'corridor.survey')
+        write_survey(path, chainages, levels)
+        del chainages, levels
+
+        with SurveyFile(path) as survey:
+            timed(f"survey window LEFT..RIGHT of {n} points",
+                  lambda: survey.window(0, 30000))
+            timed(f"full drawing from memory-mapped survey of {n} points",
+                  lambda: BridgeDrawingEngine(BASE_PARAMS, ground_profile=survey).generate_drawing_data())
+
+
+if __name__ == '__main__':
+    bench_ground_profile(100000)
+    bench_ground_profile(1000000)
+    bench_axes()
+    bench_plan()
+    bench_drawing_stats()
+    bench_span_table()
+    bench_sheet_views()
+    bench_dxf_dimensions()
+    bench_pdf()
+    bench_pdf_forms()
+    bench_tiled_pdf()
+    bench_thumbnail()
+    bench_partial_export()
+    bench_corridor()
+    bench_mesh()
+    bench_takeoff()
+    bench_profile_decimation()
+    bench_streamed_svg()
+    bench_survey_window()
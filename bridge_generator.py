@@ -4,12 +4,19 @@ import ezdxf
 from math import atan2, degrees, sqrt, cos, sin, tan, radians, pi
 import logging
 import io
+import numpy as np
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.units import mm
 from reportlab.lib.colors import black, blue, red
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from ezdxf.enums import TextEntityAlignment
+from ezdxf.addons import r12writer
+from utils.labels import split_lines, iter_texts
+from utils.dimensions import DIM_LAYER, write_dxf_dimensions
+from utils.hatching import write_dxf_hatches
+from utils.pdf_writer import binary_streams, draw_elements, draw_texts, draw_hatches
 
 class BridgeCADGenerator:
     """Main class for generating bridge CAD drawings from parameters"""
@@ -235,74 +242,121 @@ class BridgeCADGenerator:
             logging.error(f"Error generating DXF: {str(e)}")
             raise Exception(f"Failed to generate bridge drawing: {str(e)}")
     
+    def generate_dxf_from_drawing_data(self, drawing_data):
+        """Generate DXF using unified drawing data"""
+        try:
+            logging.info("Starting DXF generation with drawing data")
+            
+            self.write_dxf_layout(drawing_data, self.msp)
+            
+            string_buffer = io.StringIO()
+            self.doc.write(string_buffer)
+            dxf_content = string_buffer.getvalue()
+            string_buffer.close()
+            
+            logging.info("DXF generation completed successfully")
+            return dxf_content.encode('utf-8')
+            
+        except Exception as e:
+            logging.error(f"Error generating DXF: {str(e)}")
+            raise Exception(f"Failed to generate bridge drawing: {str(e)}")
+    
+    def write_dxf_layout(self, drawing_data, layout):
+        """Write drawing data into a DXF layout or block of self.doc"""
+        # Dimensions are written as native DIMENSION entities instead of
+        # the explicit geometry drawn for PDF and SVG
+        dimensions = drawing_data.get('dimensions')
+        if dimensions:
+            write_dxf_dimensions(self.doc, layout, dimensions, float(self.scale1))
+        
+        # Section fills as native HATCH entities, one per hatch
+        write_dxf_hatches(self.doc, layout, drawing_data.get('hatches', ()))
+        
+        for elem in drawing_data['elements']:
+            layer = elem['layer']
+            if dimensions and layer == DIM_LAYER:
+                continue
+            if layer not in self.doc.layers:
+                self.doc.layers.add(layer)
+            
+            if elem['type'] == 'line':
+                layout.add_line((elem['x1'], elem['y1']), (elem['x2'], elem['y2']),
+                                dxfattribs={'layer': layer})
+            elif elem['type'] == 'polyline':
+                layout.add_lwpolyline(elem['points'], close=elem['closed'],
+                                      dxfattribs={'layer': layer})
+            elif elem['type'] == 'segments':
+                for x1, y1, x2, y2 in elem['coords'].tolist():
+                    layout.add_line((x1, y1), (x2, y2), dxfattribs={'layer': layer})
+        
+        for text in iter_texts(drawing_data['texts']):
+            if dimensions and text['layer'] == DIM_LAYER:
+                continue
+            rotation = text.get('rotation', 0)
+            for line, insert in self.dxf_text_lines(text):
+                layout.add_text(
+                    line,
+                    dxfattribs={'height': text['size'], 'rotation': rotation, 'layer': 'ANNOTATIONS'}
+                ).set_placement(insert, align=TextEntityAlignment.BOTTOM_CENTER)
+    
+    @staticmethod
+    def dxf_text_lines(text):
+        """(line, insertion point) of each line of a text"""
+        angle = math.radians(text.get('rotation', 0))
+        for line, offset in split_lines(text['text']):
+            # Offset successive lines perpendicular to the text direction
+            dy = offset * text['size']
+            yield line, (text['x'] - dy * math.sin(angle), text['y'] + dy * math.cos(angle))
+    
+    def stream_dxf(self, items, out):
+        """Write an iter_items() stream as R12 DXF to the text stream out in one pass.
+        
+        Entities go straight to out without building a document, so memory
+        does not grow with the drawing. R12 has no DIMENSION entities, so
+        dimensions come out as the explicit geometry drawn for PDF and SVG;
+        it has no HATCH entities either, so hatches are left out.
+        """
+        count = 0
+        with r12writer(out) as dxf:
+            for kind, item in items:
+                if kind == 'element':
+                    layer = item['layer']
+                    if item['type'] == 'line':
+                        dxf.add_line((item['x1'], item['y1']), (item['x2'], item['y2']), layer=layer)
+                    elif item['type'] == 'polyline':
+                        dxf.add_polyline_2d(np.asarray(item['points']).tolist(), closed=item['closed'], layer=layer)
+                    elif item['type'] == 'segments':
+                        for x1, y1, x2, y2 in item['coords'].tolist():
+                            dxf.add_line((x1, y1), (x2, y2), layer=layer)
+                elif kind == 'text':
+                    for text in iter_texts([item]):
+                        for line, insert in self.dxf_text_lines(text):
+                            dxf.add_text(line, insert, height=text['size'], align='BOTTOM_CENTER',
+                                         rotation=text.get('rotation', 0), layer='ANNOTATIONS')
+                count += 1
+        logging.info(f"Streamed {count} items to DXF")
+        return count
+    
+    def generate_pdf(self):
+        """Generate the complete PDF drawing through the unified drawing engine"""
+        from drawing_engine import BridgeDrawingEngine
+        
+        drawing_data = BridgeDrawingEngine(self.params).generate_drawing_data()
+        return self.generate_pdf_from_drawing_data(drawing_data)
+    
     def generate_pdf_from_drawing_data(self, drawing_data):
         """Generate PDF using unified drawing data"""
         try:
             logging.info("Starting PDF generation with drawing data")
             
-            from drawing_engine import BridgeRenderer
-            
             pdf_buffer = io.BytesIO()
-            page_width, page_height = landscape(A4)
-            c = canvas.Canvas(pdf_buffer, pagesize=landscape(A4))
-            
-            margin = 20 * mm
-            drawing_width = page_width - 2 * margin
-            drawing_height = page_height - 2 * margin
-            
-            # Use drawing data bounds
-            bounds = drawing_data['bounds']
-            bridge_width_mm = bounds['max_x'] - bounds['min_x']
-            bridge_height_mm = bounds['max_y'] - bounds['min_y']
-            
-            # Calculate scale
-            available_width_mm = drawing_width / mm
-            available_height_mm = drawing_height / mm
-            
-            scale_x = available_width_mm / bridge_width_mm if bridge_width_mm > 0 else 1
-            scale_y = available_height_mm / bridge_height_mm if bridge_height_mm > 0 else 1
-            pdf_scale = min(scale_x, scale_y, 1.0)
-            
-            logging.info(f"PDF Scale: {pdf_scale}, Bridge: {bridge_width_mm}x{bridge_height_mm}mm")
-            
-            # Center drawing
-            final_width_pts = bridge_width_mm * pdf_scale * mm
-            final_height_pts = bridge_height_mm * pdf_scale * mm
-            offset_x = margin + (drawing_width - final_width_pts) / 2
-            offset_y = margin + (drawing_height - final_height_pts) / 2
-            
-            # Transform coordinates
-            def transform_x(x):
-                return offset_x + (x - bounds['min_x']) * pdf_scale * mm
-            
-            def transform_y(y):
-                return offset_y + (bounds['max_y'] - y) * pdf_scale * mm
-            
-            # Set drawing properties
-            c.setLineWidth(0.5)
-            c.setStrokeColor(black)
-            
-            # Draw all elements
-            for elem in drawing_data['elements']:
-                if elem['type'] == 'line':
-                    x1 = transform_x(elem['x1'])
-                    y1 = transform_y(elem['y1'])
-                    x2 = transform_x(elem['x2'])
-                    y2 = transform_y(elem['y2'])
-                    c.setLineWidth(elem['width'] * 0.5)
-                    c.line(x1, y1, x2, y2)
-            
-            # Draw text
-            for text in drawing_data['texts']:
-                x = transform_x(text['x'])
-                y = transform_y(text['y'])
-                font_size = max(8, text['size'] * pdf_scale / 50)
+            with binary_streams():
+                c = canvas.Canvas(pdf_buffer, pagesize=landscape(A4))
                 
-                c.setFont("Helvetica", font_size)
-                text_width = c.stringWidth(text['text'], "Helvetica", font_size)
-                c.drawString(x - text_width/2, y, text['text'])
-            
-            c.save()
+                transform_x, transform_y, pdf_scale = self.pdf_frame(drawing_data['bounds'])
+                self.draw_pdf_drawing_data(c, drawing_data, transform_x, transform_y, pdf_scale)
+                
+                c.save()
             pdf_content = pdf_buffer.getvalue()
             pdf_buffer.close()
             
@@ -313,7 +367,80 @@ class BridgeCADGenerator:
             logging.error(f"Error generating PDF: {str(e)}")
             raise Exception(f"Failed to generate bridge PDF: {str(e)}")
     
+    def stream_pdf(self, items, bounds, out):
+        """Write an iter_items() stream as a one-page PDF to the binary stream out.
+        
+        Items are drawn as they arrive; bounds come from a pre-pass such as
+        BridgeDrawingEngine.stream_bounds().
+        """
+        try:
+            with binary_streams():
+                c = canvas.Canvas(out, pagesize=landscape(A4))
+                transform_x, transform_y, pdf_scale = self.pdf_frame(bounds)
+                c.setStrokeColor(black)
+                count = 0
+                for kind, item in items:
+                    if kind == 'hatch':
+                        draw_hatches(c, [item], transform_x, transform_y, pdf_scale * mm)
+                    elif kind == 'element':
+                        draw_elements(c, [item], transform_x, transform_y)
+                    elif kind == 'text':
+                        draw_texts(c, [item], transform_x, transform_y, pdf_scale * mm)
+                    count += 1
+                c.save()
+            logging.info(f"Streamed {count} items to PDF")
+            return count
+        
+        except Exception as e:
+            logging.error(f"Error streaming PDF: {str(e)}")
+            raise Exception(f"Failed to stream bridge PDF: {str(e)}")
+    
+    def pdf_frame(self, bounds):
+        """Coordinate transforms and scale fitting bounds onto a landscape A4 page"""
+        page_width, page_height = landscape(A4)
+        margin = 20 * mm
+        drawing_width = page_width - 2 * margin
+        drawing_height = page_height - 2 * margin
+        
+        bridge_width_mm = bounds['max_x'] - bounds['min_x']
+        bridge_height_mm = bounds['max_y'] - bounds['min_y']
+        
+        # Calculate scale
+        available_width_mm = drawing_width / mm
+        available_height_mm = drawing_height / mm
+        
+        scale_x = available_width_mm / bridge_width_mm if bridge_width_mm > 0 else 1
+        scale_y = available_height_mm / bridge_height_mm if bridge_height_mm > 0 else 1
+        pdf_scale = min(scale_x, scale_y, 1.0)
+        
+        logging.info(f"PDF Scale: {pdf_scale}, Bridge: {bridge_width_mm}x{bridge_height_mm}mm")
+        
+        # Center drawing
+        final_width_pts = bridge_width_mm * pdf_scale * mm
+        final_height_pts = bridge_height_mm * pdf_scale * mm
+        offset_x = margin + (drawing_width - final_width_pts) / 2
+        offset_y = margin + (drawing_height - final_height_pts) / 2
+        
+        # Transform coordinates
+        def transform_x(x):
+            return offset_x + (x - bounds['min_x']) * pdf_scale * mm
+        
+        def transform_y(y):
+            return offset_y + (y - bounds['min_y']) * pdf_scale * mm
+        
+        return transform_x, transform_y, pdf_scale
     
+    def draw_pdf_drawing_data(self, c, drawing_data, transform_x, transform_y, pdf_scale):
+        """Draw drawing data on a reportlab canvas through the given transforms.
+        
+        The transforms are affine and are applied to whole coordinate arrays;
+        hatches are clipped pattern forms under the elements, which go out as one
+        path per layer and width, and texts as one text object.
+        """
+        c.setStrokeColor(black)
+        draw_hatches(c, drawing_data.get('hatches', ()), transform_x, transform_y, pdf_scale * mm)
+        draw_elements(c, drawing_data['elements'], transform_x, transform_y)
+        draw_texts(c, drawing_data['texts'], transform_x, transform_y, pdf_scale * mm)
     
     def draw_bridge_pdf(self, c, offset_x, offset_y, pdf_scale):
         """Draw bridge elements on PDF"""
@@ -0,0 +1,134 @@
+"""
+Corridor documents: every structure along an alignment in one drawing.
+
+Each bridge is an independent parameter set placed at its own chainage by
+its LEFT and RIGHT. Bridges are built concurrently, and only when their
+parameters have changed; one spatial index over the items of all bridges
+culls the corridor for exports of any chainage window.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from drawing_engine import BridgeDrawingEngine, BridgeRenderer
+from bridge_generator import BridgeCADGenerator
+from utils.geometry import element_bbox, clip_batch
+from utils.labels import label_bbox
+from utils.spatial_index import GridIndex
+
+CORRIDOR_FORMATS = ('dxf', 'pdf', 'svg')
+
+
+def build_bridge(parameters, views=None, layers=None):
+    """Drawing data of one bridge with the boxes of its items; module level
+    so process pools can run it"""
+    data = BridgeDrawingEngine(parameters).generate_drawing_data(views=views, layers=layers)
+    boxes = {}
+    for kind in ('elements', 'hatches'):
+        for i, item in enumerate(data[kind]):
+            boxes[kind, i] = element_bbox(item)
+    for i, text in enumerate(data['texts']):
+        boxes['texts', i] = label_bbox(text)
+    return data, boxes
+
+
+class CorridorDocument:
+    """Bridges of one alignment by name, in one model space at their own chainages"""
+
+    def __init__(self, bridges=None, views=None, layers=None, max_workers=None, processes=False):
+        self.bridges = {}  # Name -> parameters
+        self.built = {}  # Name -> (parameters built, drawing data, item boxes)
+        self.views = views
+        self.layers = layers
+        self.max_workers = max_workers
+        self.processes = processes
+        self.index = None
+        self.bounds = None
+        for name, parameters in (bridges or {}).items():
+            self.set_bridge(name, parameters)
+
+    def set_bridge(self, name, parameters):
+        """Add or replace a bridge; it is rebuilt by the next build() only if its parameters differ"""
+        self.bridges[name] = dict(parameters)
+
+    def remove_bridge(self, name):
+        del self.bridges[name]
+
+    def stale(self):
+        """Names of the bridges not built with their current parameters"""
+        return [name for name, parameters in self.bridges.items()
+                if name not in self.built or self.built[name][0] != parameters]
+
+    def build(self):
+        """Build the stale bridges concurrently and re-index the corridor if
+        anything changed; returns the names of the bridges built"""
+        stale = self.stale()
+        removed = [name for name in self.built if name not in self.bridges]
+        for name in removed:
+            del self.built[name]
+
+        if stale:
+            executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            with executor(max_workers=self.max_workers) as pool:
+                futures = {name: pool.submit(build_bridge, self.bridges[name], self.views, self.layers)
+                           for name in stale}
+                for name, future in futures.items():
+                    self.built[name] = (self.bridges[name], *future.result())
+        if stale or removed or self.index is None:
+            self.build_index()
+
+        logging.info(f"Built {len(stale)} of {len(self.bridges)} corridor bridges")
+        return stale
+
+    def build_index(self):
+        """One spatial index over the items of every bridge, keyed (name, kind, i)"""
+        boxes = {(name, kind, i): box for name, (_, _, bridge_boxes) in self.built.items()
+                 for (kind, i), box in bridge_boxes.items()}
+        self.index = GridIndex.from_boxes(boxes)
+        if self.index.bounds is not None:
+            min_x, min_y, max_x, max_y = self.index.bounds
+            self.bounds = {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y': max_y}
+        else:
+            self.bounds = {'min_x': 0, 'max_x': 0, 'min_y': 0, 'max_y': 0}
+        return self.index
+
+    def drawing_data(self, start=None, end=None):
+        """Drawing data of the whole corridor, or of the chainage window
+        start..end (its bounds) with every item crossing it clipped to it.
+
+        Dimensions of a window come only as their drawn geometry, so a
+        partial span never gets a native DXF dimension of its full length.
+        """
+        self.build()
+        if start is None and end is None:
+            data = {'elements': [], 'texts': [], 'dimensions': [], 'hatches': []}
+            for name in self.bridges:
+                bridge = self.built[name][1]
+                for kind in data:
+                    data[kind].extend(bridge[kind])
+            data['bounds'] = self.bounds
+            return data
+
+        bounds = self.bounds
+        box = (bounds['min_x'] if start is None else float(start), bounds['min_y'],
+               bounds['max_x'] if end is None else float(end), bounds['max_y'])
+        data = {'elements': [], 'texts': [], 'dimensions': [], 'hatches': []}
+        for name, kind, i in sorted(self.index.query(*box)):
+            data[kind].append(clip_batch(self.built[name][1][kind][i], *box))
+        data['bounds'] = {'min_x': box[0], 'max_x': box[2], 'min_y': box[1], 'max_y': box[3]}
+        return data
+
+    def export(self, fmt, start=None, end=None, width=800, height=400):
+        """DXF, PDF or SVG of the corridor or of a chainage window. Drawing-wide
+        settings such as SCALE1 are taken from the first bridge."""
+        if fmt not in CORRIDOR_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        if not self.bridges:
+            raise ValueError("The corridor has no bridges")
+        data = self.drawing_data(start, end)
+        parameters = next(iter(self.bridges.values()))
+        if fmt == 'dxf':
+            return BridgeCADGenerator(parameters).generate_dxf_from_drawing_data(data)
+        if fmt == 'pdf':
+            return BridgeCADGenerator(parameters).generate_pdf_from_drawing_data(data)
+        return BridgeRenderer(data).render_to_svg(width, height)
@@ -3,17 +3,80 @@ Unified Bridge Drawing Engine
 Generates drawing data that can be rendered to SVG, PDF, or DXF
 """
 
+import io
 import math
 import logging
+from html import escape
+
+import numpy as np
+
+from utils.geometry import (merge_segments, element_bbox, union_bbox, clip_batch, stadium_outline,
+                            outline_segments, element_segments, abutment_width,
+                            ABUTMENT_FOOTING_PROJECTION)
+from utils.labels import place_labels, label_bbox, split_lines, iter_texts
+from utils.survey import clean_survey
+from utils.spatial_index import GridIndex
+from utils.lod import simplify_for_scale, simplify_polyline, thin_positions
+from utils.transforms import (TransformStack, translation, scaling, rotation, apply,
+                              apply_segments, apply_bbox, matrix_angle, matrix_scale)
+from utils.dimensions import DIM_LAYER, DIM_TEXT, make_dimension, dedupe_dimensions, dimension_geometry
+from utils.spans import with_span_table, span_layout
+from utils.hatching import (HATCH_LAYER, HATCH_PATTERNS, HATCH_LINE_WIDTH, HATCH_MIN_CELL, EARTH_DEPTH,
+                            make_hatch, rectangle_loops, strip_loop, pattern_segments)
+
+# Segments written per SVG path when streaming
+STREAM_CHUNK = 10000
+
+# Raster previews: formats written through matplotlib, and the stroke width
+# in pixels per unit of element width, as in the SVG
+RASTER_FORMATS = ('png', 'webp')
+RASTER_LINE_WIDTH = 1.0
+
+# Partial exports: the DXF layer set of setup_dxf_layers() and the engine
+# layers drawn on each. Nothing in the engine is drawn as a centre line yet.
+LAYER_GROUPS = {
+    'GRID': ('axis', 'axis_ticks', 'ground_profile', 'ground_ticks'),
+    'STRUCTURE': ('deck', 'soffit', 'abutment_cap', 'abutment_wall', 'pier_cap', 'pier_shaft',
+                  'approach_slab', 'plan_pier', 'plan_abutment', 'deck_section'),
+    'DIMENSIONS': (DIM_LAYER,),
+    'ANNOTATIONS': ('text', 'axis_labels', 'ground_labels', 'section_labels'),
+    'CENTERLINES': (),
+    'HATCHING': (HATCH_LAYER,),
+    'DETAILS': ('slab_profile', 'end_connection', 'dirt_wall', 'pier_connection'),
+    'FOUNDATION': ('footing', 'pier_footing', 'plan_footing'),
+}
+
+
+def resolve_layers(layers):
+    """Engine layers named by a list of engine layer and LAYER_GROUPS names (None keeps all)"""
+    if layers is None:
+        return None
+    known = {layer for group in LAYER_GROUPS.values() for layer in group}
+    resolved = set()
+    for name in layers:
+        if name in LAYER_GROUPS:
+            resolved.update(LAYER_GROUPS[name])
+        elif name in known:
+            resolved.add(name)
+        else:
+            raise ValueError(f"Unknown layer: {name}")
+    return frozenset(resolved)
+
 
 class BridgeDrawingEngine:
     """Core bridge drawing calculations and geometry generation - matches original Python accuracy"""
     
-    def __init__(self, parameters):
-        self.params = parameters
+    def __init__(self, parameters, ground_profile=None, profile_tolerance=0.1):
+        self.params = with_span_table(parameters)
+        self.spans = span_layout(self.params)  # Span edges and per-pier arrays
+        self.ground_profile = ground_profile  # (chainages, levels) in mm or a SurveyFile
+        self.profile_tolerance = profile_tolerance  # Paper mm, None keeps every survey point
         self.elements = []
         self.texts = []
+        self.dimensions = []
+        self.hatches = []
         self.bounds = {'min_x': 0, 'max_x': 0, 'min_y': 0, 'max_y': 0}
+        self.index = None
         
         # Initialize coordinate transformation functions like original program
         self.scale1 = float(parameters.get('SCALE1', 100))
@@ -22,32 +85,43 @@ class BridgeDrawingEngine:
         self.left = float(parameters.get('LEFT', 0))
         self.skew = float(parameters.get('SKEW', 0))
         
-        # Calculate scaling factors like original
+        # Calculate scaling factors like original; parameters are already in mm,
+        # so the original's m to mm factor of 1000 does not apply
         self.sc = self.scale1 / self.scale2 if self.scale2 != 0 else 1
-        self.vvs = 1000.0 / 1  # vs = 1
-        self.hhs = 1000.0 / 1  # hs = 1
+        self.vvs = 1.0  # vs = 1
+        self.hhs = 1.0  # hs = 1
         
         # Skew calculations
-        self.skew1 = self.skew * 0.0174532  # Convert degrees to radians
+        self.skew1 = math.radians(self.skew)
         self.s = math.sin(self.skew1)
         self.c = math.cos(self.skew1)
         self.tn = self.s / self.c if self.c != 0 else 0
         
+        # Affine transforms of the views about (LEFT, DATUM); components are
+        # emitted through self.transform, applied to whole arrays at once
+        self.elevation_matrix = scaling(self.hhs, self.vvs, origin=(self.left, self.datum))
+        self.section_matrix = scaling(self.sc * self.hhs, self.sc * self.vvs, origin=(self.left, self.datum))
+        self.transform = TransformStack()
+        
     def vpos(self, a):
         """Vertical position transformation like original"""
-        return self.datum + self.vvs * (a - self.datum)
+        return float(apply(self.elevation_matrix, (self.left, a))[1])
         
+    def paper_to_model(self, paper_mm, section=False):
+        """Drawing length of a paper distance at SCALE1, or SCALE2 for section views"""
+        return paper_mm * (self.scale2 if section else self.scale1)
+    
     def hpos(self, a):
         """Horizontal position transformation like original"""
-        return self.left + self.hhs * (a - self.left)
+        return float(apply(self.elevation_matrix, (a, self.datum))[0])
         
     def v2pos(self, a):
         """Scaled vertical position like original"""
-        return self.datum + self.sc * self.vvs * (a - self.datum)
+        return float(apply(self.section_matrix, (self.left, a))[1])
         
     def h2pos(self, a):
         """Scaled horizontal position like original"""
-        return self.left + self.sc * self.hhs * (a - self.left)
+        return float(apply(self.section_matrix, (a, self.datum))[0])
         
     
     def draw_bridge_elevation(self):
@@ -136,29 +210,21 @@ class BridgeDrawingEngine:
         self.add_line(right_start - abtlen - alfo, arfl, right_start - abtlen - alfo, footing_top_r, 'footing', 1)
         self.add_line(right_start + alfo, footing_top_r, right_start - abtlen - alfo, footing_top_r, 'footing', 1)
         
-    def draw_piers_detailed(self):
-        """Draw detailed piers matching original program"""
-        left = float(self.params.get('LEFT', 0))
-        lbridge = float(self.params.get('LBRIDGE', 30000))
-        nspan = int(self.params.get('NSPAN', 1))
-        span1 = float(self.params.get('SPAN1', 30000))
-        capt = float(self.params.get('CAPT', 109000))
-        capb = float(self.params.get('CAPB', 108000))
-        piertw = float(self.params.get('PIERTW', 1500))
-        futrl = float(self.params.get('FUTRL', 100000))
-        futd = float(self.params.get('FUTD', 2000))
-        futw = float(self.params.get('FUTW', 3000))
-        futl = float(self.params.get('FUTL', 8000))
-        battr = float(self.params.get('BATTR', 0.02))  # Pier batter
+        # Concrete of caps, walls and footings, one hatch for both abutments
+        self.add_hatch(rectangle_loops(
+            [left, left, left - alfo, right_start - alcw, right_start - abtlen, right_start - abtlen - alfo],
+            [toprl - alcd, sofl, alfl, toprl - alcd, sofl, arfl],
+            [left + alcw, left + abtlen, left + abtlen + alfo, right_start, right_start, right_start + alfo],
+            [toprl, toprl - alcd, footing_top, toprl, toprl - alcd, footing_top_r]), 'concrete')
         
-        if nspan <= 1:
+    def draw_piers_detailed(self):
+        """Draw detailed piers matching original program, at the span table's pier centres"""
+        spans = self.spans
+        if not len(spans['centres']):
             return
-            
-        # Calculate pier positions
-        for pier_num in range(1, nspan):
-            # Pier centerline position
-            pier_center_x = left + (pier_num * span1)
-            
+        
+        for pier_center_x, capt, capb, piertw, futrl, futd, futw, battr in zip(*(spans[key].tolist() for key in (
+                'centres', 'CAPT', 'CAPB', 'PIERTW', 'FUTRL', 'FUTD', 'FUTW', 'BATTR'))):
             # Pier cap dimensions
             cap_half_width = piertw / 2
             pier_left = pier_center_x - cap_half_width
@@ -195,6 +261,11 @@ class BridgeDrawingEngine:
             # Connect shaft to footing
             self.add_line(shaft_left_bottom, futrl + futd, footing_left, futrl + futd, 'pier_connection', 1)
             self.add_line(shaft_right_bottom, futrl + futd, footing_right, futrl + futd, 'pier_connection', 1)
+        
+        # Concrete of every pier footing as one hatch
+        centres, futw = spans['centres'], spans['FUTW']
+        self.add_hatch(rectangle_loops(centres - futw / 2, spans['FUTRL'], centres + futw / 2,
+                                       spans['FUTRL'] + spans['FUTD']), 'concrete')
             
     def draw_approach_slabs(self):
         """Draw approach slabs like original program"""
@@ -235,7 +306,6 @@ class BridgeDrawingEngine:
         toprl = float(self.params.get('TOPRL', 110000))
         sofl = float(self.params.get('SOFL', 108000))
         nspan = int(self.params.get('NSPAN', 1))
-        span1 = float(self.params.get('SPAN1', 30000))
         scale1 = int(self.params.get('SCALE1', 100))
         
         # Title
@@ -252,11 +322,10 @@ class BridgeDrawingEngine:
         dim_y = sofl - 3000
         self.add_text(left + lbridge / 2, dim_y, f"BRIDGE LENGTH = {lbridge/1000:.1f}M", 400)
         
-        # Span annotations
+        # Span annotations, at the middle of every span of the span table
+        edges = self.spans['edges']
         if nspan > 1:
-            span_length = lbridge / nspan
-            for i in range(nspan):
-                span_center_x = left + (i + 0.5) * span_length
+            for i, span_center_x in enumerate(((edges[:-1] + edges[1:]) / 2).tolist()):
                 span_y = sofl - 1500
                 self.add_text(span_center_x, span_y, f"SPAN {i+1}", 300)
         else:
@@ -277,32 +346,797 @@ class BridgeDrawingEngine:
         
         # Pier labels for multi-span
         if nspan > 1:
-            for pier_num in range(1, nspan):
-                pier_x = left + (pier_num * span1)
+            for pier_num, pier_x in enumerate(self.spans['centres'].tolist(), 1):
                 pier_y = (toprl + sofl) / 2
                 self.add_text(pier_x, pier_y, f"PIER {pier_num}", 350)
     
-    def add_line(self, x1, y1, x2, y2, layer='default', width=1):
-        """Add a line element"""
-        self.elements.append({
-            'type': 'line',
-            'x1': x1, 'y1': y1,
-            'x2': x2, 'y2': y2,
-            'layer': layer,
-            'width': width
-        })
+    def plan_templates(self):
+        """Plan outlines around their own origins: pier tops and battered
+        bottoms and pier footings, one per pier (n, m, 2), and the left
+        abutment's wall, footing and cap lines (the right abutment is the
+        left one mirrored)"""
+        spans = self.spans
+        capb, piertw, pierst, battr = spans['CAPB'], spans['PIERTW'], spans['PIERST'], spans['BATTR']
+        futrl, futd, futw, futl = spans['FUTRL'], spans['FUTD'], spans['FUTW'], spans['FUTL']
+        abtlen = float(self.params.get('ABTLEN', 10000))
+        alcw = float(self.params.get('ALCW', 1200))
+        alfo = float(self.params.get('ALFO', 500))
+        dwth = float(self.params.get('DWTH', 300))
+        
+        # Straight length along the skew, top width and battered bottom width
+        pierstsq = pierst / self.c + abs(piertw * self.tn)
+        ofset = (capb - futrl - futd) * battr
+        
+        # Abutment wall across the deck with the cap and dirt wall lines, and
+        # the footing projecting beyond it each side
+        half = self.abutment_width() / 2
+        foot = half + ABUTMENT_FOOTING_PROJECTION
+        return {
+            'pier_top': stadium_outline(piertw, pierstsq),
+            'pier_bottom': stadium_outline(piertw + 2 * ofset, pierstsq),
+            'pier_footing': rectangle_loops(-futw / 2, -futl / 2, futw / 2, futl / 2),
+            'abutment_wall': np.array([[0, -half], [abtlen + dwth, -half], [abtlen + dwth, half], [0, half]]),
+            'abutment_cap_lines': np.array([[[alcw, -half], [alcw, half]], [[abtlen, -half], [abtlen, half]]]),
+            'abutment_footing': np.array([[-alfo, -foot], [abtlen + alfo, -foot],
+                                          [abtlen + alfo, foot], [-alfo, foot]]),
+        }
     
-    def add_text(self, x, y, text, size=400, layer='text'):
-        """Add a text element"""
-        self.texts.append({
-            'x': x, 'y': y,
-            'text': str(text),
-            'size': size,
-            'layer': layer
+    def abutment_width(self):
+        """Transverse length of the abutments in plan, along the skew"""
+        return abutment_width(float(self.params.get('CCBR', 7500)), float(self.params.get('KERBW', 300)), self.c)
+    
+    def plan_origins(self):
+        """Pier centres (n x 2) and the left and right abutment origins of the plan"""
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        yc = self.datum
+        centres = self.spans['centres']
+        piers = np.column_stack([centres, np.full_like(centres, yc)])
+        return piers, (self.left, yc), (self.left + lbridge, yc)
+    
+    def _draw_plan_outlines(self):
+        """Plan outlines about the datum line, in the current transform.
+        
+        Each outline is built once around its own centre and placed at every
+        pier (or both abutments) with the skew rotation in one array operation,
+        so all spans cost a single segments element per layer.
+        """
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        templates = self.plan_templates()
+        centres, left_origin, right_origin = self.plan_origins()
+        
+        if len(centres):
+            self.add_instances(templates['pier_top'], centres, self.skew, 'plan_pier', 2)
+            self.add_instances(templates['pier_bottom'], centres, self.skew, 'plan_pier', 1)
+            self.add_instances(templates['pier_footing'], centres, self.skew, 'plan_footing', 2)
+        
+        mirror = np.array([-1.0, 1.0])
+        for origin, flip in ((left_origin, 1.0), (right_origin, mirror)):
+            origins = np.array([origin])
+            self.add_instances(templates['abutment_wall'] * flip, origins, self.skew, 'plan_abutment', 2)
+            self.add_instances(templates['abutment_footing'] * flip, origins, self.skew, 'plan_footing', 2)
+            for cap_line in templates['abutment_cap_lines']:
+                self.add_instances(cap_line * flip, origins, self.skew, 'plan_abutment', 1,
+                                   closed=False)
+        
+        self.add_text(self.left + lbridge / 2, self.datum + self.abutment_width() / 2 + 2500, "PLAN", 800)
+    
+    def deck_section_outline(self):
+        """Deck slab with kerbs across the carriageway, about x = 0 (n x 2).
+        
+        Widths are taken along the skew like the original (CCBR / cos skew).
+        """
+        toprl = float(self.params.get('TOPRL', 110000))
+        ccbr = float(self.params.get('CCBR', 7500))
+        kerbw = float(self.params.get('KERBW', 300))
+        kerbd = float(self.params.get('KERBD', 150))
+        slbthe = float(self.params.get('SLBTHE', 800))
+        slbtht = float(self.params.get('SLBTHT', 600))
+        
+        half = ccbr / self.c / 2
+        kw = kerbw / self.c
+        k1, k2 = 50 / self.c, 25 / self.c  # Kerb top chamfer, 50 and 25 mm
+        yp = toprl - slbthe
+        right = np.array([
+            [half, yp], [half + kw, toprl - slbtht], [half + kw, toprl + kerbd],
+            [half + k1, toprl + kerbd], [half + k2, toprl + kerbd - 25], [half, toprl]
+        ])
+        left = right[::-1] * [-1, 1]
+        return np.vstack([right, left])
+    
+    def draw_deck_section(self):
+        """Draw the deck cross-section with kerbs and carriageway at SCALE1/SCALE2"""
+        toprl = float(self.params.get('TOPRL', 110000))
+        ccbr = float(self.params.get('CCBR', 7500))
+        kerbw = float(self.params.get('KERBW', 300))
+        kerbd = float(self.params.get('KERBD', 150))
+        slbthe = float(self.params.get('SLBTHE', 800))
+        x0 = self.left
+        s2 = self.scale2
+        half = ccbr / self.c / 2
+        kw = kerbw / self.c
+        
+        with self.transform.push(self.section_matrix):
+            self.add_polyline(self.deck_section_outline() + [x0, 0], 'deck_section', 2, closed=True)
+            self.add_text(x0, toprl + 2 * s2, "CARRIAGEWAY", 2.5 * s2, 'section_labels')
+            
+            # Kerbs and carriageway along the top, slab depth at the edge
+            dim_y = toprl + kerbd + 8 * s2
+            edges = [x0 - half - kw, x0 - half, x0 + half, x0 + half + kw]
+            for x1, x2 in zip(edges[:-1], edges[1:]):
+                self.add_dimension((x1, toprl), (x2, toprl), (x1, dim_y))
+            self.add_dimension((x0 + half, toprl - slbthe), (x0 + half, toprl),
+                               (x0 + half + kw + 8 * s2, toprl), angle=90)
+    
+    def draw_pier_section(self):
+        """Draw section YY of a pier with the deck above it at SCALE1/SCALE2"""
+        capt = float(self.params.get('CAPT', 109000))
+        capb = float(self.params.get('CAPB', 108000))
+        capw = float(self.params.get('CAPW', 2000))
+        piertw = float(self.params.get('PIERTW', 1500))
+        pierst = float(self.params.get('PIERST', 5000))
+        battr = float(self.params.get('BATTR', 0.02))
+        futrl = float(self.params.get('FUTRL', 100000))
+        futd = float(self.params.get('FUTD', 2000))
+        futl = float(self.params.get('FUTL', 8000))
+        x0 = self.left
+        s2 = self.scale2
+        
+        # Straight length along the skew and batter as in the plan
+        pierstsq = pierst / self.c + abs(piertw * self.tn)
+        half_top = pierstsq / 2 + piertw / 2
+        half_bottom = half_top + (capb - futrl - futd) * battr
+        cap_half = pierstsq / 2 + capw / 2
+        
+        with self.transform.push(self.section_matrix):
+            self.add_polyline(self.deck_section_outline() + [x0, 0], 'deck_section', 2, closed=True)
+            self.add_polyline([(x0 - cap_half, capb), (x0 + cap_half, capb),
+                               (x0 + cap_half, capt), (x0 - cap_half, capt)], 'pier_cap', 2, closed=True)
+            self.add_polyline([(x0 - half_top, capb), (x0 + half_top, capb),
+                               (x0 + half_bottom, futrl + futd), (x0 - half_bottom, futrl + futd)],
+                              'pier_shaft', 2, closed=True)
+            # Where the rounded ends of the pier meet its straight faces
+            for x in (x0 - pierstsq / 2, x0 + pierstsq / 2):
+                self.add_line(x, capb, x, futrl + futd, 'pier_shaft', 1)
+            self.add_polyline([(x0 - futl / 2, futrl), (x0 + futl / 2, futrl),
+                               (x0 + futl / 2, futrl + futd), (x0 - futl / 2, futrl + futd)],
+                              'pier_footing', 2, closed=True)
+            
+            self.add_dimension((x0 - cap_half, capt), (x0 + cap_half, capt), (x0, capt + 8 * s2))
+            self.add_dimension((x0 - futl / 2, futrl), (x0 + futl / 2, futrl), (x0, futrl - 8 * s2))
+    
+    def draw_dimensions(self):
+        """Dimension the spans, the overall length and every pier footing"""
+        left = self.left
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        spans = self.spans
+        s = self.scale1
+        
+        # Span chain and overall length below the chainage bands
+        edges = spans['edges'].tolist()
+        chain_y = self.datum - 50 * s
+        for x1, x2 in zip(edges[:-1], edges[1:]):
+            self.add_dimension((x1, chain_y), (x2, chain_y), (x1, chain_y))
+        self.add_dimension((left, chain_y), (left + lbridge, chain_y), (left, chain_y - 10 * s))
+        
+        # Footing width and depth, repeated at every pier
+        for centre, futrl, futd, futw in zip(*(spans[key].tolist() for key in ('centres', 'FUTRL', 'FUTD', 'FUTW'))):
+            footing_left = centre - futw / 2
+            self.add_dimension((footing_left, futrl), (footing_left + futw, futrl),
+                               (footing_left, futrl - 8 * s))
+            self.add_dimension((footing_left, futrl), (footing_left, futrl + futd),
+                               (footing_left - 8 * s, futrl), angle=90)
+    
+    def add_dimension_geometry(self):
+        """De-duplicate the collected dimensions and draw them as explicit geometry"""
+        self.dimensions = dedupe_dimensions(self.dimensions)
+        coords, labels = dimension_geometry(self.dimensions, self.scale1)
+        self.add_segments(coords, DIM_LAYER, 1)
+        for angle, xs, ys, texts in labels:
+            self.add_text_batch(xs, ys, texts, DIM_TEXT * self.scale1, DIM_LAYER, angle)
+    
+    def chainage_right(self):
+        """Right end of the drawing's chainage window, LEFT + LBRIDGE without RIGHT"""
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        return float(self.params.get('RIGHT', self.left + lbridge))
+    
+    def draw_axes(self):
+        """Draw the level (Y) and chainage (X) axes like the original layout section.
+        
+        Level ticks every YINCR from DATUM up to TOPRL and chainage ticks every
+        XINCR from LEFT to RIGHT are computed as arrays in one pass and added as
+        one segments element and one label batch per axis.
+        """
+        xincr = float(self.params.get('XINCR', 1000))
+        yincr = float(self.params.get('YINCR', 1000))
+        toprl = float(self.params.get('TOPRL', 110000))
+        left = self.left
+        right = self.chainage_right()
+        datum = self.datum
+        s = self.scale1
+        
+        # Band offsets below datum in paper mm, as in the original
+        d1 = 20
+        d2 = 2.5
+        d4 = 2 * d1
+        
+        # X axis, the two band lines below it and the Y axis
+        self.add_line(left, datum, right, datum, 'axis', 1)
+        self.add_line(left, datum - d1 * s, right, datum - d1 * s, 'axis', 1)
+        self.add_line(left, datum - d4 * s, right, datum - d4 * s, 'axis', 1)
+        self.add_line(left, datum - d4 * s, left, toprl, 'axis', 1)
+        self.add_text(left - 18 * s, datum - 0.5 * d1 * s, "BED LEVEL", 2.5 * s, 'axis_labels')
+        self.add_text(left - 18 * s, datum - 1.5 * d1 * s, "CHAINAGE", 2.5 * s, 'axis_labels')
+        
+        # Level ticks and labels on the Y axis
+        if yincr > 0 and toprl >= datum:
+            lvl = datum + np.arange(int((toprl - datum) // yincr) + 1) * yincr
+            self.add_segments(np.column_stack([np.full_like(lvl, left - d2 * s), lvl,
+                                               np.full_like(lvl, left + d2 * s), lvl]),
+                              'axis_ticks', 1)
+            self.add_text_batch(np.full_like(lvl, left - 9 * s), lvl - 1.0 * s, lvl / 1000,
+                                2 * s, 'axis_labels', fmt='%.3f')
+        
+        # Chainage ticks in both bands and labels read upwards, as in cs()
+        if xincr > 0 and right >= left:
+            ch = left + np.arange(int((right - left) // xincr) + 1) * xincr
+            bands = [(d4, d4 - 2), (d1 + 2, d1 - 2)]
+            ticks = np.concatenate([
+                np.column_stack([ch, np.full_like(ch, datum - lo * s), ch, np.full_like(ch, datum - hi * s)])
+                for lo, hi in bands
+            ])
+            self.add_segments(ticks, 'axis_ticks', 1)
+            self.add_text_batch(ch + 0.9 * s, np.full_like(ch, datum - 1.5 * d1 * s), ch / 1000,
+                                2 * s, 'axis_labels', 90, fmt='%.3f')
+    
+    def ground_profile_window(self):
+        """Survey chainages and levels under the drawing's LEFT..RIGHT window"""
+        profile = self.ground_profile
+        if hasattr(profile, 'window'):
+            # Memory-mapped surveys are only read between LEFT and RIGHT
+            return profile.window(self.left, self.chainage_right())
+        return profile
+    
+    def draw_ground_profile_window(self):
+        """Draw the ground profile under the drawing's window"""
+        self.draw_ground_profile(*self.ground_profile_window())
+    
+    def draw_ground_profile(self, chainages, levels):
+        """Draw the river cross-section / ground profile like the original cs() routine.
+        
+        Chainages and levels are survey arrays in mm; rows that do not parse
+        as numbers are dropped. The profile line, the ticks of survey points
+        off the XINCR grid and the rotated chainage/RL labels are built as
+        whole arrays.
+        
+        With profile_tolerance set, the profile is decimated so it stays within
+        that many paper mm of the survey at SCALE1. Ticks and labels then mark
+        only the kept points, at most one label per text height.
+        """
+        xincr = float(self.params.get('XINCR', 1000))
+        chainages, levels = clean_survey(chainages, levels)
+        if len(chainages) == 0:
+            return
+        
+        # Paper distances below datum, in mm at SCALE1 (d1 = 20 in the original)
+        d1 = 20
+        s = self.scale1
+        datum = self.datum
+        
+        points = np.column_stack([chainages, levels])
+        if self.profile_tolerance:
+            points = simplify_polyline(points, self.paper_to_model(self.profile_tolerance))
+            chainages, levels = points[:, 0], points[:, 1]
+        self.add_polyline(points, 'ground_profile', 1)
+        self.add_hatch(strip_loop(points, self.paper_to_model(EARTH_DEPTH), datum), 'earth')
+        
+        # Ticks in the chainage bands and on the datum for points off the grid
+        if xincr > 0:
+            x = chainages[~np.isclose(np.mod(chainages - self.left, xincr), 0)]
+        else:
+            x = chainages
+        bands = [(2 * d1, 2 * d1 - 2), (d1 + 2, d1 - 2), (2, 0)]
+        ticks = np.concatenate([
+            np.column_stack([x, np.full_like(x, datum - lo * s), x, np.full_like(x, datum - hi * s)])
+            for lo, hi in bands
+        ])
+        self.add_segments(ticks, 'ground_ticks', 1)
+        
+        # Chainage and level labels, read upwards, centred in their bands
+        if self.profile_tolerance:
+            keep = thin_positions(chainages, 2 * s)
+            chainages, levels = chainages[keep], levels[keep]
+        label_x = chainages + 0.9 * s
+        self.add_text_batch(label_x, np.full_like(label_x, datum - 1.5 * d1 * s),
+                            chainages / 1000, 2 * s, 'ground_labels', 90, fmt='%.3f')
+        self.add_text_batch(label_x, np.full_like(label_x, datum - 0.5 * d1 * s),
+                            levels / 1000, 2 * s, 'ground_labels', 90, fmt='%.3f')
+    
+    # View name -> method drawing it about its own origin, for sheets that
+    # build every view independently (see sheet_composer.py)
+    VIEWS = {
+        'elevation': 'draw_elevation',
+        'plan': '_draw_plan_outlines',
+        'pier_section': 'draw_pier_section',
+        'deck_section': 'draw_deck_section',
+    }
+    
+    # Draw method -> layers it draws on, so partial exports skip whole components
+    COMPONENT_LAYERS = {
+        'draw_bridge_elevation': ('deck', 'soffit', 'slab_profile', 'end_connection'),
+        'draw_abutments_detailed': ('abutment_cap', 'abutment_wall', 'footing', 'dirt_wall', HATCH_LAYER),
+        'draw_piers_detailed': ('pier_cap', 'pier_shaft', 'pier_footing', 'pier_connection', HATCH_LAYER),
+        'draw_approach_slabs': ('approach_slab',),
+        'add_professional_annotations': ('text',),
+        'draw_axes': ('axis', 'axis_ticks', 'axis_labels'),
+        'draw_ground_profile_window': ('ground_profile', 'ground_ticks', 'ground_labels', HATCH_LAYER),
+        'draw_dimensions': (DIM_LAYER,),
+        '_draw_plan_outlines': ('plan_pier', 'plan_footing', 'plan_abutment', 'text'),
+        'draw_deck_section': ('deck_section', 'section_labels', DIM_LAYER),
+        'draw_pier_section': ('deck_section', 'pier_cap', 'pier_shaft', 'pier_footing', DIM_LAYER),
+    }
+    
+    def draw_elevation(self):
+        """Draw the elevation with its axes, ground profile and dimensions"""
+        for matrix, component in self.view_components(['elevation']):
+            self.run_component(matrix, component)
+    
+    def view_components(self, views=None, layers=None):
+        """(matrix, method) pairs that draw the views, in drawing order.
+        
+        Without views this is the elevation with the plan moved below it; the
+        plan is moved the same way whenever it is drawn with another view.
+        With layers (a set from resolve_layers) only the methods drawing on
+        at least one of them are returned.
+        """
+        components = []
+        for name in views or ('elevation', 'plan'):
+            if name == 'elevation':
+                elevation = [self.draw_bridge_elevation, self.draw_abutments_detailed,
+                             self.draw_piers_detailed, self.draw_approach_slabs,
+                             self.add_professional_annotations, self.draw_axes]
+                if self.ground_profile is not None:
+                    elevation.append(self.draw_ground_profile_window)
+                elevation.append(self.draw_dimensions)
+                components.extend((self.elevation_matrix, method) for method in elevation)
+            elif name == 'plan':
+                components.append((self.plan_matrix(views), self._draw_plan_outlines))
+            else:
+                components.append((None, getattr(self, self.VIEWS[name])))
+        if layers is not None:
+            components = [(matrix, method) for matrix, method in components
+                          if layers.intersection(self.COMPONENT_LAYERS[method.__name__])]
+        return components
+    
+    def plan_matrix(self, views=None):
+        """Transform of the plan among views: 30 m below datum as in the
+        original whenever another view is drawn with it, about its own
+        origin when it is drawn alone"""
+        if len(set(views or ('elevation', 'plan'))) > 1:
+            return translation(0, -30000)
+        return None
+    
+    def keep_layers(self, layers):
+        """Drop what the components drew outside layers (None keeps everything)"""
+        if layers is None:
+            return
+        self.elements = [elem for elem in self.elements if elem['layer'] in layers]
+        self.texts = [text for text in self.texts if text['layer'] in layers]
+        self.hatches = [hatch for hatch in self.hatches if hatch['layer'] in layers]
+        if DIM_LAYER not in layers:
+            self.dimensions = []
+    
+    def run_component(self, matrix, component):
+        """Run one draw method, inside matrix when given"""
+        if matrix is None:
+            component()
+        else:
+            with self.transform.push(matrix):
+                component()
+    
+    def generate_drawing_data(self, merge=True, tolerance=1.0, labels=True, views=None, layers=None):
+        """Build the drawing and return renderer-ready drawing data.
+        
+        By default this is the elevation with the plan below it; views (names
+        from VIEWS) draws only those views, each about its own origin. layers
+        (engine layer or LAYER_GROUPS names) keeps only those layers, and draw
+        methods with nothing on them are not run at all.
+        """
+        self.elements = []
+        self.texts = []
+        self.dimensions = []
+        self.hatches = []
+        layers = resolve_layers(layers)
+        
+        # Every view is emitted through the one transform stack
+        for matrix, component in self.view_components(views, layers):
+            self.run_component(matrix, component)
+        self.keep_layers(layers)
+        self.add_dimension_geometry()
+        
+        # Snap, de-duplicate and chain segments into polylines
+        if merge:
+            self.elements = merge_segments(self.elements, tolerance)
+        
+        # Move colliding labels apart once, for every output format
+        if labels:
+            self.texts = place_labels(self.texts)
+        
+        self.build_index()
+        
+        return {
+            'elements': self.elements,
+            'texts': self.texts,
+            'dimensions': self.dimensions,
+            'hatches': self.hatches,
+            'bounds': self.bounds
+        }
+    
+    def iter_items(self, views=None, layers=None):
+        """Yield ('dimension' | 'hatch' | 'element' | 'text', item) pairs component by component.
+        
+        Only one component's output is held at a time, so memory follows the
+        largest component (columnar batches count as one) instead of the whole
+        sheet. Segment merging and label placement need the whole drawing and
+        are skipped.
+        """
+        layers = resolve_layers(layers)
+        for matrix, component in self.view_components(views, layers):
+            self.elements, self.texts, self.dimensions, self.hatches = [], [], [], []
+            self.run_component(matrix, component)
+            self.keep_layers(layers)
+            self.add_dimension_geometry()
+            for dim in self.dimensions:
+                yield 'dimension', dim
+            for hatch in self.hatches:
+                yield 'hatch', hatch
+            for elem in self.elements:
+                yield 'element', elem
+            for text in self.texts:
+                yield 'text', text
+        self.elements, self.texts, self.dimensions, self.hatches = [], [], [], []
+    
+    def stream_bounds(self, views=None, layers=None):
+        """Bounds of the drawing from a pre-pass over iter_items(), keeping nothing"""
+        min_x = min_y = math.inf
+        max_x = max_y = -math.inf
+        for kind, item in self.iter_items(views, layers):
+            if kind == 'dimension':
+                continue
+            x0, y0, x1, y1 = label_bbox(item) if kind == 'text' else element_bbox(item)
+            min_x, min_y = min(min_x, x0), min(min_y, y0)
+            max_x, max_y = max(max_x, x1), max(max_y, y1)
+        if min_x > max_x:
+            return {'min_x': 0, 'max_x': 0, 'min_y': 0, 'max_y': 0}
+        return {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y': max_y}
+    
+    # Parametric layout: bounds, counts and levels worked out from the
+    # parameters alone, without generating the elements. Texts are measured
+    # with label_bbox() on the extreme labels of each run.
+    
+    def derived_levels(self):
+        """Key levels and heights of the structure, in mm"""
+        toprl = float(self.params.get('TOPRL', 110000))
+        sofl = float(self.params.get('SOFL', 108000))
+        capt = float(self.params.get('CAPT', 109000))
+        capb = float(self.params.get('CAPB', 108000))
+        futrl = float(self.params.get('FUTRL', 100000))
+        futd = float(self.params.get('FUTD', 2000))
+        alfl = float(self.params.get('ALFL', 105000))
+        arfl = float(self.params.get('ARFL', 105000))
+        alfd = float(self.params.get('ALFD', 1000))
+        battr = float(self.params.get('BATTR', 0.02))
+        return {
+            'datum': self.datum,
+            'deck_top': toprl,
+            'soffit': sofl,
+            'slab_centre_bottom': toprl - float(self.params.get('SLBTHC', 1000)),
+            'slab_edge_bottom': toprl - float(self.params.get('SLBTHE', 800)),
+            'pier_cap_top': capt,
+            'pier_cap_bottom': capb,
+            'pier_footing_top': futrl + futd,
+            'pier_founding': futrl,
+            'pier_height': capb - futrl - futd,
+            'pier_batter_offset': (capb - futrl - futd) * battr,
+            'left_abutment_founding': alfl,
+            'left_abutment_footing_top': alfl + alfd,
+            'right_abutment_founding': arfl,
+            'right_abutment_footing_top': arfl + alfd,
+        }
+    
+    @staticmethod
+    def _batch_bbox(xs, ys, values, size, rotation=0, fmt=None):
+        """label_bbox() of a text batch holding only its extreme labels"""
+        return label_bbox({
+            'type': 'text_batch', 'x': np.asarray(xs, dtype=float), 'y': np.asarray(ys, dtype=float),
+            'text': np.asarray(values, dtype=float if fmt else str), 'format': fmt,
+            'size': size, 'rotation': rotation
         })
     
+    def _tick_counts(self):
+        """Number of level and chainage ticks drawn by draw_axes()"""
+        xincr = float(self.params.get('XINCR', 1000))
+        yincr = float(self.params.get('YINCR', 1000))
+        toprl = float(self.params.get('TOPRL', 110000))
+        right = self.chainage_right()
+        levels = int((toprl - self.datum) // yincr) + 1 if yincr > 0 and toprl >= self.datum else 0
+        chainages = int((right - self.left) // xincr) + 1 if xincr > 0 and right >= self.left else 0
+        return levels, chainages
+    
+    def _elevation_boxes(self):
+        """Boxes of the elevation components before the elevation transform"""
+        left = self.left
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        nspan = int(self.params.get('NSPAN', 1))
+        toprl = float(self.params.get('TOPRL', 110000))
+        sofl = float(self.params.get('SOFL', 108000))
+        abtlen = float(self.params.get('ABTLEN', 10000))
+        alcw = float(self.params.get('ALCW', 1200))
+        alcd = float(self.params.get('ALCD', 800))
+        alfo = float(self.params.get('ALFO', 500))
+        dwth = float(self.params.get('DWTH', 300))
+        laslab = float(self.params.get('LASLAB', 5000))
+        apthk = float(self.params.get('APTHK', 200))
+        spans = self.spans
+        centres, edges = spans['centres'], spans['edges']
+        xincr = float(self.params.get('XINCR', 1000))
+        yincr = float(self.params.get('YINCR', 1000))
+        levels = self.derived_levels()
+        right_end = left + lbridge
+        right = self.chainage_right()
+        datum = self.datum
+        s = self.scale1
+        
+        # Deck, abutments and approach slabs
+        xs = [left, right_end, left - alfo, left + abtlen + alfo, left + abtlen + dwth, left + alcw,
+              right_end + alfo, right_end - abtlen - alfo, right_end - alcw, left - laslab, right_end + laslab]
+        ys = [toprl, sofl, levels['slab_edge_bottom'], levels['slab_centre_bottom'], toprl - alcd,
+              sofl + dwth, toprl - apthk, levels['left_abutment_founding'], levels['left_abutment_footing_top'],
+              levels['right_abutment_founding'], levels['right_abutment_footing_top']]
+        boxes = [(min(xs), min(ys), max(xs), max(ys))]
+        
+        # Piers at the span table's centres, each widest at its cap, batter or footing
+        if len(centres):
+            batter = (spans['CAPB'] - spans['FUTRL'] - spans['FUTD']) * spans['BATTR']
+            reach = np.maximum.reduce([np.abs(spans['PIERTW'] / 2), np.abs(spans['PIERTW'] / 2 + batter),
+                                       np.abs(spans['FUTW'] / 2)])
+            ys = np.concatenate([spans['CAPT'], spans['CAPB'], spans['FUTRL'] + spans['FUTD'], spans['FUTRL']])
+            boxes.append((float((centres - reach).min()), float(ys.min()),
+                          float((centres + reach).max()), float(ys.max())))
+        
+        # Annotations, with only the first and last span and pier labels
+        texts = [
+            (left + lbridge / 2, toprl + 2500, "BRIDGE ELEVATION", 800),
+            (left + 1000, toprl + 1500, f"SCALE 1:{int(self.params.get('SCALE1', 100))}", 400),
+            (left + lbridge / 2, sofl - 3000, f"BRIDGE LENGTH = {lbridge/1000:.1f}M", 400),
+            (left - 2000, toprl, f"TOP RL {toprl/1000:.1f}", 300),
+            (left - 2000, sofl, f"SOFFIT RL {sofl/1000:.1f}", 300),
+            (left + 2000, (toprl + sofl) / 2, "LEFT\nABUTMENT", 350),
+            (left + lbridge - 2000, (toprl + sofl) / 2, "RIGHT\nABUTMENT", 350),
+        ]
+        if nspan > 1:
+            middles = (edges[:-1] + edges[1:]) / 2
+            texts += [(float(middles[0]), sofl - 1500, "SPAN 1", 300),
+                      (float(middles[-1]), sofl - 1500, f"SPAN {nspan}", 300),
+                      (float(centres[0]), (toprl + sofl) / 2, "PIER 1", 350),
+                      (float(centres[-1]), (toprl + sofl) / 2, f"PIER {nspan - 1}", 350)]
+        else:
+            texts.append((left + lbridge / 2, sofl - 1500, f"SPAN = {lbridge/1000:.1f}M", 400))
+        
+        # Axes: lines and titles, level and chainage ticks with their labels
+        texts += [(left - 18 * s, datum - 10 * s, "BED LEVEL", 2.5 * s),
+                  (left - 18 * s, datum - 30 * s, "CHAINAGE", 2.5 * s)]
+        boxes += [label_bbox({'x': x, 'y': y, 'text': text, 'size': size}) for x, y, text, size in texts]
+        boxes.append((min(left, right), min(datum - 40 * s, toprl), max(left, right), max(datum, toprl)))
+        n_levels, n_chainages = self._tick_counts()
+        if n_levels:
+            top = datum + (n_levels - 1) * yincr
+            boxes.append((left - 2.5 * s, datum, left + 2.5 * s, top))
+            boxes.append(self._batch_bbox([left - 9 * s] * 2, [datum - s, top - s],
+                                          [datum / 1000, top / 1000], 2 * s, fmt='%.3f'))
+        if n_chainages:
+            end = left + (n_chainages - 1) * xincr
+            boxes.append((left, datum - 40 * s, end, datum - 18 * s))
+            boxes.append(self._batch_bbox([left + 0.9 * s, end + 0.9 * s], [datum - 30 * s] * 2,
+                                          [left / 1000, end / 1000], 2 * s, 90, fmt='%.3f'))
+        
+        # Survey data is not parametric; its window is bounded without decimation
+        if self.ground_profile is not None:
+            chainages, ground = clean_survey(*self.ground_profile_window())
+            if len(chainages):
+                c0, c1 = float(chainages.min()), float(chainages.max())
+                g0, g1 = float(ground.min()), float(ground.max())
+                boxes.append((c0, min(g0, datum - 40 * s), c1, max(g1, datum)))
+                boxes.append(self._batch_bbox([c0 + 0.9 * s, c1 + 0.9 * s], [datum - 30 * s] * 2,
+                                              [c0 / 1000, c1 / 1000], 2 * s, 90, fmt='%.3f'))
+                boxes.append(self._batch_bbox([c0 + 0.9 * s, c1 + 0.9 * s], [datum - 10 * s] * 2,
+                                              [g0 / 1000, g1 / 1000], 2 * s, 90, fmt='%.3f'))
+        
+        # Dimensions: the first and last span, the overall length and the
+        # footings reaching furthest left, right, down and up bound the whole chain
+        chain_y = datum - 50 * s
+        chain = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+        dims = [make_dimension((x1, chain_y), (x2, chain_y), (x1, chain_y))
+                for x1, x2 in sorted({chain[0], chain[-1]} if chain else ())]
+        dims.append(make_dimension((left, chain_y), (right_end, chain_y), (left, chain_y - 10 * s)))
+        footing_left = centres - spans['FUTW'] / 2
+        extremes = sorted({int(np.argmin(footing_left)), int(np.argmax(centres + spans['FUTW'] / 2)),
+                           int(np.argmin(spans['FUTRL'])), int(np.argmax(spans['FUTRL'] + spans['FUTD']))}
+                          if len(centres) else ())
+        for i in extremes:
+            futrl, futd, futw = float(spans['FUTRL'][i]), float(spans['FUTD'][i]), float(spans['FUTW'][i])
+            footing_left = float(centres[i]) - futw / 2
+            dims.append(make_dimension((footing_left, futrl), (footing_left + futw, futrl),
+                                       (footing_left, futrl - 8 * s)))
+            dims.append(make_dimension((footing_left, futrl), (footing_left, futrl + futd),
+                                       (footing_left - 8 * s, futrl), angle=90))
+        coords, labels = dimension_geometry(dims, s)
+        if len(coords):
+            boxes.append(element_bbox({'type': 'segments', 'coords': coords}))
+        boxes += [self._batch_bbox(xs, ys, texts, DIM_TEXT * s, angle) for angle, xs, ys, texts in labels]
+        return boxes
+    
+    def _plan_boxes(self):
+        """Boxes of the plan outlines and title about the datum line"""
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        templates = self.plan_templates()
+        centres, left_origin, right_origin = self.plan_origins()
+        turn = rotation(self.skew)
+        
+        boxes = []
+        if len(centres):
+            # Each pier has its own outlines, placed in one array operation
+            piers = centres[:, None, :] + apply(turn, np.concatenate(
+                [templates['pier_top'], templates['pier_bottom'], templates['pier_footing']], axis=1))
+            boxes.append((piers[..., 0].min(), piers[..., 1].min(), piers[..., 0].max(), piers[..., 1].max()))
+        abutment = np.vstack([templates['abutment_wall'], templates['abutment_footing'],
+                              templates['abutment_cap_lines'].reshape(-1, 2)])
+        for origin, flip in ((left_origin, 1.0), (right_origin, np.array([-1.0, 1.0]))):
+            points = apply(turn, abutment * flip) + origin
+            boxes.append((points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()))
+        boxes.append(label_bbox({'x': self.left + lbridge / 2, 'y': self.datum + self.abutment_width() / 2 + 2500,
+                                 'text': "PLAN", 'size': 800}))
+        return boxes
+    
+    def _elevation_counts(self):
+        """Elements and texts per layer of the elevation, before merging"""
+        nspan = int(self.params.get('NSPAN', 1))
+        piers = max(nspan - 1, 0)
+        spans = max(nspan, 0)
+        n_levels, n_chainages = self._tick_counts()
+        elements = {
+            'deck': 1, 'soffit': 1, 'slab_profile': 2, 'end_connection': 2,
+            'abutment_cap': 6, 'abutment_wall': 6, 'footing': 8, 'dirt_wall': 3,
+            'pier_cap': 4 * piers, 'pier_shaft': 2 * piers, 'pier_footing': 4 * piers,
+            'pier_connection': 2 * piers, 'approach_slab': 8,
+            'axis': 4, 'axis_ticks': n_levels + 2 * n_chainages,
+            # Span chain dimensions lie on their own dimension line: no extension lines
+            DIM_LAYER: 3 * spans + 5 + 10 * piers,
+        }
+        texts = {
+            # Title, scale, length, levels and abutments, then span and pier labels
+            'text': 7 + (nspan if nspan > 1 else 1) + piers,
+            'axis_labels': 2 + n_levels + n_chainages,
+            DIM_LAYER: spans + 1 + 2 * piers,
+        }
+        return elements, texts
+    
+    def _plan_counts(self):
+        """Elements and texts per layer of the plan"""
+        piers = max(int(self.params.get('NSPAN', 1)) - 1, 0)
+        templates = self.plan_templates()
+        pier_sides = templates['pier_top'].shape[-2] + templates['pier_bottom'].shape[-2]
+        elements = {'plan_pier': pier_sides * piers, 'plan_footing': 4 * piers + 8, 'plan_abutment': 12}
+        return elements, {'text': 1}
+    
+    def _section_layout(self, name):
+        """Box and per-layer counts of a section view, which is a fixed handful
+        of elements and is simply streamed by a scratch engine"""
+        elements, texts, boxes = {}, {}, []
+        for kind, item in BridgeDrawingEngine(self.params).iter_items([name]):
+            if kind == 'element':
+                count = len(item['coords']) if item['type'] == 'segments' else 1
+                elements[item['layer']] = elements.get(item['layer'], 0) + count
+                boxes.append(element_bbox(item))
+            elif kind == 'text':
+                count = len(item['x']) if item.get('type') == 'text_batch' else 1
+                texts[item['layer']] = texts.get(item['layer'], 0) + count
+                boxes.append(label_bbox(item))
+        return union_bbox(boxes), elements, texts
+    
+    def analytic_bounds(self, views=None):
+        """Bounds of generate_drawing_data(views=views) from the parameters.
+        
+        Matches the generated bounds except where label placement moves a
+        colliding label outwards; a ground profile is bounded by its survey
+        window before decimation, so slightly generously.
+        """
+        boxes = []
+        for name in views or ('elevation', 'plan'):
+            if name == 'elevation':
+                boxes.append(apply_bbox(self.elevation_matrix, union_bbox(self._elevation_boxes())))
+            elif name == 'plan':
+                box = union_bbox(self._plan_boxes())
+                matrix = self.plan_matrix(views)
+                boxes.append(box if matrix is None else apply_bbox(matrix, box))
+            else:
+                boxes.append(self._section_layout(name)[0])
+        box = union_bbox(boxes)
+        if box is None:
+            return {'min_x': 0, 'max_x': 0, 'min_y': 0, 'max_y': 0}
+        min_x, min_y, max_x, max_y = box
+        return {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y': max_y}
+    
+    def layer_counts(self, views=None):
+        """Elements and texts per layer before merging, from the parameters.
+        
+        Segments and text batches count every row. Layers of a ground profile
+        depend on the survey and decimation and are not counted.
+        """
+        elements, texts = {}, {}
+        for name in views or ('elevation', 'plan'):
+            if name == 'elevation':
+                view_elements, view_texts = self._elevation_counts()
+            elif name == 'plan':
+                view_elements, view_texts = self._plan_counts()
+            else:
+                _, view_elements, view_texts = self._section_layout(name)
+            for totals, counts in ((elements, view_elements), (texts, view_texts)):
+                for layer, count in counts.items():
+                    if count:
+                        totals[layer] = totals.get(layer, 0) + count
+        return {'elements': elements, 'texts': texts}
+    
+    def drawing_stats(self, views=None):
+        """Bounds, paper size at SCALE1, layer counts and derived levels without
+        generating the drawing, for layout, sheet selection and pre-flight checks"""
+        bounds = self.analytic_bounds(views)
+        counts = self.layer_counts(views)
+        return {
+            'bounds': bounds,
+            'paper_size': ((bounds['max_x'] - bounds['min_x']) / self.scale1,
+                           (bounds['max_y'] - bounds['min_y']) / self.scale1),
+            'elements': counts['elements'],
+            'texts': counts['texts'],
+            'total_elements': sum(counts['elements'].values()),
+            'total_texts': sum(counts['texts'].values()),
+            'levels': self.derived_levels(),
+        }
+    
+    def build_index(self):
+        """Index elements, hatches and texts spatially and recompute overall bounds"""
+        boxes = {}
+        for i, elem in enumerate(self.elements):
+            boxes[('element', i)] = element_bbox(elem)
+        for i, hatch in enumerate(self.hatches):
+            boxes[('hatch', i)] = element_bbox(hatch)
+        for i, text in enumerate(self.texts):
+            boxes[('text', i)] = label_bbox(text)
+        
+        self.index = GridIndex.from_boxes(boxes)
+        if self.index.bounds is not None:
+            min_x, min_y, max_x, max_y = self.index.bounds
+            self.bounds = {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y': max_y}
+        return self.index
+    
+    def query_bbox(self, min_x, min_y, max_x, max_y):
+        """Return only the elements, hatches and texts intersecting the given box"""
+        if self.index is None:
+            self.build_index()
+        
+        keys = sorted(self.index.query(min_x, min_y, max_x, max_y))
+        box = (min_x, min_y, max_x, max_y)
+        return {
+            'elements': [clip_batch(self.elements[i], *box) for kind, i in keys if kind == 'element'],
+            'texts': [clip_batch(self.texts[i], *box) for kind, i in keys if kind == 'text'],
+            'hatches': [clip_batch(self.hatches[i], *box) for kind, i in keys if kind == 'hatch'],
+            'bounds': self.bounds,
+            'viewport': {'min_x': min_x, 'max_x': max_x, 'min_y': min_y, 'max_y': max_y}
+        }
+    
     def add_line(self, x1, y1, x2, y2, layer='default', width=1):
         """Add a line element"""
+        if not self.transform.is_identity:
+            (x1, y1), (x2, y2) = apply(self.transform.current, [(x1, y1), (x2, y2)]).tolist()
         self.elements.append({
             'type': 'line',
             'x1': x1, 'y1': y1,
@@ -311,15 +1145,106 @@ class BridgeDrawingEngine:
             'width': width
         })
     
-    def add_text(self, x, y, text, size=400, layer='text'):
+    def add_text(self, x, y, text, size=400, layer='text', rotation=0):
         """Add a text element"""
+        if not self.transform.is_identity:
+            matrix = self.transform.current
+            x, y = apply(matrix, (x, y)).tolist()
+            size *= matrix_scale(matrix)
+            rotation += matrix_angle(matrix)
         self.texts.append({
             'x': x, 'y': y,
             'text': str(text),
             'size': size,
-            'layer': layer
+            'layer': layer,
+            'rotation': rotation
         })
     
+    def add_dimension(self, p1, p2, base, angle=0, text=None):
+        """Collect a linear dimension (angle in degrees, text None for the measurement)"""
+        if not self.transform.is_identity:
+            matrix = self.transform.current
+            if text is None and not np.isclose(matrix_scale(matrix), 1):
+                # Enlarged views (sections at SCALE1/SCALE2) still show true lengths
+                a = math.radians(angle)
+                text = f"{abs((p2[0] - p1[0]) * math.cos(a) + (p2[1] - p1[1]) * math.sin(a)):.0f}"
+            p1, p2, base = apply(matrix, [p1, p2, base]).tolist()
+            angle += matrix_angle(matrix)
+        self.dimensions.append(make_dimension(p1, p2, base, angle, text))
+    
+    def add_hatch(self, loops, pattern):
+        """Add closed boundary loops (k, m, 2) filled with a pattern from HATCH_PATTERNS,
+        sized at SCALE1 like texts"""
+        loops = np.asarray(loops, dtype=float)
+        scale = self.scale1
+        if not self.transform.is_identity:
+            loops = apply(self.transform.current, loops)
+            scale *= matrix_scale(self.transform.current)
+        if len(loops):
+            self.hatches.append(make_hatch(loops, pattern, scale))
+    
+    def add_instances(self, template, origins, angle=0, layer='default', width=1, closed=True):
+        """Place an outline given around (0, 0) at every origin, rotated by angle
+        degrees, as one segments element. A stack of outlines (n, m, 2) places
+        its own outline at each origin."""
+        template = np.asarray(template, dtype=float)
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        outlines = origins[:, None, :] + apply(rotation(angle), template)
+        self.add_segments(outline_segments(outlines, closed), layer, width)
+    
+    def add_polyline(self, points, layer='default', width=1, closed=False):
+        """Add a polyline element from an (n, 2) array of vertices"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not self.transform.is_identity:
+            points = apply(self.transform.current, points)
+        if len(points) >= 2:
+            self.elements.append({
+                'type': 'polyline',
+                'points': points,
+                'closed': closed,
+                'layer': layer,
+                'width': width
+            })
+    
+    def add_segments(self, coords, layer='default', width=1):
+        """Add a batch of lines as one columnar element (n x 4: x1, y1, x2, y2)"""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 4)
+        if not self.transform.is_identity:
+            coords = apply_segments(self.transform.current, coords)
+        if len(coords):
+            self.elements.append({
+                'type': 'segments',
+                'coords': coords,
+                'layer': layer,
+                'width': width
+            })
+    
+    def add_text_batch(self, xs, ys, texts, size=400, layer='text', rotation=0, fmt=None):
+        """Add many texts of one size and rotation as one columnar element.
+        
+        With fmt (e.g. '%.3f') texts are numbers formatted only when a writer
+        draws them, so labels that are culled are never turned into strings.
+        """
+        if len(texts):
+            xs = np.asarray(xs, dtype=float)
+            ys = np.asarray(ys, dtype=float)
+            if not self.transform.is_identity:
+                matrix = self.transform.current
+                points = apply(matrix, np.column_stack([xs, ys]))
+                xs, ys = points[:, 0], points[:, 1]
+                size *= matrix_scale(matrix)
+                rotation += matrix_angle(matrix)
+            self.texts.append({
+                'type': 'text_batch',
+                'x': xs,
+                'y': ys,
+                'text': np.asarray(texts, dtype=float if fmt else str),
+                'format': fmt,
+                'size': size,
+                'layer': layer,
+                'rotation': rotation
+            })
+    
     def draw_abutment(self, side, x_start, width, top_level, footing_level):
         """Draw abutment structure"""
         # Get soffit level from parameters
@@ -421,61 +1346,224 @@ class BridgeRenderer:
         self.data = drawing_data
         self.elements = drawing_data['elements']
         self.texts = drawing_data['texts']
+        self.hatches = drawing_data.get('hatches', [])
         self.bounds = drawing_data['bounds']
     
-    def render_to_svg(self, width=800, height=400):
-        """Render drawing to SVG format"""
-        # Calculate scale
-        drawing_width = self.bounds['max_x'] - self.bounds['min_x']
-        drawing_height = self.bounds['max_y'] - self.bounds['min_y']
-        
-        margin = 40
-        available_width = width - 2 * margin
-        available_height = height - 2 * margin
+    @staticmethod
+    def fit_scale(bounds, width, height, margin=40):
+        """Display units per mm when fitting the bounds into a canvas"""
+        drawing_width = bounds['max_x'] - bounds['min_x']
+        drawing_height = bounds['max_y'] - bounds['min_y']
         
-        scale_x = available_width / drawing_width if drawing_width > 0 else 1
-        scale_y = available_height / drawing_height if drawing_height > 0 else 1
-        scale = min(scale_x, scale_y) / 1000  # Convert mm to display units
+        scale_x = (width - 2 * margin) / drawing_width if drawing_width > 0 else 1
+        scale_y = (height - 2 * margin) / drawing_height if drawing_height > 0 else 1
+        return min(scale_x, scale_y)
+    
+    @classmethod
+    def svg_frame(cls, bounds, width, height, viewport=None, margin=40):
+        """Scale and (min_x, min_y, offset_x, offset_y) mapping drawing mm onto an SVG canvas.
         
+        With a viewport (min_x, min_y, max_x, max_y) the box is mapped exactly
+        onto the canvas; otherwise the bounds are fitted and centred with a margin.
+        """
+        if viewport is not None:
+            min_x, min_y, max_x, max_y = viewport
+            scale = min(width / (max_x - min_x), height / (max_y - min_y))
+            return scale, (min_x, min_y, 0, 0)
+        scale = cls.fit_scale(bounds, width, height, margin)
         # Center the drawing
-        scaled_width = drawing_width * scale
-        scaled_height = drawing_height * scale
-        offset_x = margin + (available_width - scaled_width) / 2
-        offset_y = margin + (available_height - scaled_height) / 2
+        scaled_width = (bounds['max_x'] - bounds['min_x']) * scale
+        scaled_height = (bounds['max_y'] - bounds['min_y']) * scale
+        offset_x = margin + (width - 2 * margin - scaled_width) / 2
+        offset_y = margin + (height - 2 * margin - scaled_height) / 2
+        return scale, (bounds['min_x'], bounds['min_y'], offset_x, offset_y)
+    
+    @staticmethod
+    def svg_element(elem, scale, frame, height):
+        """SVG markup of one element"""
+        min_x, min_y, offset_x, offset_y = frame
         
         def transform_x(x):
-            return offset_x + (x - self.bounds['min_x']) * scale
+            return offset_x + (x - min_x) * scale
         
         def transform_y(y):
-            return height - (offset_y + (y - self.bounds['min_y']) * scale)
-        
-        svg_elements = []
-        
-        # Render lines
-        for elem in self.elements:
-            if elem['type'] == 'line':
-                x1 = transform_x(elem['x1'])
-                y1 = transform_y(elem['y1'])
-                x2 = transform_x(elem['x2'])
-                y2 = transform_y(elem['y2'])
-                width = elem['width']
-                
-                svg_elements.append(f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="black" stroke-width="{width}"/>')
+            return height - (offset_y + (y - min_y) * scale)
         
-        # Render text
-        for text in self.texts:
-            x = transform_x(text['x'])
-            y = transform_y(text['y'])
-            size = max(8, text['size'] * scale / 50)  # Scale text size
-            
-            svg_elements.append(f'<text x="{x}" y="{y}" font-family="Arial" font-size="{size}" text-anchor="middle">{text["text"]}</text>')
+        stroke_width = elem['width']
+        if elem['type'] == 'line':
+            x1 = transform_x(elem['x1'])
+            y1 = transform_y(elem['y1'])
+            x2 = transform_x(elem['x2'])
+            y2 = transform_y(elem['y2'])
+            return f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="black" stroke-width="{stroke_width}"/>'
+        elif elem['type'] == 'polyline':
+            points = " ".join(f"{transform_x(x)},{transform_y(y)}" for x, y in elem['points'])
+            tag = 'polygon' if elem['closed'] else 'polyline'
+            return f'<{tag} points="{points}" fill="none" stroke="black" stroke-width="{stroke_width}"/>'
+        elif elem['type'] == 'segments':
+            coords = elem['coords']
+            xs = offset_x + (coords[:, 0::2] - min_x) * scale
+            ys = height - (offset_y + (coords[:, 1::2] - min_y) * scale)
+            path = " ".join(f"M{x1:.2f} {y1:.2f}L{x2:.2f} {y2:.2f}"
+                            for (x1, x2), (y1, y2) in zip(xs.tolist(), ys.tolist()))
+            return f'<path d="{path}" fill="none" stroke="black" stroke-width="{stroke_width}"/>'
+        return ''
+    
+    @staticmethod
+    def svg_hatch(hatch, scale, frame, height, patterns):
+        """SVG path of a hatch's loops filled with its pattern. The <pattern> is
+        defined on first use; patterns maps (pattern, cell) to the ids defined."""
+        min_x, min_y, offset_x, offset_y = frame
+        cell = HATCH_PATTERNS[hatch['pattern']]['cell'] * hatch['scale'] * scale
+        if cell < HATCH_MIN_CELL or not len(hatch['paths']):
+            return ''
+        
+        markup = ''
+        key = (hatch['pattern'], round(cell, 3))
+        pattern_id = patterns.get(key)
+        if pattern_id is None:
+            pattern_id = patterns[key] = f"hatch-{hatch['pattern']}-{len(patterns)}"
+            segments = pattern_segments(hatch['pattern'], cell)
+            # Cells are drawn y down, like the rest of the SVG
+            cell_path = "".join(f"M{x1:.2f} {cell - y1:.2f}L{x2:.2f} {cell - y2:.2f}"
+                                for x1, y1, x2, y2 in segments.tolist())
+            markup = (f'<defs><pattern id="{pattern_id}" patternUnits="userSpaceOnUse" '
+                      f'width="{cell:.2f}" height="{cell:.2f}"><path d="{cell_path}" fill="none" '
+                      f'stroke="black" stroke-width="{HATCH_LINE_WIDTH}"/></pattern></defs>')
         
-        svg_content = f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
+        paths = hatch['paths']
+        xs = offset_x + (paths[:, :, 0] - min_x) * scale
+        ys = height - (offset_y + (paths[:, :, 1] - min_y) * scale)
+        path = "".join("M" + "L".join(f"{x:.2f} {y:.2f}" for x, y in zip(loop_x, loop_y)) + "Z"
+                       for loop_x, loop_y in zip(xs.tolist(), ys.tolist()))
+        return markup + f'<path d="{path}" fill="url(#{pattern_id})" stroke="none"/>'
+    
+    @staticmethod
+    def svg_texts(texts, scale, frame, height):
+        """SVG markup of texts and text batches, one string per line of text"""
+        min_x, min_y, offset_x, offset_y = frame
+        for text in iter_texts(texts):
+            size = text['size'] * scale  # True scale, as placed
+            rotation = text.get('rotation', 0)
+            x = offset_x + (text['x'] - min_x) * scale
+            y = height - (offset_y + (text['y'] - min_y) * scale)
+            
+            transform = f' transform="rotate({-rotation} {x} {y})"' if rotation else ''
+            for line, offset in split_lines(text['text']):
+                ly = y - offset * size
+                yield f'<text x="{x}" y="{ly}" font-family="Helvetica, Arial" font-size="{size}" text-anchor="middle"{transform}>{escape(line)}</text>'
+    
+    @staticmethod
+    def svg_header(width, height):
+        return f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
             <rect width="100%" height="100%" fill="white"/>
-            {"".join(svg_elements)}
-        </svg>'''
+            '''
+    
+    def render_to_svg(self, width=800, height=400, viewport=None, lod_tolerance_px=None, min_text_px=4):
+        """Render drawing to SVG format.
+        
+        With a viewport (min_x, min_y, max_x, max_y) the box is mapped exactly
+        onto the canvas, as used for preview tiles; otherwise the whole drawing
+        is fitted with a margin. With lod_tolerance_px the geometry is
+        simplified for the output scale within that error bound and texts
+        smaller than min_text_px pixels are culled.
+        """
+        scale, frame = self.svg_frame(self.bounds, width, height, viewport)
+        
+        elements, texts = self.elements, self.texts
+        if lod_tolerance_px is not None:
+            elements, texts = simplify_for_scale(elements, texts, scale, lod_tolerance_px, min_text_px)
+        
+        # Hatches first, under the outlines they fill
+        patterns = {}
+        svg_elements = [self.svg_hatch(hatch, scale, frame, height, patterns) for hatch in self.hatches]
+        svg_elements.extend(self.svg_element(elem, scale, frame, height) for elem in elements)
+        svg_elements.extend(self.svg_texts(texts, scale, frame, height))
+        
+        return self.svg_header(width, height) + "".join(svg_elements) + "\n        </svg>"
+    
+    def render_to_raster(self, width=400, height=200, dpi=100, fmt='png', viewport=None,
+                         lod_tolerance_px=0.5, min_text_px=4):
+        """Render drawing to a PNG or WebP image of width x height pixels.
+        
+        Geometry goes through one matplotlib LineCollection per layer and the
+        texts in a single pass, after the same level-of-detail reduction as
+        preview tiles, so thumbnails of long viaducts stay cheap.
+        """
+        if fmt not in RASTER_FORMATS:
+            raise ValueError(f"Unsupported raster format: {fmt}")
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        
+        scale, (min_x, min_y, offset_x, offset_y) = self.svg_frame(self.bounds, width, height, viewport)
+        elements, texts = self.elements, self.texts
+        if lod_tolerance_px is not None:
+            elements, texts = simplify_for_scale(elements, texts, scale, lod_tolerance_px, min_text_px)
+        
+        # Pixel coordinates with y up, so no flip is needed
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor='white')
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_xlim(0, width)
+        ax.set_ylim(0, height)
+        ax.set_axis_off()
+        
+        layers = {}
+        for elem in elements:
+            layers.setdefault(elem['layer'], []).append(elem)
+        points_per_px = 72.0 / dpi
+        for layer in sorted(layers, key=str):
+            segments = [element_segments(elem) for elem in layers[layer]]
+            widths = np.repeat([elem['width'] * RASTER_LINE_WIDTH * points_per_px for elem in layers[layer]],
+                               [len(s) for s in segments])
+            coords = np.concatenate(segments)
+            coords[:, 0::2] = offset_x + (coords[:, 0::2] - min_x) * scale
+            coords[:, 1::2] = offset_y + (coords[:, 1::2] - min_y) * scale
+            ax.add_collection(LineCollection(coords.reshape(-1, 2, 2), colors='black',
+                                             linewidths=widths, antialiaseds=True))
+        
+        for text in iter_texts(texts):
+            size = text['size'] * scale
+            x = offset_x + (text['x'] - min_x) * scale
+            y = offset_y + (text['y'] - min_y) * scale
+            rotation = text.get('rotation', 0)
+            angle = math.radians(rotation)
+            for line, offset in split_lines(text['text']):
+                ax.text(x - offset * size * math.sin(angle), y + offset * size * math.cos(angle), line,
+                        fontsize=size * points_per_px, family='sans-serif', rotation=rotation,
+                        rotation_mode='anchor', ha='center', va='baseline')
+        
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=dpi, facecolor='white')
+        return buffer.getvalue()
+    
+    @classmethod
+    def stream_svg(cls, items, bounds, out, width=800, height=400):
+        """Write SVG for an iter_items() stream to the file-like out in one pass.
         
-        return svg_content
+        Items are written in stream order as they arrive, so texts follow the
+        geometry of their own component; nothing is retained.
+        """
+        scale, frame = cls.svg_frame(bounds, width, height)
+        out.write(cls.svg_header(width, height))
+        patterns = {}
+        count = 0
+        for kind, item in items:
+            if kind == 'hatch':
+                out.write(cls.svg_hatch(item, scale, frame, height, patterns))
+            elif kind == 'element' and item['type'] == 'segments':
+                # Large batches go out as several paths to keep each string small
+                for start in range(0, len(item['coords']), STREAM_CHUNK):
+                    chunk = dict(item, coords=item['coords'][start:start + STREAM_CHUNK])
+                    out.write(cls.svg_element(chunk, scale, frame, height))
+            elif kind == 'element':
+                out.write(cls.svg_element(item, scale, frame, height))
+            elif kind == 'text':
+                out.writelines(cls.svg_texts([item], scale, frame, height))
+            count += 1
+        out.write("\n        </svg>")
+        return count
     
     def render_to_pdf_data(self):
         """Prepare data for PDF rendering with proper coordinates"""
@@ -0,0 +1,119 @@
+"""
+3D massing model of the bridge for clash checks and visualisation.
+
+Deck, pier caps, battered shafts, footings and abutments are built as
+prismatic solids from the same parameters and plan outlines as the 2D
+drawing (CCBR, SLBTHC, PIERTW, BATTR, FUTW/FUTL/FUTD, SKEW, span tables).
+Each component is one batch of solids in NumPy vertex and index buffers,
+so every pier is an instance of the same topology.
+"""
+
+import logging
+
+import numpy as np
+
+from drawing_engine import BridgeDrawingEngine
+from utils.hatching import rectangle_loops
+from utils.mesh import plan_to_model, loft_solids, write_glb, write_stl
+from utils.transforms import rotation, apply
+
+
+class BridgeMeshBuilder:
+    """Vertex and index buffers of the bridge's solids, in model mm"""
+
+    def __init__(self, parameters):
+        self.engine = BridgeDrawingEngine(parameters)
+        self.params = self.engine.params
+
+    def deck(self):
+        """Deck slab with kerbs and its SLBTHC soffit taper, along the whole
+        bridge between skewed ends"""
+        engine = self.engine
+        left = engine.left
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        toprl = float(self.params.get('TOPRL', 110000))
+        slbthc = float(self.params.get('SLBTHC', 1000))
+
+        # Section widths are along the skew; square to the deck they are c times that
+        profile = engine.deck_section_outline() * [engine.c, 1]
+        profile = np.vstack([profile, [[0.0, toprl - slbthc]]])
+        across, level = profile[:, 0], profile[:, 1]
+        ends = [np.column_stack([x - across * engine.tn, level, -across]) for x in (left, left + lbridge)]
+        return loft_solids(ends[0][None], ends[1][None], profile)
+
+    def piers(self):
+        """Footings, battered shafts and caps of every pier as instanced batches"""
+        engine = self.engine
+        spans = engine.spans
+        if not len(spans['centres']):
+            return {}
+        # Plan centres on the bridge axis, z = 0
+        centres = np.column_stack([spans['centres'], np.zeros_like(spans['centres'])])
+        capw = float(self.params.get('CAPW', 2000))
+        templates = engine.plan_templates()
+        pierstsq = spans['PIERST'] / engine.c + np.abs(spans['PIERTW'] * engine.tn)
+        half_w, half_l = spans['PIERTW'] / 2, (pierstsq + capw) / 2
+        cap = rectangle_loops(-half_w, -half_l, half_w, half_l)
+
+        def place(outlines):
+            return centres[:, None, :] + apply(rotation(engine.skew), outlines)
+
+        footing_top = spans['FUTRL'] + spans['FUTD']
+        return {
+            'pier_footing': loft_solids(plan_to_model(place(templates['pier_footing']), spans['FUTRL']),
+                                        plan_to_model(place(templates['pier_footing']), footing_top),
+                                        templates['pier_footing'][0]),
+            'pier_shaft': loft_solids(plan_to_model(place(templates['pier_bottom']), footing_top),
+                                      plan_to_model(place(templates['pier_top']), spans['CAPB']),
+                                      templates['pier_top'][0]),
+            'pier_cap': loft_solids(plan_to_model(place(cap), spans['CAPB']),
+                                    plan_to_model(place(cap), spans['CAPT']), cap[0]),
+        }
+
+    def abutments(self):
+        """Footing, wall and cap of both abutments, the right one mirrored"""
+        engine = self.engine
+        lbridge = float(self.params.get('LBRIDGE', 30000))
+        toprl = float(self.params.get('TOPRL', 110000))
+        alcw = float(self.params.get('ALCW', 1200))
+        alcd = float(self.params.get('ALCD', 800))
+        levels = engine.derived_levels()
+        templates = engine.plan_templates()
+
+        flips = np.array([[[1.0, 1.0]], [[-1.0, 1.0]]])
+        origins = np.array([[[engine.left, 0.0]], [[engine.left + lbridge, 0.0]]])
+        founding = [levels['left_abutment_founding'], levels['right_abutment_founding']]
+        footing_top = [levels['left_abutment_footing_top'], levels['right_abutment_footing_top']]
+        half = engine.abutment_width() / 2
+        cap = rectangle_loops(0, -half, alcw, half)[0]
+
+        def place(outline):
+            return origins + apply(rotation(engine.skew), outline * flips)
+
+        return {
+            'abutment_footing': loft_solids(plan_to_model(place(templates['abutment_footing']), founding),
+                                            plan_to_model(place(templates['abutment_footing']), footing_top),
+                                            templates['abutment_footing']),
+            'abutment_wall': loft_solids(plan_to_model(place(templates['abutment_wall']), footing_top),
+                                         plan_to_model(place(templates['abutment_wall']), toprl - alcd),
+                                         templates['abutment_wall']),
+            'abutment_cap': loft_solids(plan_to_model(place(cap), toprl - alcd),
+                                        plan_to_model(place(cap), toprl), cap),
+        }
+
+    def build(self):
+        """(name, positions, triangles) of every component"""
+        components = {'deck': self.deck(), **self.piers(), **self.abutments()}
+        parts = [(name, positions, triangles) for name, (positions, triangles) in components.items()]
+        logging.info(f"Built {sum(len(t) for _, _, t in parts)} triangles in {len(parts)} mesh parts")
+        return parts
+
+    def origin(self):
+        """Model point the glTF buffers are stored relative to: LEFT on the datum"""
+        return (self.engine.left, self.engine.datum, 0.0)
+
+    def to_glb(self):
+        return write_glb(self.build(), self.origin())
+
+    def to_stl(self):
+        return write_stl(self.build())
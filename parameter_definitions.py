@@ -74,7 +74,7 @@ PARAMETER_DEFINITIONS = {
         'type': 'int',
         'default': 1,
         'min': 1,
-        'max': 10,
+        'max': 1000,
         'unit': '',
         'description': 'Total number of bridge spans'
     },
@@ -83,7 +83,7 @@ PARAMETER_DEFINITIONS = {
         'type': 'float',
         'default': 30000,
         'min': 5000,
-        'max': 200000,
+        'max': 50000000,
         'unit': 'mm',
         'description': 'Total length of the bridge'
     },
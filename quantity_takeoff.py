@@ -0,0 +1,162 @@
+"""
+Concrete volumes and formwork areas of the bridge's components.
+
+Quantities are NumPy expressions of the parameters, over the same solids
+as the 3D massing model: the deck slab with its SLBTHC/SLBTHE/SLBTHT
+taper, pier caps, battered shafts and footings, and abutment footings,
+walls and caps. Every parameter may be a scalar or a column of a design
+matrix, so one bridge and 100k design variants are the same call.
+Volumes are in m3 and areas in m2.
+"""
+
+import logging
+import math
+
+import numpy as np
+
+from utils.geometry import abutment_width, ABUTMENT_FOOTING_PROJECTION
+from utils.spans import PIER_PARAMS, with_span_table, span_layout
+
+# Parameters the quantities depend on, with the engine's defaults
+TAKEOFF_DEFAULTS = {
+    'LBRIDGE': 30000, 'NSPAN': 1, 'SKEW': 0, 'TOPRL': 110000, 'FUTRL': 100000,
+    'CCBR': 7500, 'KERBW': 300, 'KERBD': 150, 'SLBTHC': 1000, 'SLBTHE': 800, 'SLBTHT': 600,
+    'CAPW': 2000, 'ABTLEN': 10000, 'ALCW': 1200, 'ALCD': 800, 'ALFL': 105000, 'ARFL': 105000,
+    'ALFD': 1000, 'ALFO': 500, 'DWTH': 300,
+    **PIER_PARAMS,
+}
+TAKEOFF_COMPONENTS = ('deck', 'pier_cap', 'pier_shaft', 'pier_footing',
+                      'abutment_footing', 'abutment_wall', 'abutment_cap')
+
+# Faces whose outward normal points up more steeply than this are screeded, not formed
+FORMED_NORMAL_UP = 0.5
+M3, M2 = 1e-9, 1e-6
+
+
+def design_columns(variants):
+    """Columns (name -> float array) of one parameter set, a dict of columns,
+    a list of parameter sets or a structured array, with defaults filled in"""
+    if isinstance(variants, np.ndarray) and variants.dtype.names:
+        variants = {name: variants[name] for name in variants.dtype.names}
+    elif isinstance(variants, (list, tuple)):
+        variants = {name: [row.get(name, default) for row in variants]
+                    for name, default in TAKEOFF_DEFAULTS.items()}
+    return {name: np.asarray(variants.get(name, default), dtype=float)
+            for name, default in TAKEOFF_DEFAULTS.items()}
+
+
+def polygon_quantities(points):
+    """Areas and formed perimeters of polygons (..., k, 2)"""
+    x, y = points[..., 0], points[..., 1]
+    dx, dy = np.roll(x, -1, axis=-1) - x, np.roll(y, -1, axis=-1) - y
+    signed = (x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y).sum(axis=-1) / 2
+    lengths = np.hypot(dx, dy)
+    # Outward normal of a counter-clockwise edge is (dy, -dx)
+    up = -dx * np.sign(signed)[..., None] / np.where(lengths > 0, lengths, 1)
+    formed = np.where(up < FORMED_NORMAL_UP, lengths, 0).sum(axis=-1)
+    return np.abs(signed), formed
+
+
+def deck_section(p):
+    """Deck slab with kerbs square to the deck, top of carriageway at 0 (..., 13, 2)"""
+    half, kw, kerbd = p['CCBR'] / 2, p['KERBW'], p['KERBD']
+    slbthc, slbthe, slbtht = p['SLBTHC'], p['SLBTHE'], p['SLBTHT']
+    zero = np.zeros(np.broadcast(half, kw, kerbd, slbthe, slbtht, slbthc).shape)
+    right = [(half, -slbthe), (half + kw, -slbtht), (half + kw, kerbd),
+             (half + 50, kerbd), (half + 25, kerbd - 25), (half, zero)]
+    left = [(-x, y) for x, y in right[::-1]]
+    points = right + left + [(zero, -slbthc)]
+    return np.stack([np.stack(np.broadcast_arrays(x + zero, y + zero), axis=-1) for x, y in points], axis=-2)
+
+
+def stadium_quantities(width, length):
+    """Area and perimeter of a pier section: straight sides of length closed by
+    semicircles of diameter width"""
+    return width * length + math.pi * width ** 2 / 4, 2 * length + math.pi * width
+
+
+def pier_quantities(p, c, tn):
+    """Concrete and formwork of one pier cap, shaft and footing; pier
+    parameters may be per variant or per pier"""
+    piertw, capb = p['PIERTW'], p['CAPB']
+    pierstsq = p['PIERST'] / c + np.abs(piertw * tn)
+    height = capb - p['FUTRL'] - p['FUTD']
+    ofset = height * p['BATTR']
+    bottom = piertw + 2 * ofset
+    top_area, _ = stadium_quantities(piertw, pierstsq)
+
+    # Sections grow quadratically down a battered shaft, so the prismoidal rule is exact
+    bottom_area, _ = stadium_quantities(bottom, pierstsq)
+    mid_area, _ = stadium_quantities((piertw + bottom) / 2, pierstsq)
+    slant = np.hypot(height, ofset)
+
+    cap_length, cap_depth = pierstsq + p['CAPW'], p['CAPT'] - capb
+    return {
+        'pier_cap': (piertw * cap_length * cap_depth,
+                     2 * (piertw + cap_length) * cap_depth + piertw * cap_length - top_area),
+        'pier_shaft': (height / 6 * (top_area + 4 * mid_area + bottom_area),
+                       slant * (2 * pierstsq + math.pi * (piertw + bottom) / 2)),
+        'pier_footing': (p['FUTW'] * p['FUTL'] * p['FUTD'],
+                         2 * (p['FUTW'] + p['FUTL']) * p['FUTD']),
+    }
+
+
+def abutment_quantities(p, c):
+    """Concrete and formwork of both abutments' footings, walls and caps; ABTLEN
+    is their length along the bridge and the deck width their length across"""
+    abtlen, alcd, alfd = p['ABTLEN'], p['ALCD'], p['ALFD']
+    width = abutment_width(p['CCBR'], p['KERBW'], c)
+    footing_l, footing_w = abtlen + 2 * p['ALFO'], width + 2 * ABUTMENT_FOOTING_PROJECTION
+    wall_l = abtlen + p['DWTH']
+    # Wall heights from each footing top to the underside of the cap
+    heights = 2 * (p['TOPRL'] - alcd - alfd) - p['ALFL'] - p['ARFL']
+    return {
+        'abutment_footing': (2 * footing_l * footing_w * alfd, 4 * (footing_l + footing_w) * alfd),
+        'abutment_wall': (wall_l * width * heights, 2 * (wall_l + width) * heights),
+        'abutment_cap': (2 * p['ALCW'] * width * alcd, 4 * (p['ALCW'] + width) * alcd),
+    }
+
+
+def quantity_takeoff(variants):
+    """Concrete (m3) and formwork (m2) of every component and in total, as
+    '<component>_concrete' / '<component>_formwork' columns and
+    'total_concrete' / 'total_formwork'. A parameter set with scalar values
+    gives floats; design matrix columns give one value per variant.
+
+    A single parameter set may carry a SPAN_TABLE, whose piers are then
+    taken off one by one with their own pier types and footing levels.
+    """
+    table = isinstance(variants, dict) and variants.get('SPAN_TABLE')
+    if table:
+        variants = with_span_table(variants)
+    p = design_columns(variants)
+    skew = np.radians(p['SKEW'])
+    c, tn = np.cos(skew), np.tan(skew)
+
+    # Deck: the section square to the deck along LBRIDGE, with skewed end faces
+    area, formed = polygon_quantities(deck_section(p))
+    quantities = {'deck': (area * p['LBRIDGE'], formed * p['LBRIDGE'] + 2 * area / c)}
+
+    if table:
+        layout = span_layout(variants)
+        piers = pier_quantities(dict(p, **{name: layout[name] for name in (*PIER_PARAMS, 'FUTRL')}), c, tn)
+        quantities.update({name: (concrete.sum(), formwork.sum()) for name, (concrete, formwork) in piers.items()})
+    else:
+        count = np.maximum(np.floor(p['NSPAN']), 1) - 1
+        piers = pier_quantities(p, c, tn)
+        quantities.update({name: (concrete * count, formwork * count) for name, (concrete, formwork) in piers.items()})
+    quantities.update(abutment_quantities(p, c))
+
+    shape = np.broadcast(*(value for pair in quantities.values() for value in pair)).shape
+    columns = {}
+    for name in TAKEOFF_COMPONENTS:
+        concrete, formwork = quantities[name]
+        columns[f'{name}_concrete'] = np.broadcast_to(concrete * M3, shape)
+        columns[f'{name}_formwork'] = np.broadcast_to(formwork * M2, shape)
+    columns['total_concrete'] = sum(columns[f'{name}_concrete'] for name in TAKEOFF_COMPONENTS)
+    columns['total_formwork'] = sum(columns[f'{name}_formwork'] for name in TAKEOFF_COMPONENTS)
+
+    if not shape:
+        return {name: float(value) for name, value in columns.items()}
+    logging.info(f"Took off quantities of {math.prod(shape)} design variants")
+    return {name: np.array(value) for name, value in columns.items()}
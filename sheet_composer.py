@@ -0,0 +1,432 @@
+"""
+Sheet Composer
+Builds the views of a general arrangement drawing as independent engine jobs,
+in parallel, and places them into viewports on one sheet for DXF and PDF
+"""
+
+import hashlib
+import io
+import logging
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from ezdxf.enums import TextEntityAlignment
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import mm
+from reportlab.lib.colors import black
+
+from drawing_engine import BridgeDrawingEngine
+from bridge_generator import BridgeCADGenerator
+from utils.pdf_stream import PageCanvas, PDFStreamWriter
+from utils.spans import with_span_table
+from utils.pdf_writer import PDF_FONT, binary_streams, draw_elements, draw_texts, draw_hatches
+
+# Landscape sheet sizes in paper mm
+SHEET_SIZES = {
+    'A1': (841.0, 594.0),
+    'A3': (420.0, 297.0),
+}
+SHEET_MARGIN = 10.0
+
+# View name, title and viewport (x, y, width, height) as fractions of the
+# area inside the border
+SHEET_VIEWS = [
+    ('elevation', 'ELEVATION', (0.0, 0.5, 0.66, 0.5)),
+    ('plan', 'T2: FOOTING PLAN / T3: SECTIONAL PLAN', (0.0, 0.0, 0.66, 0.5)),
+    ('pier_section', 'SECTION YY OF PIER', (0.66, 0.5, 0.34, 0.5)),
+    ('deck_section', 'DECK CROSS SECTION', (0.66, 0.16, 0.34, 0.34)),
+]
+TITLE_BLOCK = (0.66, 0.0, 0.34, 0.16)
+
+# Views the engine draws enlarged by SCALE1/SCALE2, like the original p2t()
+SECTION_VIEWS = ('pier_section', 'deck_section')
+
+# Scales a view may be drawn at when it does not fit at SCALE1
+STANDARD_SCALES = [1, 2, 5, 10, 20, 25, 50, 75, 100, 150, 200, 250, 500,
+                   1000, 2000, 2500, 5000, 10000, 20000, 50000]
+
+TITLE_HEIGHT = 5.0  # Paper mm
+
+# Tiled sheets: paper mm of drawing repeated past each match line, and the
+# height of the match line labels
+MATCH_OVERLAP = 10.0
+MATCH_TEXT = 3.5
+
+
+def build_view(parameters, name):
+    """Build one view with its own engine; module level so process pools can run it"""
+    return BridgeDrawingEngine(parameters).generate_drawing_data(views=[name])
+
+
+def tile_frame(sheet):
+    """Drawing area (x, y, width, height) of a tiled sheet in paper mm, above its title strip"""
+    sheet_w, sheet_h = SHEET_SIZES[sheet]
+    bottom = SHEET_MARGIN + 2 * TITLE_HEIGHT
+    return SHEET_MARGIN, bottom, sheet_w - 2 * SHEET_MARGIN, sheet_h - SHEET_MARGIN - bottom
+
+
+def render_tile_page(page, data, sheet, scale, title):
+    """Draw one tiled sheet on a PageCanvas; module level so process pools can run it"""
+    sheet_w, sheet_h = SHEET_SIZES[sheet]
+    fx, fy, fw, fh = tile_frame(sheet)
+    c = PageCanvas((sheet_w * mm, sheet_h * mm))
+
+    name = f"TileFrame{sheet}"
+    c.beginForm(name)
+    c.setStrokeColor(black)
+    c.setLineWidth(0.7)
+    c.rect(SHEET_MARGIN * mm, SHEET_MARGIN * mm, fw * mm, (fh + 2 * TITLE_HEIGHT) * mm)
+    c.setLineWidth(0.5)
+    c.line(fx * mm, fy * mm, (fx + fw) * mm, fy * mm)
+    c.endForm()
+    c.doForm(name)
+    c.setFont(PDF_FONT, TITLE_HEIGHT * mm)
+    c.drawCentredString((fx + fw / 2) * mm, (SHEET_MARGIN + TITLE_HEIGHT / 2) * mm,
+                        f"{title} - SHEET {page['number']} OF {page['count']} (SCALE 1:{scale:g})")
+
+    view_x, view_y = page['view'][:2]
+
+    def transform_x(value):
+        return (fx + (value - view_x) / scale) * mm
+
+    def transform_y(value):
+        return (fy + (value - view_y) / scale) * mm
+
+    c.saveState()
+    clip = c.beginPath()
+    clip.rect(fx * mm, fy * mm, fw * mm, fh * mm)
+    c.clipPath(clip, stroke=0, fill=0)
+    c.setStrokeColor(black)
+    draw_hatches(c, data['hatches'], transform_x, transform_y, mm / scale,
+                 (fx * mm, fy * mm, (fx + fw) * mm, (fy + fh) * mm))
+    draw_elements(c, data['elements'], transform_x, transform_y)
+    draw_texts(c, data['texts'], transform_x, transform_y, mm / scale)
+    c.restoreState()
+
+    # Match lines on the tile edges shared with other sheets, labelled inside this one
+    x0, y0, x1, y1 = page['tile']
+    gap = MATCH_TEXT * scale
+    c.saveState()
+    c.setLineWidth(0.5)
+    c.setDash([6, 3])
+    t = c.beginText()
+    t.setFont(PDF_FONT, MATCH_TEXT * mm)
+    for side, number in page['neighbours'].items():
+        label = f"MATCH LINE - SEE SHEET {number}"
+        if side in ('left', 'right'):
+            x = x0 if side == 'left' else x1
+            c.line(transform_x(x), fy * mm, transform_x(x), (fy + fh) * mm)
+            lx = transform_x(x + gap if side == 'left' else x - gap / 2)
+            t.setTextTransform(0, 1, -1, 0, lx, (fy + fh / 2) * mm)
+        else:
+            y = y0 if side == 'bottom' else y1
+            c.line(fx * mm, transform_y(y), (fx + fw) * mm, transform_y(y))
+            ly = transform_y(y + gap / 2 if side == 'bottom' else y - gap)
+            t.setTextTransform(1, 0, 0, 1, (fx + fw / 2) * mm, ly)
+        t.textOut(label)
+    c.drawText(t)
+    c.restoreState()
+    return c
+
+
+def view_scale(bounds, width, height, nominal):
+    """Smallest standard scale, not below nominal, that fits bounds into width x height mm"""
+    needed = max((bounds['max_x'] - bounds['min_x']) / width,
+                 (bounds['max_y'] - bounds['min_y']) / height, nominal)
+    for scale in STANDARD_SCALES:
+        if scale >= needed:
+            return scale
+    return needed
+
+
+class SheetComposer:
+    """Compose elevation, plan, pier section and deck section on one sheet"""
+
+    def __init__(self, parameters, sheet='A1', max_workers=None, processes=False):
+        if sheet not in SHEET_SIZES:
+            raise ValueError(f"Unknown sheet size: {sheet}")
+        self.params = parameters
+        self.sheet = sheet
+        self.max_workers = max_workers
+        self.processes = processes
+        self.views = None
+
+    def build_views(self):
+        """Build every view concurrently; the sheet waits only for the slowest view"""
+        executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with executor(max_workers=self.max_workers or len(SHEET_VIEWS)) as pool:
+            futures = {name: pool.submit(build_view, self.params, name) for name, _, _ in SHEET_VIEWS}
+            views = {name: future.result() for name, future in futures.items()}
+        logging.info(f"Built {len(views)} sheet views")
+        return views
+
+    def compose(self):
+        """Viewports of the sheet: view data with its paper rectangle, scale and model centre"""
+        if self.views is None:
+            self.views = self.build_views()
+
+        sheet_w, sheet_h = SHEET_SIZES[self.sheet]
+        inner_w, inner_h = sheet_w - 2 * SHEET_MARGIN, sheet_h - 2 * SHEET_MARGIN
+        scale1 = float(self.params.get('SCALE1', 100))
+        scale2 = float(self.params.get('SCALE2', 1))
+        sc = scale1 / scale2 if scale2 else 1
+
+        viewports = []
+        for name, title, (fx, fy, fw, fh) in SHEET_VIEWS:
+            data = self.views[name]
+            x, y = SHEET_MARGIN + fx * inner_w, SHEET_MARGIN + fy * inner_h
+            w, h = fw * inner_w, fh * inner_h
+            bounds = data['bounds']
+            # Room for the view title along the bottom of the viewport
+            scale = view_scale(bounds, w * 0.95, (h - 2 * TITLE_HEIGHT) * 0.95, scale1)
+            true_scale = scale / sc if name in SECTION_VIEWS else scale
+            viewports.append({
+                'name': name,
+                'title': f"{title} (SCALE 1:{true_scale:g})",
+                'data': data,
+                'rect': (x, y, w, h),
+                'scale': scale,
+                'centre': ((bounds['min_x'] + bounds['max_x']) / 2,
+                           (bounds['min_y'] + bounds['max_y']) / 2),
+            })
+        return viewports
+
+    def title_block(self):
+        """Title block rectangle and its (text, height) lines, in paper mm"""
+        sheet_w, sheet_h = SHEET_SIZES[self.sheet]
+        inner_w, inner_h = sheet_w - 2 * SHEET_MARGIN, sheet_h - 2 * SHEET_MARGIN
+        fx, fy, fw, fh = TITLE_BLOCK
+        rect = (SHEET_MARGIN + fx * inner_w, SHEET_MARGIN + fy * inner_h, fw * inner_w, fh * inner_h)
+
+        params = with_span_table(self.params)
+        lbridge = float(params.get('LBRIDGE', 30000))
+        nspan = int(params.get('NSPAN', 1))
+        lines = [
+            ("T1: GENERAL ARRANGEMENT DRAWING", 6.0),
+            (f"BRIDGE LENGTH {lbridge / 1000:.1f} M IN {nspan} SPAN{'S' if nspan > 1 else ''}", 4.0),
+            (f"SHEET {self.sheet}", 4.0),
+        ]
+        return rect, lines
+
+    def draw_pdf_frame(self, c):
+        """Sheet border and title block, drawn once as a form and placed on
+        the page, so every page of a document shares one object"""
+        sheet_w, sheet_h = SHEET_SIZES[self.sheet]
+        (x, y, w, h), lines = self.title_block()
+        name = f"SheetFrame{self.sheet}_" + hashlib.sha1(repr(lines).encode('utf-8')).hexdigest()[:8]
+        if not c.hasForm(name):
+            c.beginForm(name)
+            c.setStrokeColor(black)
+            c.setLineWidth(0.7)
+            c.rect(SHEET_MARGIN * mm, SHEET_MARGIN * mm,
+                   (sheet_w - 2 * SHEET_MARGIN) * mm, (sheet_h - 2 * SHEET_MARGIN) * mm)
+            c.setLineWidth(0.5)
+            c.rect(x * mm, y * mm, w * mm, h * mm)
+            line_y = y + h
+            for text, height in lines:
+                line_y -= height * 2
+                c.setFont("Helvetica", height * mm)
+                c.drawCentredString((x + w / 2) * mm, line_y * mm, text)
+            c.endForm()
+        c.doForm(name)
+        return name
+
+    def generate_dxf(self):
+        """Sheet in DXF: each view as a block in model space, shown through a
+        paper space viewport at its scale"""
+        try:
+            viewports = self.compose()
+            generator = BridgeCADGenerator(self.params)
+            doc = generator.doc
+            msp = generator.msp
+
+            # Views are drawn about their own origins; side by side in model space
+            offset_x = 0.0
+            for viewport in viewports:
+                data = viewport['data']
+                block_name = f"VIEW_{viewport['name'].upper()}"
+                block = doc.blocks.new(block_name)
+                generator.write_dxf_layout(data, block)
+                dx = offset_x - data['bounds']['min_x']
+                msp.add_blockref(block_name, (dx, 0))
+                viewport['model_centre'] = (viewport['centre'][0] + dx, viewport['centre'][1])
+                offset_x += data['bounds']['max_x'] - data['bounds']['min_x'] + 10000
+
+            sheet_w, sheet_h = SHEET_SIZES[self.sheet]
+            psp = doc.layouts.get('Layout1')
+            psp.page_setup(size=(sheet_w, sheet_h), margins=(0, 0, 0, 0), units='mm')
+
+            def rectangle(x, y, w, h):
+                psp.add_lwpolyline([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], close=True)
+
+            rectangle(SHEET_MARGIN, SHEET_MARGIN, sheet_w - 2 * SHEET_MARGIN, sheet_h - 2 * SHEET_MARGIN)
+            for viewport in viewports:
+                x, y, w, h = viewport['rect']
+                rectangle(x, y, w, h)
+                view_h = h - 2 * TITLE_HEIGHT
+                psp.add_viewport(
+                    center=(x + w / 2, y + 2 * TITLE_HEIGHT + view_h / 2),
+                    size=(w, view_h),
+                    view_center_point=viewport['model_centre'],
+                    view_height=view_h * viewport['scale']
+                )
+                psp.add_text(viewport['title'], dxfattribs={'height': TITLE_HEIGHT}).set_placement(
+                    (x + w / 2, y + TITLE_HEIGHT / 2), align=TextEntityAlignment.BOTTOM_CENTER)
+
+            (x, y, w, h), lines = self.title_block()
+            rectangle(x, y, w, h)
+            line_y = y + h
+            for text, height in lines:
+                line_y -= height * 2
+                psp.add_text(text, dxfattribs={'height': height}).set_placement(
+                    (x + w / 2, line_y), align=TextEntityAlignment.BOTTOM_CENTER)
+
+            string_buffer = io.StringIO()
+            doc.write(string_buffer)
+            logging.info("Sheet DXF generation completed successfully")
+            return string_buffer.getvalue().encode('utf-8')
+
+        except Exception as e:
+            logging.error(f"Error generating sheet DXF: {str(e)}")
+            raise Exception(f"Failed to generate bridge sheet: {str(e)}")
+
+    def generate_pdf(self):
+        """Sheet in PDF: each view clipped to its viewport at its scale"""
+        try:
+            viewports = self.compose()
+            generator = BridgeCADGenerator(self.params)
+            sheet_w, sheet_h = SHEET_SIZES[self.sheet]
+
+            pdf_buffer = io.BytesIO()
+            with binary_streams():
+                c = canvas.Canvas(pdf_buffer, pagesize=(sheet_w * mm, sheet_h * mm))
+                self.draw_pdf_frame(c)
+                c.setStrokeColor(black)
+
+                for viewport in viewports:
+                    x, y, w, h = viewport['rect']
+                    c.setLineWidth(0.5)
+                    c.rect(x * mm, y * mm, w * mm, h * mm)
+                    c.setFont("Helvetica", TITLE_HEIGHT * mm)
+                    c.drawCentredString((x + w / 2) * mm, (y + TITLE_HEIGHT / 2) * mm, viewport['title'])
+
+                    view_h = h - 2 * TITLE_HEIGHT
+                    centre_x = (x + w / 2) * mm
+                    centre_y = (y + 2 * TITLE_HEIGHT + view_h / 2) * mm
+                    model_x, model_y = viewport['centre']
+                    pdf_scale = 1.0 / viewport['scale']
+
+                    def transform_x(value, centre_x=centre_x, model_x=model_x, pdf_scale=pdf_scale):
+                        return centre_x + (value - model_x) * pdf_scale * mm
+
+                    def transform_y(value, centre_y=centre_y, model_y=model_y, pdf_scale=pdf_scale):
+                        return centre_y + (value - model_y) * pdf_scale * mm
+
+                    c.saveState()
+                    clip = c.beginPath()
+                    clip.rect(x * mm, (y + 2 * TITLE_HEIGHT) * mm, w * mm, view_h * mm)
+                    c.clipPath(clip, stroke=0, fill=0)
+                    generator.draw_pdf_drawing_data(c, viewport['data'], transform_x, transform_y, pdf_scale)
+                    c.restoreState()
+
+                c.save()
+            logging.info("Sheet PDF generation completed successfully")
+            return pdf_buffer.getvalue()
+
+        except Exception as e:
+            logging.error(f"Error generating sheet PDF: {str(e)}")
+            raise Exception(f"Failed to generate bridge sheet PDF: {str(e)}")
+
+
+class TiledSheets:
+    """The drawing at its true SCALE1 across as many sheets as it needs,
+    joined at match lines, streamed as a PDF one page at a time"""
+
+    def __init__(self, parameters, sheet='A1', views=None, layers=None, max_workers=None, processes=False):
+        if sheet not in SHEET_SIZES:
+            raise ValueError(f"Unknown sheet size: {sheet}")
+        self.params = parameters
+        self.sheet = sheet
+        self.views = views
+        self.layers = layers
+        self.max_workers = max_workers
+        self.processes = processes
+        self.scale = float(parameters.get('SCALE1', 100))
+        self.engine = None
+
+    def layout(self):
+        """Pages in reading order: the tile between match lines, the model box
+        the page shows (tile plus overlap) and the sheets across each match line"""
+        if self.engine is None:
+            self.engine = BridgeDrawingEngine(self.params)
+            self.engine.generate_drawing_data(views=self.views, layers=self.layers)
+        bounds = self.engine.bounds
+
+        _, _, fw, fh = tile_frame(self.sheet)
+        overlap = MATCH_OVERLAP * self.scale
+        step_x, step_y = fw * self.scale - 2 * overlap, fh * self.scale - 2 * overlap
+        width, height = bounds['max_x'] - bounds['min_x'], bounds['max_y'] - bounds['min_y']
+        columns, rows = max(1, math.ceil(width / step_x)), max(1, math.ceil(height / step_y))
+        left = (bounds['min_x'] + bounds['max_x'] - columns * step_x) / 2
+        top = (bounds['min_y'] + bounds['max_y'] + rows * step_y) / 2
+
+        # Only tiles holding geometry become sheets
+        grid = {}
+        for row in range(rows):
+            for column in range(columns):
+                tile = (left + column * step_x, top - (row + 1) * step_y,
+                        left + (column + 1) * step_x, top - row * step_y)
+                if self.engine.index.query(*tile):
+                    grid[row, column] = tile
+
+        numbers = {cell: number for number, cell in enumerate(grid, 1)}
+        pages = []
+        for (row, column), tile in grid.items():
+            neighbours = {side: numbers[cell] for side, cell in (
+                ('left', (row, column - 1)), ('right', (row, column + 1)),
+                ('top', (row - 1, column)), ('bottom', (row + 1, column))) if cell in numbers}
+            pages.append({
+                'number': numbers[row, column],
+                'count': len(grid),
+                'tile': tile,
+                'view': (tile[0] - overlap, tile[1] - overlap, tile[2] + overlap, tile[3] + overlap),
+                'neighbours': neighbours,
+            })
+        return pages
+
+    def iter_pdf(self):
+        """PDF bytes, page by page, as workers finish the pages in order.
+
+        Each page receives only its own geometry from the spatial index; at
+        most two pages per worker are in flight, so memory stays bounded.
+        """
+        pages = self.layout()
+        lbridge = float(self.engine.params.get('LBRIDGE', 30000))
+        title = f"GENERAL ARRANGEMENT - BRIDGE LENGTH {lbridge / 1000:.1f} M"
+        writer = PDFStreamWriter()
+        yield writer.begin()
+
+        executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        window = 2 * (self.max_workers or os.cpu_count() or 1)
+        with executor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for page in pages:
+                data = self.engine.query_bbox(*page['view'])
+                pending.append(pool.submit(render_tile_page, page, data, self.sheet, self.scale, title))
+                if len(pending) >= window:
+                    yield writer.add_page(pending.popleft().result())
+            while pending:
+                yield writer.add_page(pending.popleft().result())
+
+        yield writer.finish()
+        logging.info(f"Streamed {len(pages)} tiled {self.sheet} sheets at 1:{self.scale:g}")
+
+    def generate_pdf(self):
+        """The whole tiled PDF as bytes"""
+        try:
+            return b''.join(self.iter_pdf())
+        except Exception as e:
+            logging.error(f"Error generating tiled PDF: {str(e)}")
+            raise Exception(f"Failed to generate tiled bridge PDF: {str(e)}")
@@ -0,0 +1,651 @@
+import numpy as np
+
+from drawing_engine import BridgeDrawingEngine
+from utils.geometry import merge_segments
+from utils.lod import simplify_for_scale
+from utils.labels import place_labels, label_bbox
+from utils.survey import SurveyFile, write_survey
+from utils.dimensions import write_dxf_dimensions
+
+SAMPLE_PARAMS = {
+    'LBRIDGE': 30000,
+    'NSPAN': 3,
+    'SPAN1': 10000,
+    'TOPRL': 110000,
+    'SOFL': 108000,
+    'LEFT': 0,
+    'ABTLEN': 10000,
+    'ALFL': 105000,
+    'ARFL': 105000,
+    'SCALE1': 100,
+    'SCALE2': 1,
+}
+
+
+def line(x1, y1, x2, y2, layer='default', width=1):
+    return {'type': 'line', 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+            'layer': layer, 'width': width}
+
+
+def test_rectangle_chains_into_closed_polyline():
+    rect = [line(0, 0, 10, 0), line(10, 0, 10, 5), line(10, 5, 0, 5), line(0, 5, 0, 0)]
+    merged = merge_segments(rect)
+    assert len(merged) == 1
+    assert merged[0]['type'] == 'polyline'
+    assert merged[0]['closed']
+    assert len(merged[0]['points']) == 4
+
+
+def test_overlapping_collinear_segments_are_trimmed():
+    merged = merge_segments([line(0, 0, 100, 0, 'deck', 3), line(50, 0, 150, 0, 'cap', 2)])
+    cap = [e for e in merged if e['layer'] == 'cap']
+    assert len(cap) == 1
+    assert (cap[0]['x1'], cap[0]['x2']) == (100, 150)
+
+
+def test_merge_reduces_engine_entity_count():
+    raw = BridgeDrawingEngine(SAMPLE_PARAMS)
+    raw.generate_drawing_data(merge=False)
+    merged = BridgeDrawingEngine(SAMPLE_PARAMS).generate_drawing_data()
+    assert len(merged['elements']) < len(raw.elements)
+
+
+def test_bounds_cover_all_geometry():
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS)
+    data = engine.generate_drawing_data()
+    bounds = data['bounds']
+    assert bounds['min_x'] < 0 < bounds['max_x']
+    assert bounds['min_y'] <= 100000 and bounds['max_y'] > 110000
+
+
+def test_viewport_query_returns_visible_subset():
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS)
+    engine.generate_drawing_data()
+    visible = engine.query_bbox(9000, 99000, 11000, 112000)
+    assert 0 < len(visible['elements']) < len(engine.elements)
+    # Plain elements come back as they are; columnar ones are clipped copies
+    plain = [e for e in visible['elements'] if e['type'] != 'segments']
+    assert all(any(e is elem for elem in engine.elements) for e in plain)
+
+
+def test_lod_keeps_dense_polyline_within_pixel_tolerance():
+    points = [(x * 10.0, (x % 2) * 5.0) for x in range(1000)]
+    profile = {'type': 'polyline', 'points': points, 'closed': False, 'layer': 'ground', 'width': 1}
+    scale = 0.01  # px per mm: 10 m of drawing on 100 px
+    elements, _ = simplify_for_scale([profile], [], scale, tolerance_px=0.5)
+    simplified = elements[0]['points']
+    assert len(simplified) < 10
+    assert all(abs(y) * scale <= 0.5 for _, y in simplified)
+
+
+def test_lod_collapses_instanced_plan_outlines():
+    from drawing_engine import BridgeRenderer
+
+    params = dict(SAMPLE_PARAMS, NSPAN=300, LBRIDGE=3000000)
+    data = BridgeDrawingEngine(params).generate_drawing_data()
+    renderer = BridgeRenderer(data)
+    scale, _ = renderer.svg_frame(renderer.bounds, 800, 400, None)
+    piers = [e for e in data['elements'] if e['layer'] == 'plan_pier']
+    simplified, _ = simplify_for_scale(piers, [], scale, tolerance_px=0.5)
+    before = np.vstack([e['coords'] for e in piers])
+    after = np.vstack([e['coords'] for e in simplified])
+    assert len(after) < len(before) / 4
+
+    # Every original vertex stays within the tolerance of what is drawn
+    points = before[:, :2][::7]
+    a, d = after[:, :2], after[:, 2:] - after[:, :2]
+    t = np.clip(np.einsum('pij,ij->pi', points[:, None] - a, d) / np.maximum((d * d).sum(axis=1), 1e-9), 0, 1)
+    gaps = np.hypot(*np.moveaxis(points[:, None] - a - t[..., None] * d, -1, 0)).min(axis=1)
+    assert gaps.max() * scale <= 0.5
+
+    # 886 KB before outlines were simplified
+    assert len(renderer.render_to_svg(800, 400, lod_tolerance_px=0.5)) < 320000
+
+
+def test_preview_tiles_are_cached_and_simplified(monkeypatch):
+    import app as app_module
+    from drawing_engine import BridgeRenderer
+
+    client = app_module.app.test_client()
+    parameters = dict(SAMPLE_PARAMS, NSPAN=30, LBRIDGE=300000)
+    grid = client.post('/tiles', json=parameters).get_json()
+    key = grid['key']
+    assert grid['tile_size'] == app_module.TILE_SIZE and grid['max_zoom'] == app_module.MAX_TILE_ZOOM
+
+    tile = client.get(f'/tiles/0/0/0?key={key}')
+    assert tile.status_code == 200 and tile.mimetype == 'image/svg+xml'
+    assert all(client.get(f'/tiles/1/{x}/{y}?key={key}').status_code == 200 for x in (0, 1) for y in (0, 1))
+    for url in ('/tiles/1/2/0', '/tiles/1/0/2', f'/tiles/{grid["max_zoom"] + 1}/0/0'):
+        assert client.get(f'{url}?key={key}').status_code == 404
+    assert client.get('/tiles/0/0/0?key=unknown').status_code == 404
+    # Bodies that are not a parameter object are bad requests
+    for body in ({'data': b''}, {'json': [1, 2]}, {'data': b'null', 'content_type': 'application/json'},
+                 {'data': b'{', 'content_type': 'application/json'}):
+        assert client.post('/tiles', **body).status_code == 400
+
+    # A cached tile is served without rendering again
+    monkeypatch.setattr(app_module, 'BridgeRenderer', None)
+    assert client.get(f'/tiles/0/0/0?key={key}').data == tile.data
+
+    # Level of detail makes the whole-drawing tile smaller than a full render
+    bbox = app_module.tile_bbox(grid['bounds'], 0, 0, 0)
+    engine = app_module.get_drawing_engine(app_module.with_drawing_defaults(parameters))
+    full = BridgeRenderer(engine.query_bbox(*bbox)).render_to_svg(256, 256, viewport=bbox)
+    assert len(tile.data) < len(full) / 2
+
+
+def test_app_caches_stay_bounded_under_concurrent_requests():
+    from concurrent.futures import ThreadPoolExecutor
+    from app import LRUCache
+
+    cache = LRUCache(8)
+
+    def use(i):
+        cache.put(i % 32, i)
+        cache.get((i * 7) % 32)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(use, range(20000)))
+    assert len(cache._items) == 8
+
+    # The least recently used entry is the one evicted
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+
+def test_label_placement_removes_overlaps():
+    texts = [{'x': 0, 'y': 0, 'text': f"PIER {i}", 'size': 300, 'layer': 'text'} for i in range(5)]
+    placed = place_labels(texts)
+    boxes = [label_bbox(t) for t in placed]
+    for i, a in enumerate(boxes):
+        for b in boxes[i + 1:]:
+            assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1]
+
+
+def test_label_placement_avoids_text_batches_and_rotated_labels():
+    batch = {'type': 'text_batch', 'x': np.array([0.0, 2000.0, 4000.0]), 'y': np.zeros(3),
+             'text': np.array([100.0, 102.0, 104.0]), 'format': '%.3f', 'size': 300,
+             'layer': 'axis_labels', 'rotation': 0}
+    rotated = {'x': 8000, 'y': 0, 'text': "10000", 'size': 300, 'layer': 'dimensions', 'rotation': 90}
+    labels = [{'x': x, 'y': 50, 'text': "PIER", 'size': 300, 'layer': 'text'} for x in (2000, 8000)]
+    placed = place_labels([batch, rotated] + labels)
+    assert placed[0] is batch and placed[1] is rotated
+
+    fixed = [label_bbox(dict(batch, type='text', x=x, y=0.0, text='%.3f' % value))
+             for x, value in zip(batch['x'], batch['text'])] + [label_bbox(rotated)]
+    for start, label in zip(labels, placed[2:]):
+        # Both start over a fixed label and are moved off it
+        assert (label['x'], label['y']) != (start['x'], start['y'])
+        a = label_bbox(label)
+        assert all(a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1] for b in fixed)
+
+
+def test_ground_profile_drops_invalid_rows_and_batches_output():
+    chainages = [0, 1000, 'n/a', 2500, 3000]
+    levels = [99000, 98000, 97000, 98500, 'x']
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS)
+    engine.draw_ground_profile(chainages, levels)
+
+    profile = [e for e in engine.elements if e['layer'] == 'ground_profile'][0]
+    assert profile['points'].tolist() == [[0, 99000], [1000, 98000], [2500, 98500]]
+    # Only the off-grid point at 2500 gets ticks, in three bands
+    ticks = [e for e in engine.elements if e['type'] == 'segments'][0]
+    assert ticks['coords'].shape == (3, 4)
+    assert all(t['type'] == 'text_batch' and len(t['x']) == 3 for t in engine.texts)
+
+
+def test_survey_file_reads_only_requested_window(tmp_path):
+    path = tmp_path / 'profile.survey'
+    chainages = np.arange(0, 100000, 500.0)[::-1]
+    assert write_survey(path, chainages, 99000 + chainages / 100) == 200
+
+    with SurveyFile(path) as survey:
+        window_ch, window_rl = survey.window(10000, 12000)
+        assert window_ch.tolist() == [9500, 10000, 10500, 11000, 11500, 12000, 12500]
+        assert np.allclose(window_rl, 99000 + window_ch / 100)
+
+        engine = BridgeDrawingEngine(dict(SAMPLE_PARAMS, RIGHT=30000), ground_profile=survey)
+        engine.generate_drawing_data()
+        profile = [e for e in engine.elements if e['layer'] == 'ground_profile'][0]
+        assert profile['points'][0, 0] == 0 and profile['points'][-1, 0] == 30500
+
+
+def test_ground_profile_decimation_respects_paper_tolerance():
+    chainages = np.linspace(0, 30000, 10001)
+    levels = 99000 + 5 * np.sin(chainages)  # 5 mm ripple, 0.05 paper mm at 1:100
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS, profile_tolerance=0.1)
+    engine.draw_ground_profile(chainages, levels)
+
+    profile = [e for e in engine.elements if e['layer'] == 'ground_profile'][0]
+    assert len(profile['points']) < 10
+    assert np.all(np.abs(profile['points'][:, 1] - 99000) <= engine.paper_to_model(0.1))
+
+
+def test_axes_emit_one_batch_per_axis():
+    params = dict(SAMPLE_PARAMS, DATUM=100000, XINCR=1000, YINCR=500, RIGHT=30000)
+    engine = BridgeDrawingEngine(params)
+    engine.draw_axes()
+
+    ticks = [e['coords'] for e in engine.elements if e['type'] == 'segments']
+    assert [len(t) for t in ticks] == [21, 2 * 31]
+    levels, chainages = [t for t in engine.texts if t.get('type') == 'text_batch']
+    assert levels['format'] % levels['text'][-1] == '110.000'
+    assert chainages['rotation'] == 90 and len(chainages['x']) == 31
+
+
+def test_repeated_pier_dimensions_render_once():
+    import ezdxf
+
+    params = dict(SAMPLE_PARAMS, NSPAN=5, LBRIDGE=50000)
+    data = BridgeDrawingEngine(params).generate_drawing_data()
+    # 5 spans, the overall length, and width and depth at 4 piers
+    assert len(data['dimensions']) == 14
+    assert any(e['type'] == 'segments' and e['layer'] == 'dimensions' for e in data['elements'])
+
+    doc = ezdxf.new('R2010')
+    renders = write_dxf_dimensions(doc, doc.modelspace(), data['dimensions'] * 2)
+    assert renders == 4
+    assert len(doc.modelspace().query('INSERT')) == 13
+    assert len(doc.dimstyles) == len(ezdxf.new('R2010').dimstyles) + 1
+
+
+def test_plan_places_every_pier_in_one_batch():
+    params = dict(SAMPLE_PARAMS, NSPAN=4, LBRIDGE=40000, SKEW=30, FUTW=3000, FUTL=8000)
+    data = BridgeDrawingEngine(params).generate_drawing_data(merge=False, labels=False, views=['plan'])
+
+    footings = [e['coords'] for e in data['elements'] if e['layer'] == 'plan_footing']
+    assert len(footings[0]) == 3 * 4
+    # Footing sides turn with the skew and keep their length
+    x1, y1, x2, y2 = footings[0][0]
+    assert np.isclose(np.degrees(np.arctan2(y2 - y1, x2 - x1)), 30)
+    assert np.isclose(np.hypot(x2 - x1, y2 - y1), 3000)
+
+
+def test_transform_stack_applies_to_whole_components():
+    from utils.transforms import rotation, translation
+
+    engine = BridgeDrawingEngine(dict(SAMPLE_PARAMS, SCALE1=100, SCALE2=50, DATUM=100000))
+    assert engine.v2pos(101000) == 102000 and engine.hpos(5000) == 5000
+
+    with engine.transform.push(translation(1000, 0)), engine.transform.push(rotation(90)):
+        engine.add_segments([[0, 0, 100, 0]], 'test')
+        engine.add_text_batch([100], [0], [1.0], 10, 'test', fmt='%.1f')
+    assert engine.transform.is_identity
+    assert np.allclose(engine.elements[-1]['coords'], [[1000, 0, 1000, 100]])
+    batch = engine.texts[-1]
+    assert np.allclose([batch['x'][0], batch['y'][0], batch['rotation']], [1000, 100, 90])
+
+
+def test_sheet_places_every_view_in_its_own_viewport():
+    import io
+    import ezdxf
+    from sheet_composer import SheetComposer, SHEET_VIEWS
+
+    composer = SheetComposer(dict(SAMPLE_PARAMS, SCALE2=50), sheet='A1')
+    viewports = composer.compose()
+    assert [v['name'] for v in viewports] == [name for name, _, _ in SHEET_VIEWS]
+    assert viewports[2]['title'].endswith('(SCALE 1:50)')
+
+    doc = ezdxf.read(io.StringIO(composer.generate_dxf().decode('utf-8')))
+    # The layout's own main viewport plus one per view
+    assert len(doc.layouts.get('Layout1').query('VIEWPORT')) == len(SHEET_VIEWS) + 1
+    assert composer.generate_pdf().startswith(b'%PDF')
+
+
+def test_streamed_exports_hold_one_component_at_a_time():
+    import io
+    import ezdxf
+    from drawing_engine import BridgeRenderer
+    from bridge_generator import BridgeCADGenerator
+
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS)
+    bounds = engine.stream_bounds()
+    assert bounds == BridgeDrawingEngine(SAMPLE_PARAMS).generate_drawing_data()['bounds']
+    assert engine.elements == [] and engine.texts == []
+
+    svg = io.StringIO()
+    assert BridgeRenderer.stream_svg(engine.iter_items(), bounds, svg) > 0
+    assert svg.getvalue().startswith('<svg') and svg.getvalue().endswith('</svg>')
+
+    dxf = io.StringIO()
+    BridgeCADGenerator(SAMPLE_PARAMS).stream_dxf(engine.iter_items(), dxf)
+    doc = ezdxf.read(io.StringIO(dxf.getvalue()))
+    assert len(doc.modelspace().query('TEXT')) > 0
+
+    pdf = io.BytesIO()
+    BridgeCADGenerator(SAMPLE_PARAMS).stream_pdf(engine.iter_items(), bounds, pdf)
+    assert pdf.getvalue().startswith(b'%PDF')
+
+
+def test_stats_match_generated_drawing_without_generating_it():
+    variants = [SAMPLE_PARAMS, dict(SAMPLE_PARAMS, NSPAN=1),
+                dict(SAMPLE_PARAMS, NSPAN=7, LBRIDGE=70000, SKEW=30, RIGHT=80000, YINCR=250, SCALE1=200)]
+    for params in variants:
+        for views in (None, ['pier_section']):
+            stats = BridgeDrawingEngine(params).drawing_stats(views)
+            engine = BridgeDrawingEngine(params)
+            data = engine.generate_drawing_data(merge=False, labels=False, views=views)
+            assert all(np.isclose(stats['bounds'][k], data['bounds'][k]) for k in data['bounds'])
+
+            rows = {}
+            for elem in engine.elements:
+                count = len(elem['coords']) if elem['type'] == 'segments' else 1
+                rows[elem['layer']] = rows.get(elem['layer'], 0) + count
+            assert stats['elements'] == rows
+            assert stats['total_texts'] == sum(len(t['x']) if t.get('type') == 'text_batch' else 1
+                                               for t in engine.texts)
+
+
+def test_pdf_writer_strokes_one_path_per_layer_and_width():
+    import io
+    from reportlab.pdfgen import canvas
+    from utils.pdf_writer import stroke_groups, draw_texts
+
+    data = BridgeDrawingEngine(dict(SAMPLE_PARAMS, NSPAN=5, LBRIDGE=50000)).generate_drawing_data()
+    c = canvas.Canvas(io.BytesIO(), pageCompression=0)
+    paths = stroke_groups(c, data['elements'], lambda x: x / 200, lambda y: (y - 60000) / 200)
+    assert paths == len({(e['width'], e['layer']) for e in data['elements']})
+    assert draw_texts(c, data['texts'], lambda x: x / 200, lambda y: (y - 60000) / 200, 1 / 200) > 0
+
+    pdf = c.getpdfdata()
+    # Line width set once per width, all texts in one text object besides the canvas' own
+    assert pdf.count(b' w\n') == len({e['width'] for e in data['elements']})
+    assert pdf.count(b'BT') == 2
+
+
+def test_binary_pdf_streams_leave_other_canvases_ascii85():
+    import io
+    from reportlab import rl_config
+    from reportlab.pdfgen import canvas
+    from bridge_generator import BridgeCADGenerator
+
+    default = rl_config.useA85
+    pdf = BridgeCADGenerator(SAMPLE_PARAMS).generate_pdf()
+    assert b'/ASCII85Decode' not in pdf
+    assert rl_config.useA85 == default
+
+    c = canvas.Canvas(io.BytesIO())
+    c.line(0, 0, 100, 100)
+    c.save()
+    assert (b'/ASCII85Decode' in c.getpdfdata()) == bool(default)
+
+def test_repeated_components_and_sheet_frame_are_pdf_forms():
+    import io
+    from reportlab.pdfgen import canvas
+    from utils.pdf_writer import draw_elements
+    from sheet_composer import SheetComposer
+
+    params = dict(SAMPLE_PARAMS, NSPAN=20, LBRIDGE=200000)
+    data = BridgeDrawingEngine(params).generate_drawing_data()
+
+    def size(forms):
+        c = canvas.Canvas(io.BytesIO(), pageCompression=0)
+        placements = draw_elements(c, data['elements'], lambda x: x / 500, lambda y: (y - 60000) / 500, forms)
+        return placements, len(c.getpdfdata())
+
+    placements, with_forms = size(True)
+    # Every pier, elevation and plan together, is one placement of one form
+    assert placements >= 19
+    assert with_forms < size(False)[1]
+
+    # The border and title block form is shared by every page
+    c = canvas.Canvas(io.BytesIO(), pageCompression=0)
+    composer = SheetComposer(params, sheet='A3')
+    first = composer.draw_pdf_frame(c)
+    c.showPage()
+    assert composer.draw_pdf_frame(c) == first
+    assert c.getpdfdata().count(b'/Subtype /Form') == 1
+
+
+def test_tiled_sheets_stream_true_scale_pages_with_match_lines():
+    import re
+    from sheet_composer import TiledSheets, tile_frame, MATCH_OVERLAP
+
+    tiled = TiledSheets(dict(SAMPLE_PARAMS, NSPAN=10, LBRIDGE=100000, SCALE1=100), sheet='A3')
+    pages = tiled.layout()
+    assert len(pages) > 1
+    _, _, width, height = tile_frame('A3')
+    for page in pages:
+        x0, y0, x1, y1 = page['view']
+        assert abs((x1 - x0) - width * 100) < 1e-6 and abs((y1 - y0) - height * 100) < 1e-6
+        assert abs(page['tile'][0] - x0 - MATCH_OVERLAP * 100) < 1e-6
+        # Match lines are labelled on both sheets they join
+        for number in page['neighbours'].values():
+            assert page['number'] in pages[number - 1]['neighbours'].values()
+
+    chunks = list(tiled.iter_pdf())
+    assert len(chunks) == len(pages) + 2
+    pdf = b''.join(chunks)
+    assert pdf.count(b'/Type /Page ') == len(pages)
+    assert pdf.count(b'/TileFrameA3 Do') == 0  # Page streams are compressed
+    assert len(re.findall(rb'/Subtype /Form /FormType 1 /BBox \[0 0 1190', pdf)) == 1
+
+    # Every cross-reference entry points at its object
+    start = int(pdf.rsplit(b'startxref\n', 1)[1].split()[0])
+    offsets = [int(line[:10]) for line in pdf[start:].split(b'\n')[3:] if line.endswith(b' n ')]
+    for number, offset in enumerate(offsets, 1):
+        assert pdf[offset:].startswith(f"{number} 0 obj".encode('ascii'))
+
+
+def test_raster_thumbnail_has_requested_size_and_format():
+    import io
+    import pytest
+    from PIL import Image
+    from drawing_engine import BridgeRenderer
+
+    renderer = BridgeRenderer(BridgeDrawingEngine(SAMPLE_PARAMS).generate_drawing_data())
+    for fmt, width, height, dpi in (('png', 320, 160, 100), ('webp', 200, 100, 50)):
+        image = Image.open(io.BytesIO(renderer.render_to_raster(width, height, dpi, fmt)))
+        assert image.format == fmt.upper() and image.size == (width, height)
+        # Geometry was drawn: dark pixels on the white background
+        assert image.convert('L').getextrema()[0] < 128
+    with pytest.raises(ValueError):
+        renderer.render_to_raster(fmt='gif')
+
+
+def test_hatches_are_one_fill_entity_each_in_every_format():
+    import io
+    import ezdxf
+    from reportlab.pdfgen import canvas
+    from drawing_engine import BridgeRenderer
+    from bridge_generator import BridgeCADGenerator
+    from utils.pdf_writer import draw_hatches
+
+    chainages = np.linspace(-5000, 35000, 41)
+    levels = 103000 + 1000 * np.sin(chainages / 4000)
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS, ground_profile=(chainages, levels))
+    data = engine.generate_drawing_data()
+    hatches = data['hatches']
+    # Caps, walls and footings of both abutments; every pier footing; the earth strip
+    assert [(h['pattern'], len(h['paths'])) for h in hatches] == [('concrete', 6), ('concrete', 2), ('earth', 1)]
+
+    generator = BridgeCADGenerator(SAMPLE_PARAMS)
+    doc = ezdxf.read(io.StringIO(generator.generate_dxf_from_drawing_data(data).decode('utf-8')))
+    dxf_hatches = doc.modelspace().query('HATCH')
+    assert [h.dxf.pattern_name for h in dxf_hatches] == ['AR-CONC', 'AR-CONC', 'EARTH']
+    assert [len(h.paths) for h in dxf_hatches] == [6, 2, 1]
+
+    svg = BridgeRenderer(data).render_to_svg(1600, 800)
+    assert svg.count('<pattern ') == 2 and svg.count('fill="url(#hatch-') == 3
+
+    c = canvas.Canvas(io.BytesIO(), pageCompression=0)
+    assert draw_hatches(c, hatches, lambda x: x / 50, lambda y: (y - 95000) / 50, 1 / 50) == 3
+    assert c.getpdfdata().count(b'/Subtype /Form') == 2
+
+    # Viewport queries keep only the loops inside the box
+    left_abutment = engine.query_bbox(-1000, 104000, 11000, 111000)['hatches']
+    assert [len(h['paths']) for h in left_abutment if h['pattern'] == 'concrete'] == [3]
+
+
+def test_layer_filtered_export_skips_components():
+    import functools
+    import pytest
+
+    chainages = np.linspace(-5000, 35000, 41)
+    levels = 103000 + 1000 * np.sin(chainages / 4000)
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS, ground_profile=(chainages, levels))
+    # Every component draws only on the layers it declares
+    for views in (None, ['pier_section', 'deck_section']):
+        for matrix, component in engine.view_components(views):
+            engine.elements, engine.texts, engine.dimensions, engine.hatches = [], [], [], []
+            engine.run_component(matrix, component)
+            drawn = {item['layer'] for item in engine.elements + engine.texts + engine.hatches}
+            if engine.dimensions:
+                drawn.add('dimensions')
+            assert drawn <= set(engine.COMPONENT_LAYERS[component.__name__]), component.__name__
+
+    full = engine.generate_drawing_data()
+    ran = []
+    for name in ('draw_axes', 'draw_dimensions', 'draw_piers_detailed', 'draw_ground_profile_window'):
+        method = getattr(engine, name)
+        setattr(engine, name, functools.wraps(method)(lambda method=method: ran.append(method.__name__) or method()))
+    data = engine.generate_drawing_data(layers=['FOUNDATION', 'deck'])
+    assert ran == ['draw_piers_detailed']
+    layers = {elem['layer'] for elem in data['elements']}
+    assert layers == {'deck', 'footing', 'pier_footing', 'plan_footing'}
+    assert not data['texts'] and not data['hatches'] and not data['dimensions']
+    assert len(data['elements']) < len(full['elements'])
+
+    assert {kind for kind, _ in engine.iter_items(layers=['HATCHING'])} == {'hatch'}
+    with pytest.raises(ValueError):
+        engine.generate_drawing_data(layers=['NOT_A_LAYER'])
+
+
+def test_picked_elevation_and_plan_views_keep_the_plan_below():
+    engine = BridgeDrawingEngine(SAMPLE_PARAMS)
+    picked = engine.generate_drawing_data(labels=False, views=['elevation', 'plan'])['bounds']
+    assert picked == engine.generate_drawing_data(labels=False)['bounds']
+    assert engine.analytic_bounds(['elevation', 'plan']) == engine.analytic_bounds()
+    # Alone the plan stays about its own origin for sheets to place
+    alone = engine.analytic_bounds(['plan'])
+    assert alone['min_y'] > engine.analytic_bounds()['min_y']
+
+
+def test_span_table_places_piers_by_cumulative_length():
+    rng = np.random.default_rng(7)
+    lengths = rng.uniform(8000, 16000, 300)
+    table = [{'length': length, 'pier': 'tall' if i % 3 == 0 else None, 'footing_level': 99000 - 10 * i}
+             for i, length in enumerate(lengths)]
+    params = dict(SAMPLE_PARAMS, SKEW=20, SPAN_TABLE=table, PIER_TYPES={'tall': {'PIERTW': 1800, 'FUTW': 4000}})
+    engine = BridgeDrawingEngine(params)
+    assert engine.params['NSPAN'] == 300 and np.isclose(engine.params['LBRIDGE'], lengths.sum())
+    assert np.allclose(engine.spans['centres'], np.cumsum(lengths)[:-1])
+    assert set(engine.spans['FUTW'].tolist()) == {3000.0, 4000.0}
+
+    stats = engine.drawing_stats()
+    generated = BridgeDrawingEngine(params)
+    data = generated.generate_drawing_data(merge=False, labels=False)
+    assert all(np.isclose(stats['bounds'][k], data['bounds'][k]) for k in data['bounds'])
+    assert sum(stats['elements'].values()) == sum(
+        len(e['coords']) if e['type'] == 'segments' else 1 for e in generated.elements)
+    footings = [e for e in data['elements'] if e['layer'] == 'pier_footing' and e['y1'] == e['y2']]
+    # Each pier footing's base sits at its own level
+    assert sorted({e['y1'] for e in footings})[:2] == [99000 - 10 * 298, 99000 - 10 * 297]
+    assert len(data['hatches'][1]['paths']) == 299
+
+
+def test_spans_that_overrun_the_bridge_length_are_rejected():
+    import pytest
+    from utils.spans import span_layout
+
+    # Two spans of 30 m leave nothing of a 30 m bridge for the third
+    for span1 in (30000, 15000, 0):
+        with pytest.raises(ValueError, match="Span lengths must be positive"):
+            span_layout(dict(SAMPLE_PARAMS, NSPAN=3, LBRIDGE=30000, SPAN1=span1))
+    assert span_layout(dict(SAMPLE_PARAMS, NSPAN=3, LBRIDGE=30000, SPAN1=14000))['lengths'][-1] == 2000
+
+def test_corridor_rebuilds_only_changed_bridges_and_culls_windows():
+    from corridor import CorridorDocument
+    from utils.geometry import element_bbox
+
+    bridges = {f"B{i}": dict(SAMPLE_PARAMS, LEFT=i * 100000, RIGHT=i * 100000 + 40000) for i in range(5)}
+    corridor = CorridorDocument(bridges, max_workers=2)
+    assert corridor.build() == list(bridges)
+    assert corridor.build() == []
+    corridor.set_bridge('B2', dict(bridges['B2'], TOPRL=111000))
+    corridor.set_bridge('B1', bridges['B1'])
+    assert corridor.build() == ['B2']
+
+    whole = corridor.drawing_data()
+    single = BridgeDrawingEngine(bridges['B0']).generate_drawing_data()
+    assert len(whole['elements']) == 4 * len(single['elements']) + len(corridor.built['B2'][1]['elements'])
+    assert whole['bounds']['min_x'] < 0 and whole['bounds']['max_x'] > 400000
+
+    # Only the bridge under the window, clipped to it
+    window = corridor.drawing_data(190000, 260000)
+    boxes = [element_bbox(elem) for elem in window['elements']]
+    assert boxes and all(190000 - 1e-6 <= b[0] and b[2] <= 260000 + 1e-6 for b in boxes)
+    assert len(window['elements']) < len(whole['elements']) / 3 and not window['dimensions']
+
+    corridor.remove_bridge('B4')
+    assert corridor.build() == [] and corridor.bounds['max_x'] < 400000
+    assert corridor.export('svg', 190000, 260000).startswith('<svg')
+
+
+def test_mesh_solids_are_closed_and_written_as_glb_and_stl():
+    import json
+    import struct
+    from mesh_builder import BridgeMeshBuilder
+
+    params = dict(SAMPLE_PARAMS, SKEW=15, NSPAN=6, LBRIDGE=60000)
+    builder = BridgeMeshBuilder(params)
+    parts = builder.build()
+    volumes = {}
+    for name, positions, triangles in parts:
+        # Every edge is shared by exactly two triangles, in opposite directions
+        edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]])
+        assert len(np.unique(edges, axis=0)) == len(edges)
+        assert len(np.unique(np.vstack([edges, edges[:, ::-1]]), axis=0)) == len(edges)
+        corners = positions[triangles]
+        volumes[name] = np.einsum('ij,ij->', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])) / 6
+    # Five pier footings of FUTW x FUTL x FUTD, outward facing
+    assert np.isclose(volumes['pier_footing'], 5 * 3000 * 8000 * 2000)
+    assert all(volume > 0 for volume in volumes.values())
+
+    glb = builder.to_glb()
+    magic, version, length = struct.unpack('<4sII', glb[:12])
+    assert (magic, version, length) == (b'glTF', 2, len(glb))
+    json_length, = struct.unpack('<I', glb[12:16])
+    gltf = json.loads(glb[20:20 + json_length])
+    assert [mesh['name'] for mesh in gltf['meshes']] == [name for name, _, _ in parts]
+    assert sum(a['count'] for a in gltf['accessors'] if a['type'] == 'SCALAR') == 3 * sum(len(t) for _, _, t in parts)
+
+    stl = builder.to_stl()
+    count, = struct.unpack('<I', stl[80:84])
+    assert count == sum(len(t) for _, _, t in parts) and len(stl) == 84 + 50 * count
+
+
+def test_takeoff_matches_mesh_volumes_and_vectorizes_over_variants():
+    from mesh_builder import BridgeMeshBuilder
+    from quantity_takeoff import quantity_takeoff, TAKEOFF_COMPONENTS
+
+    params = dict(SAMPLE_PARAMS, SKEW=15, NSPAN=6, LBRIDGE=60000, ARFL=104000)
+    single = quantity_takeoff(params)
+    for name, positions, triangles in BridgeMeshBuilder(params).build():
+        corners = positions[triangles]
+        volume = np.einsum('ij,ij->', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])) / 6 * 1e-9
+        # Mesh shafts have polygonal ends
+        assert np.isclose(single[f'{name}_concrete'], volume, rtol=2e-3)
+    assert np.isclose(single['total_concrete'], sum(single[f'{name}_concrete'] for name in TAKEOFF_COMPONENTS))
+
+    # Abutments span the deck between the outer kerb faces, along the skew
+    width = (7500 + 2 * 300) / np.cos(np.radians(15))
+    wall = BridgeDrawingEngine(params).plan_templates()['abutment_wall']
+    assert np.isclose(np.ptp(wall[:, 1]), width)
+    assert np.isclose(single['abutment_cap_concrete'], 2 * 1200 * width * 800 * 1e-9)
+
+    # A design matrix row gives the same quantities as the parameter set alone
+    variants = {'NSPAN': [1, 3, 6], 'SKEW': [0, 15, 15], 'LBRIDGE': 60000, 'SLBTHC': [900, 1000, 1200]}
+    batch = quantity_takeoff(dict(SAMPLE_PARAMS, **variants))
+    for i in range(3):
+        row = quantity_takeoff(dict(SAMPLE_PARAMS, **{key: np.take(value, i) if np.ndim(value) else value
+                                                      for key, value in variants.items()}))
+        assert all(np.isclose(batch[key][i], value) for key, value in row.items())
+    assert batch['pier_footing_concrete'][0] == 0
+
+    # Equal spans in a table take off the same piers
+    table = dict(params, SPAN_TABLE=[{'length': 10000}] * 6)
+    assert np.isclose(quantity_takeoff(table)['total_formwork'], single['total_formwork'])
@@ -0,0 +1,179 @@
+# utils/dimensions.py
+"""
+Linear dimensions: collection, de-duplication, native DXF output through one
+shared dimstyle and reusable blocks, and explicit geometry for PDF and SVG
+"""
+
+import logging
+import math
+
+import numpy as np
+
+DIMSTYLE_NAME = 'BRIDGE'
+DIM_LAYER = 'dimensions'
+
+# Legacy PMB100 dimstyle, in paper mm (multiplied by SCALE1)
+DIM_ARROW = 1.5
+DIM_EXTEND = 4.0
+DIM_OFFSET = 4.0
+DIM_TEXT = 4.0
+DIM_GAP = 1.0
+
+
+def make_dimension(p1, p2, base, angle=0, text=None):
+    """Linear dimension between p1 and p2 with its dimension line through base"""
+    return {
+        'p1': (float(p1[0]), float(p1[1])),
+        'p2': (float(p2[0]), float(p2[1])),
+        'base': (float(base[0]), float(base[1])),
+        'angle': float(angle),
+        'text': text
+    }
+
+
+def _frame(dim):
+    """Measuring direction u and normal n of a dimension"""
+    a = math.radians(dim['angle'])
+    return (math.cos(a), math.sin(a)), (-math.sin(a), math.cos(a))
+
+
+def dedupe_dimensions(dims, tolerance=1.0):
+    """Drop dimensions that measure the same points on the same dimension line"""
+    seen = set()
+    result = []
+    for dim in dims:
+        (ux, uy), (nx, ny) = _frame(dim)
+        ends = sorted((round(x / tolerance), round(y / tolerance)) for x, y in (dim['p1'], dim['p2']))
+        offset = round((nx * dim['base'][0] + ny * dim['base'][1]) / tolerance)
+        key = (tuple(ends), offset, round(dim['angle'], 6), dim['text'])
+        if key not in seen:
+            seen.add(key)
+            result.append(dim)
+    return result
+
+
+def _shape_key(dim, tolerance=1.0):
+    """Key of a dimension's geometry relative to its first point"""
+    x0, y0 = dim['p1']
+    return (round((dim['p2'][0] - x0) / tolerance), round((dim['p2'][1] - y0) / tolerance),
+            round((dim['base'][0] - x0) / tolerance), round((dim['base'][1] - y0) / tolerance),
+            round(dim['angle'], 6), dim['text'])
+
+
+def dimension_geometry(dims, scale1=100):
+    """Extension lines, dimension lines and oblique ticks of all dimensions.
+
+    Returns an (n, 4) segments array and a list of (angle, x, y, texts)
+    label groups, one per dimension angle, for the columnar element path.
+    """
+    if not dims:
+        return np.zeros((0, 4)), []
+
+    p1 = np.array([d['p1'] for d in dims])
+    p2 = np.array([d['p2'] for d in dims])
+    base = np.array([d['base'] for d in dims])
+    angle = np.array([d['angle'] for d in dims])
+    a = np.radians(angle)
+    u = np.column_stack([np.cos(a), np.sin(a)])
+    n = np.column_stack([-np.sin(a), np.cos(a)])
+
+    # Dimension line ends: the points projected onto the line through base
+    offset = np.sum(base * n, axis=1)[:, None]
+    t1 = np.sum(p1 * u, axis=1)[:, None]
+    t2 = np.sum(p2 * u, axis=1)[:, None]
+    d1 = t1 * u + offset * n
+    d2 = t2 * u + offset * n
+
+    # Extension lines run from the object towards and past the dimension line
+    side1 = np.sign(offset - np.sum(p1 * n, axis=1)[:, None])
+    side2 = np.sign(offset - np.sum(p2 * n, axis=1)[:, None])
+    exo, exe, asz = DIM_OFFSET * scale1, DIM_EXTEND * scale1, DIM_ARROW * scale1
+    tick = (u + n) * (asz / 2 / math.sqrt(2))
+
+    coords = np.concatenate([
+        np.hstack([p1 + side1 * exo * n, d1 + side1 * exe * n]),
+        np.hstack([p2 + side2 * exo * n, d2 + side2 * exe * n]),
+        np.hstack([d1, d2]),
+        np.hstack([d1 - tick, d1 + tick]),
+        np.hstack([d2 - tick, d2 + tick]),
+    ])
+    # Points lying on the dimension line have no extension line
+    keep = np.any(coords[:, :2] != coords[:, 2:], axis=1)
+    keep[:2 * len(dims)] &= np.concatenate([side1[:, 0] != 0, side2[:, 0] != 0])
+    coords = coords[keep]
+
+    centre = (d1 + d2) / 2 + n * DIM_GAP * scale1
+    values = np.abs(t2 - t1)[:, 0]
+    texts = np.array([d['text'] if d['text'] is not None else f"{value:.0f}"
+                      for d, value in zip(dims, values.tolist())])
+    labels = []
+    for value in np.unique(angle):
+        rows = angle == value
+        labels.append((float(value), centre[rows, 0], centre[rows, 1], texts[rows]))
+    return coords, labels
+
+
+def setup_dimstyle(doc, scale1=100):
+    """Create the shared dimension style once per document and return its name"""
+    if doc.dimstyles.has_entry(DIMSTYLE_NAME):
+        return DIMSTYLE_NAME
+    dimstyle = doc.dimstyles.new(DIMSTYLE_NAME)
+    dimstyle.dxf.dimasz = DIM_ARROW * scale1
+    dimstyle.dxf.dimtsz = DIM_ARROW * scale1  # Oblique ticks, as in the PDF and SVG
+    dimstyle.dxf.dimexe = DIM_EXTEND * scale1
+    dimstyle.dxf.dimexo = DIM_OFFSET * scale1
+    dimstyle.dxf.dimtxt = DIM_TEXT * scale1
+    dimstyle.dxf.dimgap = DIM_GAP * scale1
+    dimstyle.dxf.dimtad = 1  # Text above the dimension line
+    dimstyle.dxf.dimdec = 0
+    dimstyle.dxf.dimlfac = 1
+    return DIMSTYLE_NAME
+
+
+def _add_linear_dim(layout, dim, origin, dimstyle, layer):
+    """Add and render one DIMENSION entity with p1 moved to origin"""
+    dx, dy = origin[0] - dim['p1'][0], origin[1] - dim['p1'][1]
+    layout.add_linear_dim(
+        base=(dim['base'][0] + dx, dim['base'][1] + dy),
+        p1=origin,
+        p2=(dim['p2'][0] + dx, dim['p2'][1] + dy),
+        angle=dim['angle'],
+        text=dim['text'] if dim['text'] is not None else '<>',
+        dimstyle=dimstyle,
+        dxfattribs={'layer': layer}
+    ).render()
+
+
+def write_dxf_dimensions(doc, layout, dims, scale1=100, layer='DIMENSIONS', reuse_blocks=True):
+    """Write dimensions as native DXF DIMENSION entities.
+
+    Every dimension uses the one shared dimstyle. With reuse_blocks,
+    dimensions that repeat with the same shape (e.g. at every pier) are
+    rendered once into a block and inserted at each position, since
+    rendering builds an anonymous block per entity.
+    """
+    dimstyle = setup_dimstyle(doc, scale1)
+    if layer not in doc.layers:
+        doc.layers.add(layer)
+
+    groups = {}
+    for dim in dedupe_dimensions(dims):
+        groups.setdefault(_shape_key(dim) if reuse_blocks else id(dim), []).append(dim)
+
+    renders = 0
+    for members in groups.values():
+        if len(members) == 1:
+            _add_linear_dim(layout, members[0], members[0]['p1'], dimstyle, layer)
+            renders += 1
+            continue
+        name = f"{DIMSTYLE_NAME}_DIM_{len(doc.blocks)}"
+        while name in doc.blocks:
+            name += '_'
+        block = doc.blocks.new(name)
+        _add_linear_dim(block, members[0], (0.0, 0.0), dimstyle, layer)
+        renders += 1
+        for dim in members:
+            layout.add_blockref(name, dim['p1'], dxfattribs={'layer': layer})
+
+    logging.info(f"Wrote {len(dims)} dimensions with {renders} rendered")
+    return renders
@@ -0,0 +1,374 @@
+# utils/geometry.py
+"""
+Geometry post-processing for drawing elements: endpoint snapping,
+collinear de-duplication and chaining of segments into polylines
+"""
+
+import bisect
+import logging
+import math
+
+import numpy as np
+
+from utils.labels import batch_text_length
+
+
+def snap_points(points, tolerance=1.0):
+    """Snap points onto shared representatives through a hash grid"""
+    grid = {}
+    snapped = []
+    tol2 = tolerance * tolerance
+
+    for x, y in points:
+        cx = int(math.floor(x / tolerance))
+        cy = int(math.floor(y / tolerance))
+        found = None
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for px, py in grid.get((gx, gy), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 <= tol2:
+                        found = (px, py)
+                        break
+                if found:
+                    break
+            if found:
+                break
+        if found is None:
+            found = (x, y)
+            grid.setdefault((cx, cy), []).append(found)
+        snapped.append(found)
+
+    return snapped
+
+
+def _snap_segments(segments, tolerance):
+    """Snap segment endpoints and drop segments that collapse to a point"""
+    points = []
+    for seg in segments:
+        points.append((seg['x1'], seg['y1']))
+        points.append((seg['x2'], seg['y2']))
+    snapped = snap_points(points, tolerance)
+
+    result = []
+    for i, seg in enumerate(segments):
+        p1 = snapped[2 * i]
+        p2 = snapped[2 * i + 1]
+        if p1 == p2:
+            continue
+        seg = dict(seg)
+        seg['x1'], seg['y1'] = p1
+        seg['x2'], seg['y2'] = p2
+        result.append(seg)
+    return result
+
+
+def _line_key(seg, tolerance):
+    """Canonical direction and offset of the infinite line through a segment"""
+    dx = seg['x2'] - seg['x1']
+    dy = seg['y2'] - seg['y1']
+    length = math.hypot(dx, dy)
+    ux, uy = dx / length, dy / length
+    if ux < 0 or (ux == 0 and uy < 0):
+        ux, uy = -ux, -uy
+    offset = -uy * seg['x1'] + ux * seg['y1']
+    angle = math.atan2(uy, ux)
+    key = (round(angle * 1e6), round(offset / tolerance))
+    return key, ux, uy
+
+
+def _subtract_intervals(t0, t1, covered):
+    """Parts of [t0, t1] not inside the sorted, disjoint covered intervals"""
+    pieces = []
+    start = t0
+    i = bisect.bisect_right(covered, [t0, math.inf]) - 1
+    i = max(i, 0)
+    while i < len(covered) and covered[i][0] < t1:
+        c0, c1 = covered[i]
+        if c1 > start:
+            if c0 > start:
+                pieces.append((start, c0))
+            start = max(start, c1)
+        i += 1
+    if start < t1:
+        pieces.append((start, t1))
+    return pieces
+
+
+def _add_interval(t0, t1, covered):
+    """Insert [t0, t1] into the sorted, disjoint covered intervals"""
+    i = bisect.bisect_left(covered, [t0, -math.inf])
+    if i > 0 and covered[i - 1][1] >= t0:
+        i -= 1
+    j = i
+    while j < len(covered) and covered[j][0] <= t1:
+        t0 = min(t0, covered[j][0])
+        t1 = max(t1, covered[j][1])
+        j += 1
+    covered[i:j] = [[t0, t1]]
+
+
+def remove_overlaps(segments, tolerance=1.0):
+    """Remove duplicate and overlapping collinear segments.
+
+    Where segments overlap, the thicker one (then the earlier one) keeps
+    the shared portion and the others are trimmed to what is left.
+    """
+    groups = {}
+    for index, seg in enumerate(segments):
+        key, ux, uy = _line_key(seg, tolerance)
+        groups.setdefault(key, []).append((index, seg, ux, uy))
+
+    kept = []
+    for members in groups.values():
+        if len(members) == 1:
+            kept.append(members[0][:2])
+            continue
+
+        members.sort(key=lambda m: (-m[1]['width'], m[0]))
+        covered = []
+        for index, seg, ux, uy in members:
+            ta = ux * seg['x1'] + uy * seg['y1']
+            tb = ux * seg['x2'] + uy * seg['y2']
+            t0, t1 = min(ta, tb), max(ta, tb)
+            for p0, p1 in _subtract_intervals(t0, t1, covered):
+                if p1 - p0 <= tolerance:
+                    continue
+                if p0 == t0 and p1 == t1:
+                    kept.append((index, seg))
+                    continue
+                piece = dict(seg)
+                # Project the piece back onto the segment's own line
+                bx = seg['x1'] - ux * ta
+                by = seg['y1'] - uy * ta
+                piece['x1'], piece['y1'] = bx + ux * p0, by + uy * p0
+                piece['x2'], piece['y2'] = bx + ux * p1, by + uy * p1
+                kept.append((index, piece))
+            _add_interval(t0, t1, covered)
+
+    kept.sort(key=lambda m: m[0])
+    return [seg for _, seg in kept]
+
+
+def _is_collinear(a, b, c, tolerance):
+    """True when b lies on the straight line from a to c"""
+    cross = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    length = math.hypot(c[0] - a[0], c[1] - a[1])
+    if length == 0:
+        return False
+    dot = (b[0] - a[0]) * (c[0] - a[0]) + (b[1] - a[1]) * (c[1] - a[1])
+    return abs(cross) / length <= tolerance and 0 < dot < length * length
+
+
+def _drop_collinear(points, closed, tolerance):
+    """Remove intermediate vertices that do not change direction"""
+    result = []
+    for p in points:
+        while len(result) >= 2 and _is_collinear(result[-2], result[-1], p, tolerance):
+            result.pop()
+        result.append(p)
+    if closed:
+        while len(result) >= 3 and _is_collinear(result[-2], result[-1], result[0], tolerance):
+            result.pop()
+        while len(result) >= 3 and _is_collinear(result[-1], result[0], result[1], tolerance):
+            result.pop(0)
+    return result
+
+
+def chain_segments(segments, tolerance=1.0):
+    """Join segments sharing endpoints into open and closed polylines.
+
+    Segments are only joined within the same layer and width. Chains run
+    between nodes of degree other than two; what is left are closed loops.
+    """
+    groups = {}
+    for seg in segments:
+        groups.setdefault((seg['layer'], seg['width']), []).append(seg)
+
+    result = []
+    for (layer, width), group in groups.items():
+        adjacency = {}
+        edges = []
+        for seg in group:
+            p1 = (seg['x1'], seg['y1'])
+            p2 = (seg['x2'], seg['y2'])
+            edge_id = len(edges)
+            edges.append((p1, p2))
+            adjacency.setdefault(p1, []).append(edge_id)
+            adjacency.setdefault(p2, []).append(edge_id)
+
+        used = [False] * len(edges)
+
+        def walk(start, edge_id):
+            points = [start]
+            node = start
+            while True:
+                used[edge_id] = True
+                a, b = edges[edge_id]
+                node = b if a == node else a
+                points.append(node)
+                if node == start or len(adjacency[node]) != 2:
+                    return points
+                edge_id = next((e for e in adjacency[node] if not used[e]), None)
+                if edge_id is None:
+                    return points
+
+        chains = []
+        for node, node_edges in adjacency.items():
+            if len(node_edges) == 2:
+                continue
+            for edge_id in node_edges:
+                if not used[edge_id]:
+                    chains.append(walk(node, edge_id))
+        for edge_id, (a, _) in enumerate(edges):
+            if not used[edge_id]:
+                chains.append(walk(a, edge_id))
+
+        for points in chains:
+            closed = len(points) > 3 and points[0] == points[-1]
+            if closed:
+                points = points[:-1]
+            points = _drop_collinear(points, closed, tolerance)
+            if len(points) == 2 and not closed:
+                (x1, y1), (x2, y2) = points
+                result.append({
+                    'type': 'line',
+                    'x1': x1, 'y1': y1,
+                    'x2': x2, 'y2': y2,
+                    'layer': layer,
+                    'width': width
+                })
+            else:
+                result.append({
+                    'type': 'polyline',
+                    'points': points,
+                    'closed': closed,
+                    'layer': layer,
+                    'width': width
+                })
+
+    return result
+
+
+def merge_segments(elements, tolerance=1.0):
+    """Snap, de-duplicate and chain line elements into polylines.
+
+    Non-line elements are passed through unchanged. Tolerance is in
+    drawing units (mm).
+    """
+    lines = [e for e in elements if e['type'] == 'line']
+    others = [e for e in elements if e['type'] != 'line']
+
+    segments = _snap_segments(lines, tolerance)
+    segments = remove_overlaps(segments, tolerance)
+    segments = _snap_segments(segments, tolerance)
+    merged = chain_segments(segments, tolerance)
+
+    logging.info(f"Merged {len(lines)} line segments into {len(merged)} elements")
+    return merged + others
+
+
+def element_bbox(elem):
+    """Axis-aligned bounding box (min_x, min_y, max_x, max_y) of an element"""
+    if elem['type'] == 'line':
+        return (min(elem['x1'], elem['x2']), min(elem['y1'], elem['y2']),
+                max(elem['x1'], elem['x2']), max(elem['y1'], elem['y2']))
+    if elem['type'] == 'segments':
+        coords = elem['coords']
+        xs, ys = coords[:, 0::2], coords[:, 1::2]
+    elif elem['type'] == 'hatch':
+        xs, ys = elem['paths'][:, :, 0], elem['paths'][:, :, 1]
+    else:
+        points = np.asarray(elem['points'], dtype=float)
+        xs, ys = points[:, 0], points[:, 1]
+    return (float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()))
+
+
+def union_bbox(boxes):
+    """Box around all boxes, or None when there are none"""
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def clip_batch(item, min_x, min_y, max_x, max_y):
+    """Cut a columnar element or text batch down to the rows touching a box.
+
+    Plain elements are returned unchanged; long polylines come back as the
+    segments that intersect the box and hatches as the loops that do.
+    """
+    kind = item.get('type')
+    if kind == 'text_batch':
+        x, y = np.asarray(item['x']), np.asarray(item['y'])
+        reach = item['size'] * batch_text_length(item)
+        mask = ((x >= min_x - reach) & (x <= max_x + reach) &
+                (y >= min_y - reach) & (y <= max_y + reach))
+        clipped = dict(item)
+        clipped['x'], clipped['y'] = x[mask], y[mask]
+        clipped['text'] = item['text'][mask]
+        return clipped
+
+    if kind == 'hatch':
+        xs, ys = item['paths'][:, :, 0], item['paths'][:, :, 1]
+        mask = ((xs.min(axis=1) <= max_x) & (xs.max(axis=1) >= min_x) &
+                (ys.min(axis=1) <= max_y) & (ys.max(axis=1) >= min_y))
+        return dict(item, paths=item['paths'][mask])
+
+    if kind == 'segments':
+        coords = item['coords']
+    elif kind == 'polyline' and isinstance(item['points'], np.ndarray):
+        points = item['points']
+        if item['closed']:
+            points = np.vstack([points, points[:1]])
+        coords = np.hstack([points[:-1], points[1:]])
+    else:
+        return item
+
+    xs, ys = coords[:, 0::2], coords[:, 1::2]
+    mask = ((xs.min(axis=1) <= max_x) & (xs.max(axis=1) >= min_x) &
+            (ys.min(axis=1) <= max_y) & (ys.max(axis=1) >= min_y))
+    return {'type': 'segments', 'coords': coords[mask],
+            'layer': item['layer'], 'width': item['width']}
+
+
+# Abutment footings project this far beyond the wall at each side in plan, mm
+ABUTMENT_FOOTING_PROJECTION = 150
+
+
+def abutment_width(ccbr, kerbw, c):
+    """Transverse length of an abutment along the skew: the deck between the
+    outer kerb faces, (CCBR + 2 KERBW) / cos skew as in the original.
+    Broadcasts over arrays of design variants."""
+    return (ccbr + 2 * kerbw) / c
+
+
+def stadium_outline(width, length, arc_segments=16):
+    """Pier outline centred on the origin: straight sides of the given length
+    along y, closed by semicircular ends of diameter width (m x 2 vertices).
+    Arrays of widths and lengths give one outline per pier (n, m, 2)."""
+    r = np.asarray(width, dtype=float)[..., None] / 2
+    half = np.asarray(length, dtype=float)[..., None] / 2
+    t = np.linspace(0, math.pi, arc_segments + 1)
+    top = np.stack(np.broadcast_arrays(r * np.cos(t), half + r * np.sin(t)), axis=-1)
+    return np.concatenate([top, -top], axis=-2)
+
+
+def element_segments(elem):
+    """Segments (n x 4) of a line, polyline or segments element"""
+    if elem['type'] == 'segments':
+        return elem['coords']
+    if elem['type'] == 'line':
+        return np.array([[elem['x1'], elem['y1'], elem['x2'], elem['y2']]], dtype=float)
+    points = np.asarray(elem['points'], dtype=float)
+    if elem['closed']:
+        points = np.vstack([points, points[:1]])
+    return np.hstack([points[:-1], points[1:]])
+
+
+def outline_segments(outlines, closed=True):
+    """Segments (n x 4) of a stack of polylines shaped (k, m, 2)"""
+    outlines = np.asarray(outlines, dtype=float)
+    ends = np.roll(outlines, -1, axis=1) if closed else outlines[:, 1:]
+    starts = outlines if closed else outlines[:, :-1]
+    return np.concatenate([starts, ends], axis=2).reshape(-1, 4)
@@ -0,0 +1,97 @@
+# utils/hatching.py
+"""
+Section hatching: concrete and earth fills stored as boundary loops plus a
+pattern id, written as native DXF HATCH entities and, in PDF and SVG, as one
+shared pattern cell per pattern instead of exploded lines
+"""
+
+import logging
+
+import numpy as np
+
+HATCH_LAYER = 'HATCHING'
+
+# Pattern cells in paper mm: cell size, the segments (x1, y1, x2, y2) that
+# repeat in it, and the predefined DXF pattern with its scale per paper mm
+HATCH_PATTERNS = {
+    'concrete': {
+        'cell': 4.0,
+        'segments': [(0.0, 0.0, 4.0, 4.0),
+                     (1.2, 2.6, 2.0, 2.6), (2.0, 2.6, 1.6, 3.2), (1.6, 3.2, 1.2, 2.6),
+                     (2.8, 0.8, 3.0, 0.9)],
+        'dxf': 'AR-CONC',
+        'dxf_scale': 0.05,
+    },
+    'earth': {
+        'cell': 4.0,
+        'segments': [(0.0, 0.25, 2.0, 0.25), (0.0, 1.0, 2.0, 1.0), (0.0, 1.75, 2.0, 1.75),
+                     (2.25, 2.0, 2.25, 4.0), (3.0, 2.0, 3.0, 4.0), (3.75, 2.0, 3.75, 4.0)],
+        'dxf': 'EARTH',
+        'dxf_scale': 4.0 / 6.35,  # EARTH repeats every 6.35 units
+    },
+}
+
+# Depth of the earth strip hatched below a ground line, in paper mm
+EARTH_DEPTH = 3.0
+
+# Stroke width of pattern lines, in units of element width, and the smallest
+# pattern cell (SVG pixels or PDF points) still drawn; finer cells are noise
+HATCH_LINE_WIDTH = 0.5
+HATCH_MIN_CELL = 1.0
+
+
+def make_hatch(paths, pattern, scale, layer=HATCH_LAYER):
+    """Hatch of closed boundary loops (k, m, 2) with a pattern from HATCH_PATTERNS,
+    scale being drawing mm per paper mm of the pattern"""
+    if pattern not in HATCH_PATTERNS:
+        raise ValueError(f"Unknown hatch pattern: {pattern}")
+    return {
+        'type': 'hatch',
+        'paths': np.asarray(paths, dtype=float).reshape(len(paths), -1, 2),
+        'pattern': pattern,
+        'scale': float(scale),
+        'layer': layer
+    }
+
+
+def rectangle_loops(x0, y0, x1, y1):
+    """Counter-clockwise rectangle loops (k, 4, 2) from arrays of corners"""
+    x0, y0, x1, y1 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x0, y0, x1, y1)))
+    return np.stack([np.column_stack([x0, y0]), np.column_stack([x1, y0]),
+                     np.column_stack([x1, y1]), np.column_stack([x0, y1])], axis=1)
+
+
+def strip_loop(points, depth, floor=None):
+    """Loop (1, m, 2) around a polyline and its copy depth below it, cut off at floor"""
+    points = np.asarray(points, dtype=float)
+    lower = points[::-1].copy()
+    if floor is None:
+        lower[:, 1] -= depth
+    else:
+        lower[:, 1] = np.minimum(np.maximum(lower[:, 1] - depth, floor), lower[:, 1])
+    return np.vstack([points, lower])[None]
+
+
+def pattern_segments(pattern, cell):
+    """Segments of one pattern cell scaled to a cell of the given size"""
+    spec = HATCH_PATTERNS[pattern]
+    return np.array(spec['segments'], dtype=float) * (cell / spec['cell'])
+
+
+def write_dxf_hatches(doc, layout, hatches):
+    """Write each hatch as one native HATCH entity with a boundary path per loop"""
+    count = 0
+    for hatch in hatches:
+        if not len(hatch['paths']):
+            continue
+        layer = hatch['layer']
+        if layer not in doc.layers:
+            doc.layers.add(layer)
+        spec = HATCH_PATTERNS[hatch['pattern']]
+        entity = layout.add_hatch(dxfattribs={'layer': layer})
+        entity.set_pattern_fill(spec['dxf'], scale=spec['dxf_scale'] * hatch['scale'])
+        for loop in hatch['paths'].tolist():
+            entity.paths.add_polyline_path(loop, is_closed=True)
+        count += 1
+    logging.info(f"Wrote {count} hatches")
+    return count
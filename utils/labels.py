@@ -0,0 +1,223 @@
+# utils/labels.py
+"""
+Text measurement and label placement with collision avoidance
+"""
+
+import math
+
+import numpy as np
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from utils.spatial_index import GridIndex
+
+# Baseline-to-baseline distance of multi-line texts, in text heights
+LINE_SPACING = 1.2
+
+# Candidate shifts tried in order, in label widths and heights
+CANDIDATE_SHIFTS = [
+    (0, 0), (0, 1), (0, -1), (0, 2), (0, -2),
+    (0.75, 0), (-0.75, 0), (0.75, 1), (-0.75, 1), (0.75, -1), (-0.75, -1),
+]
+
+_char_widths = {}
+
+
+def char_width(char, font='Helvetica'):
+    """Advance width of a character at unit size, measured once per font"""
+    key = (font, char)
+    width = _char_widths.get(key)
+    if width is None:
+        width = stringWidth(char, font, 1)
+        _char_widths[key] = width
+    return width
+
+
+def split_lines(text):
+    """Lines of a text with their baseline offsets above the text's y, in heights"""
+    lines = text.split('\n')
+    return [(line, (len(lines) - 1 - i) * LINE_SPACING) for i, line in enumerate(lines)]
+
+
+def text_extent(text, size, font='Helvetica'):
+    """Width and height of a (possibly multi-line) text at the given size"""
+    lines = text.split('\n')
+    width = max(sum(char_width(c, font) for c in line) for line in lines) * size
+    height = size * (1 + LINE_SPACING * (len(lines) - 1))
+    return width, height
+
+
+def iter_texts(texts):
+    """Yield plain text elements, expanding columnar text batches"""
+    for text in texts:
+        if text.get('type') != 'text_batch':
+            yield text
+            continue
+        fmt = text.get('format')
+        for x, y, value in zip(text['x'].tolist(), text['y'].tolist(), text['text'].tolist()):
+            yield {
+                'x': x, 'y': y,
+                'text': fmt % value if fmt else value,
+                'size': text['size'],
+                'layer': text['layer'],
+                'rotation': text['rotation']
+            }
+
+
+def batch_text_length(batch):
+    """Upper bound on the number of characters of any label in a text batch"""
+    if not len(batch['text']):
+        return 0
+    if batch.get('format'):
+        values = batch['text']
+        return max(len(batch['format'] % values.min()), len(batch['format'] % values.max()))
+    return max(len(s) for s in batch['text'])
+
+
+def label_bbox(text, font='Helvetica'):
+    """Bounding box of a text element centred on x with its last baseline at y.
+
+    Rotated texts turn about (x, y); a text batch gets the box of all its labels.
+    """
+    if text.get('type') == 'text_batch':
+        if not len(text['x']):
+            return (0.0, 0.0, 0.0, 0.0)
+        reach = batch_text_length(text) * text['size']
+        return (float(np.min(text['x'])) - reach, float(np.min(text['y'])) - reach,
+                float(np.max(text['x'])) + reach, float(np.max(text['y'])) + reach)
+
+    width, height = text_extent(text['text'], text['size'], font)
+    rotation = text.get('rotation', 0)
+    if not rotation:
+        return (text['x'] - width / 2, text['y'], text['x'] + width / 2, text['y'] + height)
+
+    angle = math.radians(rotation)
+    s, c = math.sin(angle), math.cos(angle)
+    corners = [(-width / 2, 0), (width / 2, 0), (width / 2, height), (-width / 2, height)]
+    xs = [text['x'] + dx * c - dy * s for dx, dy in corners]
+    ys = [text['y'] + dx * s + dy * c for dx, dy in corners]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def text_widths(strings, font='Helvetica'):
+    """Unit-size widths of single-line strings, from one table lookup per character"""
+    strings = np.asarray(strings, dtype=str)
+    if not strings.size or not strings.itemsize:
+        return np.zeros(len(strings))
+    codes = strings.view(np.uint32).reshape(len(strings), -1)
+    unique, inverse = np.unique(codes, return_inverse=True)
+    table = np.array([char_width(chr(code), font) if code else 0.0 for code in unique.tolist()])
+    return table[inverse].reshape(codes.shape).sum(axis=1)
+
+
+def _batch_label_boxes(batch, indices, font='Helvetica'):
+    """label_bbox() of the labels of a text batch at indices, as (k, 4) boxes"""
+    values = batch['text'][indices]
+    fmt = batch.get('format')
+    strings = np.array([fmt % value for value in values.tolist()] if fmt else values, dtype=str)
+    x, y = batch['x'][indices], batch['y'][indices]
+    if len(strings) and np.char.count(strings, '\n').any():
+        return np.array([label_bbox({'x': float(lx), 'y': float(ly), 'text': str(t), 'size': batch['size'],
+                                     'rotation': batch['rotation']}, font)
+                         for lx, ly, t in zip(x.tolist(), y.tolist(), strings.tolist())]).reshape(-1, 4)
+
+    half, height = text_widths(strings, font) * batch['size'] / 2, batch['size']
+    angle = math.radians(batch.get('rotation') or 0)
+    s, c = math.sin(angle), math.cos(angle)
+    # Corners (-half, 0), (half, 0), (half, height), (-half, height) turned about (x, y)
+    dx = np.stack([-half * c, half * c, half * c - height * s, -half * c - height * s])
+    dy = np.stack([-half * s, half * s, half * s + height * c, -half * s + height * c])
+    return np.column_stack([x + dx.min(axis=0), y + dy.min(axis=0), x + dx.max(axis=0), y + dy.max(axis=0)])
+
+
+def _cell_codes(cx, cy):
+    """One integer per grid cell"""
+    return np.asarray(cx, dtype=np.int64) * (1 << 32) + (np.asarray(cy, dtype=np.int64) + (1 << 31))
+
+
+def _fixed_obstacles(texts, movable, extents, cell, gap, font):
+    """(key, bbox) of the labels of text batches and rotated texts that can
+    reach a candidate position of a movable label. Batch labels are first
+    screened in one array pass by the grid cells of their conservative
+    boxes, so only labels near a movable one are measured."""
+    # Grid cells of every movable label's candidate area
+    reach_x = max(abs(sx) for sx, _ in CANDIDATE_SHIFTS)
+    reach_y = max(abs(sy) for _, sy in CANDIDATE_SHIFTS)
+    occupied = set()
+    for i in movable:
+        width, height = extents[i]
+        pad = gap * texts[i]['size']
+        dx = reach_x * (width + pad) + (width + pad) / 2
+        dy = reach_y * (height + pad) + height + pad / 2
+        cx0, cy0 = math.floor((texts[i]['x'] - dx) / cell), math.floor((texts[i]['y'] - dy) / cell)
+        cx1, cy1 = math.floor((texts[i]['x'] + dx) / cell), math.floor((texts[i]['y'] + dy) / cell)
+        occupied.update((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+    occupied = _cell_codes(*zip(*occupied))
+
+    movable = set(movable)
+    for i, text in enumerate(texts):
+        if i in movable:
+            continue
+        if text.get('type') != 'text_batch':
+            yield ('fixed', i, 0), label_bbox(text, font)
+            continue
+        if not len(text['x']):
+            continue
+        reach = batch_text_length(text) * text['size']
+        x, y = np.asarray(text['x'], dtype=float), np.asarray(text['y'], dtype=float)
+        cx0, cy0 = np.floor((x - reach) / cell), np.floor((y - reach) / cell)
+        cx1, cy1 = np.floor((x + reach) / cell), np.floor((y + reach) / cell)
+        # Boxes over more than two cells a side are kept without screening
+        near = (cx1 - cx0 > 1) | (cy1 - cy0 > 1)
+        for cx in (cx0, cx1):
+            for cy in (cy0, cy1):
+                near |= np.isin(_cell_codes(cx, cy), occupied)
+        near = np.flatnonzero(near)
+        for j, bbox in zip(near.tolist(), _batch_label_boxes(text, near, font).tolist()):
+            yield ('fixed', i, j), tuple(bbox)
+
+
+def place_labels(texts, font='Helvetica', gap=0.1):
+    """Move labels off each other and return new text elements.
+
+    Larger labels are placed first; each label takes the first candidate
+    position that does not overlap an already placed one, found through a
+    grid index so the whole pass is O(n log n). Labels with no free
+    candidate stay where they were. Rotated labels and text batches keep
+    their positions, and every label of them is an obstacle from the start.
+    """
+    movable = [i for i, t in enumerate(texts)
+               if t.get('type') != 'text_batch' and not t.get('rotation', 0)]
+    if not movable:
+        return list(texts)
+
+    extents = {i: text_extent(texts[i]['text'], texts[i]['size'], font) for i in movable}
+    cell = sum(max(w, h) for w, h in extents.values()) / len(extents) * 2
+    placed = GridIndex(cell)
+    for key, bbox in _fixed_obstacles(texts, movable, extents, cell, gap, font):
+        placed.insert(key, bbox)
+
+    order = sorted(movable, key=lambda i: (-texts[i]['size'], i))
+    result = list(texts)
+    for i in order:
+        text = texts[i]
+        width, height = extents[i]
+        pad = gap * text['size']
+        half = pad / 2
+
+        position = (text['x'], text['y'])
+        for sx, sy in CANDIDATE_SHIFTS:
+            x = text['x'] + sx * (width + pad)
+            y = text['y'] + sy * (height + pad)
+            bbox = (x - width / 2 - half, y - half, x + width / 2 + half, y + height + half)
+            if not placed.query(*bbox):
+                position = (x, y)
+                break
+
+        x, y = position
+        placed.insert(i, (x - width / 2, y, x + width / 2, y + height))
+        if position != (text['x'], text['y']):
+            text = dict(text)
+            text['x'], text['y'] = position
+        result[i] = text
+
+    return result
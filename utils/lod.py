@@ -0,0 +1,266 @@
+# utils/lod.py
+"""
+Level-of-detail simplification of drawing data for a given output scale.
+
+All thresholds are in output pixels. With a tolerance of t pixels every
+vertex that is kept is drawn within t pixels of its true position, every
+simplified polyline stays within t pixels of the original, and anything
+dropped outright is smaller than t pixels. Tick thinning and label culling
+are deliberate omissions controlled by their own pixel thresholds.
+"""
+
+import math
+
+import numpy as np
+
+from utils.geometry import snap_points
+
+
+def simplify_polyline(points, tolerance):
+    """Douglas-Peucker simplification, vectorised with NumPy.
+
+    Every original vertex stays within tolerance of the simplified line
+    (distance to the nearest kept segment, not its infinite extension).
+    All intervals of one recursion level are split in a single array pass.
+    Returns an (m, 2) array of the kept vertices.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 3:
+        return points
+    return points[_douglas_peucker(points, tolerance, np.array([0, len(points) - 1]))]
+
+
+def _douglas_peucker(points, tolerance, breaks):
+    """Mask of the vertices kept by Douglas-Peucker between every pair of
+    consecutive break vertices, which are always kept"""
+    n = len(points)
+    xs = np.ascontiguousarray(points[:, 0])
+    ys = np.ascontiguousarray(points[:, 1])
+    keep = np.zeros(n, dtype=bool)
+    keep[breaks] = True
+    starts = breaks[:-1]
+    ends = breaks[1:]
+
+    while len(starts):
+        inner = ends - starts > 1
+        starts, ends = starts[inner], ends[inner]
+        if not len(starts):
+            break
+
+        # Interior vertex indices of every interval, laid end to end
+        counts = ends - starts - 1
+        first = np.cumsum(counts) - counts
+        interval = np.repeat(np.arange(len(starts)), counts)
+        idx = np.repeat(starts + 1 - first, counts) + np.arange(counts.sum())
+
+        ax, ay = xs[starts], ys[starts]
+        dx, dy = (xs[ends] - ax)[interval], (ys[ends] - ay)[interval]
+        px, py = xs[idx] - ax[interval], ys[idx] - ay[interval]
+        length2 = dx * dx + dy * dy
+        t = np.divide(px * dx + py * dy, length2, out=np.zeros(len(idx)), where=length2 > 0)
+        np.clip(t, 0, 1, out=t)
+        dist = np.hypot(px - t * dx, py - t * dy)
+
+        # Furthest vertex of each interval
+        max_dist = np.maximum.reduceat(dist, first)
+        at_max = np.flatnonzero(dist == max_dist[interval])
+        owner = interval[at_max]
+        first_max = np.flatnonzero(np.diff(owner, prepend=-1))
+        split_at = idx[at_max[first_max]]
+
+        split = max_dist > tolerance
+        split_at = split_at[split]
+        keep[split_at] = True
+        starts, ends = (np.concatenate([starts[split], split_at]),
+                        np.concatenate([split_at, ends[split]]))
+
+    return keep
+
+
+def thin_positions(positions, spacing):
+    """Indices keeping at most one of the positions per spacing-wide bucket"""
+    positions = np.asarray(positions, dtype=float)
+    if spacing <= 0 or len(positions) == 0:
+        return np.arange(len(positions))
+    buckets = np.floor((positions - positions.min()) / spacing)
+    _, keep = np.unique(buckets, return_index=True)
+    return np.sort(keep)
+
+
+def _thin_ticks(lines, tolerance, min_spacing):
+    """Keep only every n-th of dense runs of identical parallel segments"""
+    groups = {}
+    for line in lines:
+        dx = line['x2'] - line['x1']
+        dy = line['y2'] - line['y1']
+        length = math.hypot(dx, dy)
+        ux, uy = dx / length, dy / length
+        key = (line['layer'], line['width'],
+               round(dx / tolerance), round(dy / tolerance),
+               round((ux * line['x1'] + uy * line['y1']) / tolerance))
+        # Position across the tick direction
+        groups.setdefault(key, []).append((-uy * line['x1'] + ux * line['y1'], line))
+
+    result = []
+    for members in groups.values():
+        if len(members) < 3:
+            result.extend(line for _, line in members)
+            continue
+        members.sort(key=lambda m: m[0])
+        last = None
+        for position, line in members:
+            if last is None or position - last >= min_spacing:
+                result.append(line)
+                last = position
+    return result
+
+
+def _thin_segments(coords, tolerance, min_spacing):
+    """Array version of _thin_ticks for the rows of a segments element"""
+    if len(coords) < 3:
+        return coords
+    dx = coords[:, 2] - coords[:, 0]
+    dy = coords[:, 3] - coords[:, 1]
+    length = np.hypot(dx, dy)
+    ux = np.divide(dx, length, out=np.zeros_like(dx), where=length > 0)
+    uy = np.divide(dy, length, out=np.zeros_like(dy), where=length > 0)
+    along = ux * coords[:, 0] + uy * coords[:, 1]
+    across = -uy * coords[:, 0] + ux * coords[:, 1]
+
+    # Rows in the same run share length, direction and position along it
+    keys = np.column_stack([np.round(dx / tolerance), np.round(dy / tolerance),
+                            np.round(along / tolerance),
+                            np.floor((across - across.min()) / min_spacing)])
+    _, keep = np.unique(keys, axis=0, return_index=True)
+    return coords[np.sort(keep)]
+
+
+def _simplify_segment_runs(coords, tolerance):
+    """Rows of a segments element simplified like polylines: every run of rows
+    each starting where the previous one ended (an instance's outline) is
+    simplified within tolerance in one Douglas-Peucker pass over all runs"""
+    if len(coords) < 2:
+        return coords
+    joined = (coords[1:, :2] == coords[:-1, 2:]).all(axis=1)
+    first_rows = np.flatnonzero(np.concatenate([[True], ~joined]))
+    last_rows = np.concatenate([first_rows[1:], [len(coords)]]) - 1
+    if len(first_rows) == len(coords):
+        return coords
+
+    # Start of every row, and after the last row of each run its end
+    runs = np.arange(len(first_rows))
+    points = np.insert(coords[:, :2], last_rows + 1, coords[last_rows, 2:], axis=0)
+    run = np.repeat(runs, last_rows - first_rows + 2)
+    breaks = np.sort(np.concatenate([first_rows + runs, last_rows + runs + 1]))
+    kept = np.flatnonzero(_douglas_peucker(points, tolerance, breaks))
+    same_run = run[kept[:-1]] == run[kept[1:]]
+    return np.hstack([points[kept[:-1][same_run]], points[kept[1:][same_run]]])
+
+
+def _collapse_segments(coords, cell):
+    """Rows of a segments element snapped to a grid of cell, so outlines
+    smaller than a cell collapse: rows shorter than a cell are dropped and
+    rows that snap onto the same ends, either way round, are kept once"""
+    if len(coords) == 0:
+        return coords
+    grid = np.round(coords / cell)
+    start, end = grid[:, :2], grid[:, 2:]
+    keep = (start != end).any(axis=1)
+    grid, start, end = grid[keep], start[keep], end[keep]
+    reverse = (start[:, 0] > end[:, 0]) | ((start[:, 0] == end[:, 0]) & (start[:, 1] > end[:, 1]))
+    keys = np.where(reverse[:, None], np.hstack([end, start]), grid)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    return grid[np.sort(first)] * cell
+
+
+def _thin_text_batch(batch, min_spacing):
+    """Keep at most one label of a batch per min_spacing along its run"""
+    x, y = batch['x'], batch['y']
+    if len(x) < 3:
+        return batch
+    positions = x if np.ptp(x) >= np.ptp(y) else y
+    keep = thin_positions(positions, min_spacing)
+    if len(keep) == len(x):
+        return batch
+    thinned = dict(batch)
+    thinned['x'], thinned['y'], thinned['text'] = x[keep], y[keep], batch['text'][keep]
+    return thinned
+
+
+def simplify_for_scale(elements, texts, scale, tolerance_px=0.5,
+                       min_text_px=4, min_tick_spacing_px=3):
+    """Simplify elements and texts for rendering at scale pixels per drawing unit.
+
+    Returns new (elements, texts) lists; the inputs are left untouched.
+    """
+    if scale <= 0:
+        return list(elements), list(texts)
+
+    # Snapping and polyline simplification each take half of the error budget
+    tolerance = tolerance_px / scale
+    half = tolerance / 2
+
+    # Snap every vertex to a shared representative, so sub-pixel segments
+    # collapse onto their neighbours
+    vertices = []
+    for elem in elements:
+        if elem['type'] == 'line':
+            vertices.append((elem['x1'], elem['y1']))
+            vertices.append((elem['x2'], elem['y2']))
+        elif elem['type'] == 'polyline' and not isinstance(elem['points'], np.ndarray):
+            vertices.extend(elem['points'])
+    snapped = iter(snap_points(vertices, half))
+
+    lines = []
+    simplified = []
+    for elem in elements:
+        if elem['type'] == 'line':
+            p1, p2 = next(snapped), next(snapped)
+            if p1 != p2:
+                line = dict(elem)
+                line['x1'], line['y1'] = p1
+                line['x2'], line['y2'] = p2
+                lines.append(line)
+        elif elem['type'] == 'polyline' and isinstance(elem['points'], np.ndarray):
+            # Dense array polylines (ground profiles) skip snapping
+            polyline = dict(elem)
+            polyline['points'] = simplify_polyline(elem['points'], half)
+            simplified.append(polyline)
+        elif elem['type'] == 'polyline':
+            points = [next(snapped) for _ in elem['points']]
+            points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+            if elem['closed'] and len(points) > 1 and points[0] == points[-1]:
+                points.pop()
+            if len(points) < 2:
+                continue
+            if elem['closed']:
+                points = simplify_polyline(points + [points[0]], half)[:-1]
+            else:
+                points = simplify_polyline(points, half)
+            points = [tuple(p) for p in points.tolist()]
+            if len(points) < 2:
+                continue
+            polyline = dict(elem)
+            polyline['points'] = points
+            polyline['closed'] = elem['closed'] and len(points) > 2
+            simplified.append(polyline)
+        elif elem['type'] == 'segments':
+            segments = dict(elem)
+            # Instanced outlines (plan piers) are simplified, and collapse below
+            # a pixel like snapped lines
+            coords = _simplify_segment_runs(np.asarray(elem['coords'], dtype=float), half)
+            coords = _collapse_segments(coords, half)
+            if not len(coords):
+                continue
+            segments['coords'] = _thin_segments(coords, tolerance, min_tick_spacing_px / scale)
+            simplified.append(segments)
+        else:
+            simplified.append(elem)
+
+    lines = _thin_ticks(lines, tolerance, min_tick_spacing_px / scale)
+
+    # Label batches keep one label per text height along their run
+    visible_texts = [_thin_text_batch(t, t['size']) if t.get('type') == 'text_batch' else t
+                     for t in texts if t['size'] * scale >= min_text_px]
+
+    return lines + simplified, visible_texts
@@ -0,0 +1,140 @@
+# utils/mesh.py
+"""
+Solids as NumPy vertex and index buffers, written as binary glTF or STL.
+
+Every solid is a loft between a bottom and a top ring of k vertices. A
+batch of n solids shares one topology, so the triangle indices of the
+first solid are offset for all the others in one array operation. Model
+coordinates are x along the chainage, y the level and z across the
+bridge, in mm.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+# Binary glTF is in metres with y up; STL is written in mm with z up
+MESH_FORMATS = {'glb': 'model/gltf-binary', 'stl': 'model/stl'}
+GLTF_SCALE = 0.001
+STL_HEADER = b'BridgeGAD massing model'
+
+
+def plan_to_model(points, levels):
+    """Plan points (n, k, 2) at one level per solid (n,) as model points (n, k, 3)"""
+    points = np.asarray(points, dtype=float)
+    levels = np.broadcast_to(np.asarray(levels, dtype=float).reshape(-1, 1), points.shape[:2])
+    return np.stack([points[..., 0], levels, -points[..., 1]], axis=-1)
+
+
+def triangulate(profile):
+    """Triangles (k - 2, 3) filling a simple polygon (k, 2) by ear clipping,
+    wound the same way round as the polygon"""
+    profile = np.asarray(profile, dtype=float)
+    x, y = profile[:, 0], profile[:, 1]
+    ccw = np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y) > 0
+    remaining = list(range(len(profile))) if ccw else list(range(len(profile)))[::-1]
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    triangles = []
+    while len(remaining) > 3:
+        for i in range(len(remaining)):
+            a, b, c = remaining[i - 1], remaining[i], remaining[(i + 1) % len(remaining)]
+            pa, pb, pc = profile[a], profile[b], profile[c]
+            if cross(pa, pb, pc) <= 0:
+                continue
+            # An ear holds no other vertex of the polygon
+            if any(cross(pa, pb, profile[p]) >= 0 and cross(pb, pc, profile[p]) >= 0
+                   and cross(pc, pa, profile[p]) >= 0 for p in remaining if p not in (a, b, c)):
+                continue
+            triangles.append((a, b, c))
+            del remaining[i]
+            break
+        else:
+            raise ValueError("Profile is not a simple polygon")
+    triangles.append(tuple(remaining))
+    triangles = np.array(triangles, dtype=np.int64)
+    return triangles if ccw else triangles[:, ::-1]
+
+
+def loft_solids(bottom, top, profile):
+    """Positions (n * 2k, 3) and triangles (n * t, 3) of n closed solids from
+    their bottom and top rings (n, k, 3); profile (k, 2) is a typical cross
+    section whose triangulation closes both ends of every solid"""
+    bottom, top = np.asarray(bottom, dtype=float), np.asarray(top, dtype=float)
+    n, k = bottom.shape[:2]
+    j = np.arange(k)
+    j1 = (j + 1) % k
+    cap = triangulate(profile)
+    template = np.concatenate([
+        np.column_stack([j, j1, k + j1]), np.column_stack([j, k + j1, k + j]),  # Sides
+        cap[:, ::-1], cap + k,  # Bottom and top ends
+    ])
+
+    positions = np.concatenate([bottom, top], axis=1)  # (n, 2k, 3)
+    triangles = template[None, :, :] + (2 * k * np.arange(n))[:, None, None]
+
+    # Wind every solid outwards: mirrored instances come out inside out
+    corners = positions.reshape(-1, 3)[triangles]  # (n, t, 3, 3)
+    volume = np.einsum('ntj,ntj->n', corners[:, :, 0], np.cross(corners[:, :, 1], corners[:, :, 2]))
+    triangles[volume < 0] = triangles[volume < 0][:, :, ::-1]
+    return positions.reshape(-1, 3), triangles.reshape(-1, 3).astype(np.uint32)
+
+
+def write_glb(parts, origin=(0.0, 0.0, 0.0)):
+    """Binary glTF with one node and mesh per part; parts are (name, positions,
+    triangles) and positions are stored relative to origin, in metres"""
+    origin = np.asarray(origin, dtype=float)
+    chunks, accessors, views, meshes, nodes = [], [], [], [], []
+    offset = 0
+    for name, positions, triangles in parts:
+        local = ((positions - origin) * GLTF_SCALE).astype('<f4')
+        for data, target, component, kind in ((local, 34962, 5126, 'VEC3'),
+                                              (triangles.astype('<u4').ravel(), 34963, 5125, 'SCALAR')):
+            raw = data.tobytes()
+            views.append({'buffer': 0, 'byteOffset': offset, 'byteLength': len(raw), 'target': target})
+            accessor = {'bufferView': len(views) - 1, 'componentType': component,
+                        'count': len(data), 'type': kind}
+            if kind == 'VEC3':
+                accessor.update(min=local.min(axis=0).tolist(), max=local.max(axis=0).tolist())
+            accessors.append(accessor)
+            chunks.append(raw)
+            offset += len(raw)
+        meshes.append({'name': name, 'primitives': [{'attributes': {'POSITION': len(accessors) - 2},
+                                                     'indices': len(accessors) - 1}]})
+        nodes.append({'name': name, 'mesh': len(meshes) - 1})
+
+    nodes.append({'name': 'bridge', 'children': list(range(len(meshes))),
+                  'translation': (origin * GLTF_SCALE).tolist()})
+    binary = b''.join(chunks)
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'BridgeGAD'},
+        'scene': 0, 'scenes': [{'nodes': [len(nodes) - 1]}],
+        'nodes': nodes, 'meshes': meshes, 'accessors': accessors, 'bufferViews': views,
+        'buffers': [{'byteLength': len(binary)}],
+    }
+    content = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    content += b' ' * (-len(content) % 4)
+    binary += b'\0' * (-len(binary) % 4)
+    return b''.join([
+        struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(content) + 8 + len(binary)),
+        struct.pack('<I4s', len(content), b'JSON'), content,
+        struct.pack('<I4s', len(binary), b'BIN\0'), binary,
+    ])
+
+
+def write_stl(parts):
+    """Binary STL of every triangle of the parts, in mm with z up"""
+    corners = np.concatenate([positions[triangles] for _, positions, triangles in parts])
+    # Model y (level) up becomes z up: (x, y, z) -> (x, -z, y)
+    corners = np.stack([corners[..., 0], -corners[..., 2], corners[..., 1]], axis=-1)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    records = np.zeros(len(corners), dtype=[('normal', '<f4', 3), ('corners', '<f4', (3, 3)), ('attribute', '<u2')])
+    records['normal'] = normals
+    records['corners'] = corners
+    return STL_HEADER.ljust(80, b' ') + struct.pack('<I', len(records)) + records.tobytes()
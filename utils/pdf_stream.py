@@ -0,0 +1,211 @@
+# utils/pdf_stream.py
+"""
+Incremental PDF output: each page is written as soon as it is finished, with
+fonts and forms written once for the whole document, so multi-page sets
+stream page by page instead of being held until reportlab saves the canvas.
+
+PageCanvas records one page through the part of the reportlab canvas API
+that the PDF writers use, so draw_elements() and draw_texts() run on it
+unchanged. Pages are plain data and can be drawn in worker processes.
+"""
+
+import zlib
+
+from reportlab.lib.rl_accel import fp_str, escapePDF
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.pathobject import PDFPathObject
+
+
+class PageText:
+    """Text object of a PageCanvas"""
+
+    def __init__(self, canvas, x=0, y=0):
+        self._canvas = canvas
+        self._code = [f"1 0 0 1 {fp_str(x, y)} Tm"] if x or y else []
+
+    def setFont(self, name, size, leading=None):
+        self._code.append(f"/{self._canvas.font_resource(name)} {fp_str(size)} Tf")
+
+    def setTextTransform(self, a, b, c, d, e, f):
+        self._code.append(f"{fp_str(a, b, c, d, e, f)} Tm")
+
+    def textOut(self, text):
+        self._code.append(f"({escapePDF(text)}) Tj")
+
+
+class PageCanvas:
+    """Operators, fonts and forms of one page"""
+
+    def __init__(self, pagesize):
+        self.pagesize = pagesize
+        self.fonts = {}  # Font name -> resource name
+        self.forms = {}  # Form name -> (bbox, fonts used, operators)
+        self.used_forms = set()
+        self._code = []
+        self._form = None
+        self._font = ('Helvetica', 12)
+
+    def font_resource(self, name):
+        if name not in self.fonts:
+            self.fonts[name] = f"F{len(self.fonts) + 1}"
+        return self.fonts[name]
+
+    def setLineWidth(self, width):
+        self._code.append(f"{fp_str(width)} w")
+
+    def setStrokeColor(self, color):
+        self._code.append(f"{fp_str(color.red, color.green, color.blue)} RG")
+
+    def setDash(self, array=(), phase=0):
+        self._code.append(f"[{fp_str(*array) if array else ''}] {fp_str(phase)} d")
+
+    def addLiteral(self, code):
+        self._code.append(code)
+
+    def saveState(self):
+        self._code.append('q')
+
+    def restoreState(self):
+        self._code.append('Q')
+
+    def translate(self, dx, dy):
+        self._code.append(f"1 0 0 1 {fp_str(dx, dy)} cm")
+
+    def line(self, x1, y1, x2, y2):
+        self._code.append(f"n {fp_str(x1, y1)} m {fp_str(x2, y2)} l S")
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        self._code.append(f"n {fp_str(x, y, width, height)} re {'B' if fill and stroke else 'f' if fill else 'S'}")
+
+    def beginPath(self):
+        return PDFPathObject()
+
+    def clipPath(self, path, stroke=0, fill=0):
+        self._code.append(f"{path.getCode()} W {'S' if stroke else 'n'}")
+
+    def beginText(self, x=0, y=0):
+        return PageText(self, x, y)
+
+    def drawText(self, text):
+        self._code.append('BT ' + ' '.join(text._code) + ' ET')
+
+    def setFont(self, name, size, leading=None):
+        self._font = (name, size)
+
+    def drawString(self, x, y, text):
+        name, size = self._font
+        self._code.append(f"BT /{self.font_resource(name)} {fp_str(size)} Tf "
+                          f"1 0 0 1 {fp_str(x, y)} Tm ({escapePDF(text)}) Tj ET")
+
+    def drawCentredString(self, x, y, text):
+        name, size = self._font
+        self.drawString(x - stringWidth(text, name, size) / 2, y, text)
+
+    def hasForm(self, name):
+        return name in self.forms
+
+    def beginForm(self, name, lowerx=0, lowery=0, upperx=None, uppery=None):
+        upperx = self.pagesize[0] if upperx is None else upperx
+        uppery = self.pagesize[1] if uppery is None else uppery
+        self._form = (name, (lowerx, lowery, upperx, uppery), self._code, self.fonts)
+        self._code, self.fonts = [], {}
+
+    def endForm(self):
+        name, bbox, self._code, page_fonts = self._form
+        self.forms[name] = (bbox, self.fonts, '\n'.join(self._code))
+        for font in self.fonts:
+            page_fonts.setdefault(font, f"F{len(page_fonts) + 1}")
+        self.fonts, self._form = page_fonts, None
+
+    def doForm(self, name):
+        self._code.append(f"/{name} Do")
+        self.used_forms.add(name)
+
+    def getContent(self):
+        return '\n'.join(self._code)
+
+
+class PDFStreamWriter:
+    """Serialise pages one at a time; every method returns the bytes to send next"""
+
+    def __init__(self, compress=True):
+        self.compress = compress
+        self.offset = 0
+        self.offsets = {}  # Object number -> byte offset
+        self.next_id = 3  # 1 is the catalog and 2 the page tree, written last
+        self.pages = []
+        self.font_ids = {}
+        self.form_ids = {}
+
+    def _object(self, number, body):
+        data = f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+        self.offsets[number] = self.offset
+        self.offset += len(data)
+        return data
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _stream(self, entries, content):
+        data = content.encode('cp1252', 'replace')
+        if self.compress:
+            data = zlib.compress(data)
+            entries += ' /Filter /FlateDecode'
+        number = self._new_id()
+        return number, self._object(number, f"<< {entries} /Length {len(data)} >>\nstream\n".encode('ascii')
+                                    + data + b"\nendstream")
+
+    def _resources(self, fonts, forms=()):
+        font_refs = ' '.join(f"/{res} {self.font_ids[name]} 0 R" for name, res in fonts.items())
+        form_refs = ' '.join(f"/{name} {self.form_ids[name]} 0 R" for name in sorted(forms))
+        return (f"/Resources << /ProcSet [/PDF /Text] /Font << {font_refs} >>"
+                f"{f' /XObject << {form_refs} >>' if form_refs else ''} >>")
+
+    def begin(self):
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offset = len(data)
+        return data
+
+    def add_page(self, page):
+        """Bytes of a page with the fonts and forms it is the first to use"""
+        chunks = []
+        fonts = list(page.fonts)
+        for _, form_fonts, _ in page.forms.values():
+            fonts += list(form_fonts)
+        for name in fonts:
+            if name not in self.font_ids:
+                number = self.font_ids[name] = self._new_id()
+                chunks.append(self._object(number, (
+                    f"<< /Type /Font /Subtype /Type1 /BaseFont /{name} "
+                    f"/Encoding /WinAnsiEncoding >>").encode('ascii')))
+
+        for name in sorted(page.used_forms):
+            if name in self.form_ids:
+                continue
+            bbox, form_fonts, content = page.forms[name]
+            number, data = self._stream(f"/Type /XObject /Subtype /Form /FormType 1 "
+                                        f"/BBox [{fp_str(*bbox)}] {self._resources(form_fonts)}", content)
+            self.form_ids[name] = number
+            chunks.append(data)
+
+        content_id, data = self._stream('', page.getContent())
+        chunks.append(data)
+        page_id = self._new_id()
+        self.pages.append(page_id)
+        chunks.append(self._object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {fp_str(*page.pagesize)}] "
+            f"{self._resources(page.fonts, page.used_forms)} /Contents {content_id} 0 R >>").encode('ascii')))
+        return b''.join(chunks)
+
+    def finish(self):
+        """Page tree, catalog, cross-reference table and trailer"""
+        kids = ' '.join(f"{number} 0 R" for number in self.pages)
+        chunks = [
+            self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode('ascii')),
+            self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        ]
+        xref = [f"xref\n0 {self.next_id}\n0000000000 65535 f \n"]
+        xref += [f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self.next_id)]
+        xref.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{self.offset}\n%%EOF\n")
+        return b''.join(chunks) + ''.join(xref).encode('ascii')
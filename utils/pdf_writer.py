@@ -0,0 +1,347 @@
+# utils/pdf_writer.py
+"""
+Vectorised PDF output on a reportlab canvas: one path per layer and line
+width with coordinates transformed and formatted in bulk, every text in one
+text object, graphics state set only when it changes, components that
+repeat (piers, footings, slabs) drawn once as Form XObjects and placed, and
+hatch patterns drawn once as a sheet of cells tiled under a clip
+"""
+
+import hashlib
+import math
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+from reportlab import rl_config
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from utils.labels import split_lines
+from utils.hatching import HATCH_PATTERNS, HATCH_LINE_WIDTH, HATCH_MIN_CELL, pattern_segments
+
+PDF_FONT = 'Helvetica'
+LINE_WIDTH_FACTOR = 0.5  # PDF points per unit of element width
+
+# Shapes matching within this many drawing mm are drawn from one form
+FORM_TOLERANCE = 0.01
+# Approximate bytes of one form placement (q ... cm /Name Do Q), weighed
+# against the bytes of the vectors it replaces
+FORM_PLACEMENT_BYTES = 48
+
+# Hatch pattern forms hold this many cells a side
+HATCH_SHEET_CELLS = 8
+
+_binary_lock = threading.Lock()
+_binary_depth = 0
+_previous_a85 = rl_config.useA85
+
+
+@contextmanager
+def binary_streams():
+    """Write the streams of canvases saved inside as binary Flate data.
+
+    ASCII85 on top makes them a quarter larger and, without reportlab's C
+    accelerator, dominates write time. reportlab reads the setting from its
+    global config when a document is saved, so it is set only while one of
+    these blocks is open in any thread and restored after the last one.
+    """
+    global _binary_depth, _previous_a85
+    with _binary_lock:
+        if not _binary_depth:
+            _previous_a85 = rl_config.useA85
+            rl_config.useA85 = 0
+        _binary_depth += 1
+    try:
+        yield
+    finally:
+        with _binary_lock:
+            _binary_depth -= 1
+            if not _binary_depth:
+                rl_config.useA85 = _previous_a85
+
+
+@lru_cache(maxsize=65536)
+def string_width(text, font=PDF_FONT):
+    """Width of a string at unit size, measured once per (font, string)"""
+    return stringWidth(text, font, 1)
+
+
+def element_path(elem, transform_x, transform_y):
+    """PDF path operators of one element; the transforms are applied to whole arrays"""
+    if elem['type'] == 'polyline':
+        points = np.asarray(elem['points'], dtype=float)
+        flat = np.column_stack([transform_x(points[:, 0]), transform_y(points[:, 1])]).ravel().tolist()
+        code = ('%.2f %.2f m ' + '%.2f %.2f l ' * (len(points) - 1)) % tuple(flat)
+        return code + 'h ' if elem['closed'] else code
+    if elem['type'] == 'line':
+        coords = np.array([[elem['x1'], elem['y1'], elem['x2'], elem['y2']]], dtype=float)
+    else:
+        coords = elem['coords']
+    xs, ys = transform_x(coords[:, 0::2]), transform_y(coords[:, 1::2])
+    flat = np.column_stack([xs[:, 0], ys[:, 0], xs[:, 1], ys[:, 1]]).ravel().tolist()
+    return ('%.2f %.2f m %.2f %.2f l ' * len(coords)) % tuple(flat)
+
+
+def stroke_groups(c, elements, transform_x, transform_y):
+    """Stroke elements as one path per (width, layer), setting the line width
+    only when it changes. Returns the number of paths drawn."""
+    groups = {}
+    for elem in elements:
+        groups.setdefault((elem['width'], elem['layer']), []).append(elem)
+
+    width = None
+    for key in sorted(groups, key=lambda k: (k[0], str(k[1]))):
+        if key[0] != width:
+            width = key[0]
+            c.setLineWidth(width * LINE_WIDTH_FACTOR)
+        c.addLiteral(''.join(element_path(elem, transform_x, transform_y) for elem in groups[key]) + 'S')
+    return len(groups)
+
+
+def _key(values, tolerance):
+    return tuple(np.round(np.asarray(values, dtype=float).ravel() / tolerance).astype(np.int64).tolist())
+
+
+def _periodic_blocks(coords, tolerance):
+    """Split a segments array into k > 1 translated copies of one run of
+    segments (k x m x 4), or None"""
+    n = len(coords)
+    direction = coords[:, 2:] - coords[:, :2]
+    candidates = np.flatnonzero(np.all(np.abs(direction - direction[0]) <= tolerance, axis=1))
+    for m in candidates[1:].tolist():
+        # Runs of a single segment cost more to place than to draw
+        if m < 2 or n % m:
+            continue
+        blocks = coords.reshape(n // m, m, 4)
+        relative = blocks - np.tile(blocks[:, :1, :2], 2)
+        if np.all(np.abs(relative - relative[0]) <= tolerance):
+            return blocks
+    return None
+
+
+def find_components(elements, tolerance=FORM_TOLERANCE):
+    """Split elements into repeated components and the rest.
+
+    Shapes are keyed by layer, width and geometry relative to their first
+    point, as write_dxf_dimensions() keys repeated dimensions; runs inside
+    segments batches (e.g. every pier of the plan) are split off by period.
+    Shapes repeating on the same offsets (cap, shaft and footing of every
+    pier) form one component. Returns (components, rest), where each
+    component is (pieces, anchors, sources): the pieces of its first copy
+    in drawing coordinates, the anchor of every copy and the elements it
+    came from.
+    """
+    shapes = {}
+    rest = []
+    for elem in elements:
+        if elem['type'] == 'segments':
+            blocks = _periodic_blocks(elem['coords'], tolerance) if len(elem['coords']) > 2 else None
+            if blocks is None:
+                rest.append(elem)
+                continue
+            key = (elem['layer'], elem['width'], 'segments', _key(blocks[0] - np.tile(blocks[0, 0, :2], 2), tolerance))
+            entry = shapes.setdefault(key, ([], [], []))
+            entry[0].extend({'type': 'segments', 'coords': block, 'layer': elem['layer'],
+                             'width': elem['width']} for block in blocks)
+            entry[1].extend(blocks[:, 0, :2].tolist())
+            entry[2].append(elem)
+            continue
+        if elem['type'] == 'line':
+            anchor = (elem['x1'], elem['y1'])
+            shape = _key((elem['x2'] - elem['x1'], elem['y2'] - elem['y1']), tolerance)
+        else:
+            points = np.asarray(elem['points'], dtype=float)
+            anchor = tuple(points[0].tolist())
+            shape = _key(points - points[0], tolerance) + (elem['closed'],)
+        entry = shapes.setdefault((elem['layer'], elem['width'], elem['type'], shape), ([], [], []))
+        entry[0].append(elem)
+        entry[1].append(anchor)
+        entry[2].append(elem)
+
+    # Shapes repeating on the same offsets belong to one component
+    patterns = {}
+    for key, (pieces, anchors, sources) in shapes.items():
+        if len(anchors) < 2:
+            rest.extend(sources)
+            continue
+        anchors = np.array(anchors)
+        order = np.lexsort((anchors[:, 1], anchors[:, 0]))
+        anchors = anchors[order]
+        pattern = _key(anchors - anchors[0], tolerance)
+        patterns.setdefault(pattern, []).append((pieces[order[0]], anchors, sources))
+
+    components = [([piece for piece, _, _ in group], group[0][1],
+                   [elem for _, _, sources in group for elem in sources])
+                  for group in patterns.values()]
+    return components, rest
+
+
+def _relative_path_bounds(pieces, relative_x, relative_y):
+    """Box of the pieces in form (point) coordinates"""
+    xs, ys = [], []
+    for piece in pieces:
+        if piece['type'] == 'line':
+            xs += [piece['x1'], piece['x2']]
+            ys += [piece['y1'], piece['y2']]
+        elif piece['type'] == 'segments':
+            xs += piece['coords'][:, 0::2].ravel().tolist()
+            ys += piece['coords'][:, 1::2].ravel().tolist()
+        else:
+            points = np.asarray(piece['points'], dtype=float)
+            xs += points[:, 0].tolist()
+            ys += points[:, 1].tolist()
+    px, py = relative_x(np.array(xs)), relative_y(np.array(ys))
+    return float(px.min()), float(py.min()), float(px.max()), float(py.max())
+
+
+def draw_elements(c, elements, transform_x, transform_y, forms=True):
+    """Stroke elements, drawing repeated components once as Form XObjects.
+
+    Forms are named by their content, so identical components share one
+    object across views and pages of a canvas. A component is only made a
+    form when that is smaller than drawing its copies. Returns the number
+    of form placements.
+    """
+    components, rest = find_components(elements) if forms else ([], list(elements))
+
+    placements = []
+    for pieces, anchors, sources in components:
+        x0, y0 = anchors[0]
+        tx0, ty0 = transform_x(x0), transform_y(y0)
+
+        def relative_x(x, tx0=tx0):
+            return transform_x(x) - tx0
+
+        def relative_y(y, ty0=ty0):
+            return transform_y(y) - ty0
+
+        code = ''.join(element_path(piece, relative_x, relative_y) for piece in pieces)
+        if (len(anchors) - 1) * len(code) <= len(anchors) * FORM_PLACEMENT_BYTES:
+            rest.extend(sources)
+            continue
+
+        name = 'C' + hashlib.sha1(code.encode('ascii')).hexdigest()[:12]
+        if not c.hasForm(name):
+            # Room for the stroke width around the outline
+            pad = max(piece['width'] for piece in pieces) * LINE_WIDTH_FACTOR
+            x1, y1, x2, y2 = _relative_path_bounds(pieces, relative_x, relative_y)
+            c.beginForm(name, x1 - pad, y1 - pad, x2 + pad, y2 + pad)
+            stroke_groups(c, pieces, relative_x, relative_y)
+            c.endForm()
+        placements.append((name, transform_x(anchors[:, 0]), transform_y(anchors[:, 1])))
+
+    stroke_groups(c, rest, transform_x, transform_y)
+
+    count = 0
+    for name, xs, ys in placements:
+        for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(name)
+            c.restoreState()
+            count += 1
+    return count
+
+
+def hatch_form(c, pattern, cell):
+    """Form of HATCH_SHEET_CELLS x HATCH_SHEET_CELLS pattern cells of cell
+    points, defined once per canvas; returns its name and side"""
+    side = cell * HATCH_SHEET_CELLS
+    name = f"H{pattern}_" + hashlib.sha1(f"{cell:.4f}".encode('ascii')).hexdigest()[:8]
+    if not c.hasForm(name):
+        segments = pattern_segments(pattern, cell)
+        offsets = np.arange(HATCH_SHEET_CELLS) * cell
+        ox, oy = [grid.ravel() for grid in np.meshgrid(offsets, offsets)]
+        coords = (segments[None, :, :] + np.column_stack([ox, oy, ox, oy])[:, None, :]).reshape(-1, 4)
+        c.beginForm(name, 0, 0, side, side)
+        c.setLineWidth(HATCH_LINE_WIDTH * LINE_WIDTH_FACTOR)
+        c.addLiteral(('%.2f %.2f m %.2f %.2f l ' * len(coords)) % tuple(coords.ravel().tolist()) + 'S')
+        c.endForm()
+    return name, side
+
+
+def draw_hatches(c, hatches, transform_x, transform_y, scale, visible=None):
+    """Fill hatches with their patterns: each hatch is one clip path over
+    its loops with the shared pattern form placed under it, the patterns
+    lining up across hatches. scale is points per drawing mm; placements
+    are limited to visible (x0, y0, x1, y1 in points) when given. Returns
+    the number of hatches drawn."""
+    count = 0
+    for hatch in hatches:
+        cell = HATCH_PATTERNS[hatch['pattern']]['cell'] * hatch['scale'] * scale
+        if cell < HATCH_MIN_CELL or not len(hatch['paths']):
+            continue
+        xs = np.asarray(transform_x(hatch['paths'][:, :, 0]), dtype=float)
+        ys = np.asarray(transform_y(hatch['paths'][:, :, 1]), dtype=float)
+        x0, y0, x1, y1 = xs.min(), ys.min(), xs.max(), ys.max()
+        if visible is not None:
+            x0, y0 = max(x0, visible[0]), max(y0, visible[1])
+            x1, y1 = min(x1, visible[2]), min(y1, visible[3])
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+        name, side = hatch_form(c, hatch['pattern'], cell)
+        m = xs.shape[1]
+        clip = ''.join(('%.2f %.2f m ' + '%.2f %.2f l ' * (m - 1) + 'h ')
+                       % tuple(np.column_stack([loop_x, loop_y]).ravel().tolist())
+                       for loop_x, loop_y in zip(xs, ys))
+        c.saveState()
+        c.addLiteral(clip + 'W n')
+        for px in np.arange(math.floor(x0 / side), math.ceil(x1 / side)) * side:
+            for py in np.arange(math.floor(y0 / side), math.ceil(y1 / side)) * side:
+                c.saveState()
+                c.translate(float(px), float(py))
+                c.doForm(name)
+                c.restoreState()
+        c.restoreState()
+        count += 1
+    return count
+
+
+def text_lines(texts, transform_x, transform_y, scale):
+    """(font size, rotation, x, y, line, offset) of every line of texts and
+    text batches, in PDF points; batch positions are transformed in bulk"""
+    for text in texts:
+        size = text['size'] * scale  # True scale, as placed
+        rotation = text.get('rotation', 0)
+        if text.get('type') == 'text_batch':
+            fmt = text.get('format')
+            xs = np.asarray(transform_x(text['x']), dtype=float).tolist()
+            ys = np.asarray(transform_y(text['y']), dtype=float).tolist()
+            values = text['text'].tolist()
+            strings = [fmt % value for value in values] if fmt else values
+        else:
+            xs, ys, strings = [transform_x(text['x'])], [transform_y(text['y'])], [text['text']]
+        for x, y, string in zip(xs, ys, strings):
+            for line, offset in split_lines(string):
+                yield size, rotation, x, y, line, offset
+
+
+def draw_texts(c, texts, transform_x, transform_y, scale, font=PDF_FONT):
+    """Draw texts centred on x with their last baseline at y, as the other
+    writers place them, in one text object with the font set once per size"""
+    by_size = {}
+    for size, rotation, x, y, line, offset in text_lines(texts, transform_x, transform_y, scale):
+        by_size.setdefault(size, []).append((rotation, x, y, line, offset))
+    if not by_size:
+        return 0
+
+    t = c.beginText()
+    turns = {}
+    count = 0
+    for size in sorted(by_size):
+        t.setFont(font, size)
+        for rotation, x, y, line, offset in by_size[size]:
+            turn = turns.get(rotation)
+            if turn is None:
+                angle = math.radians(rotation)
+                turn = turns[rotation] = (math.cos(angle), math.sin(angle))
+            cos, sin = turn
+            # Start of the line: half its width back along the baseline
+            dx, dy = -string_width(line, font) * size / 2, offset * size
+            t.setTextTransform(cos, sin, -sin, cos, x + dx * cos - dy * sin, y + dx * sin + dy * cos)
+            t.textOut(line)
+            count += 1
+    c.drawText(t)
+    return count
@@ -0,0 +1,69 @@
+# utils/spans.py
+"""
+Span tables for long viaducts.
+
+A span table lists every span with its own length, and the type and
+footing level of the pier at its right-hand end, e.g.
+
+    'SPAN_TABLE': [{'length': 30000, 'pier': 'tall', 'footing_level': 96500}, ...],
+    'PIER_TYPES': {'tall': {'PIERTW': 1800, 'FUTW': 4000}},
+
+Pier types override any of PIER_PARAMS. Without a table the bridge is
+NSPAN spans of SPAN1, the last one taking the rest of LBRIDGE, as before.
+Pier positions are the cumulative sum of the span lengths and every pier
+dimension is an array with one value per pier, so hundreds of spans are
+laid out in whole-array operations.
+"""
+
+import numpy as np
+
+# Pier dimensions a pier type may override, with the engine's defaults
+PIER_PARAMS = {
+    'CAPT': 109000, 'CAPB': 108000, 'PIERTW': 1500, 'PIERST': 5000, 'BATTR': 0.02,
+    'FUTD': 2000, 'FUTW': 3000, 'FUTL': 8000,
+}
+
+
+def with_span_table(parameters):
+    """Parameters with NSPAN and LBRIDGE taken from SPAN_TABLE when one is given"""
+    rows = parameters.get('SPAN_TABLE')
+    if not rows:
+        return parameters
+    return dict(parameters, NSPAN=len(rows), LBRIDGE=float(sum(float(row['length']) for row in rows)))
+
+
+def span_layout(parameters):
+    """Span lengths, span edges (n + 1 chainages from LEFT) and pier centres,
+    with FUTRL and every PIER_PARAMS entry as an array over the piers"""
+    left = float(parameters.get('LEFT', 0))
+    rows = parameters.get('SPAN_TABLE')
+    futrl = float(parameters.get('FUTRL', 100000))
+    if rows:
+        lengths = np.array([float(row['length']) for row in rows])
+        piers = rows[:-1]
+        types = [row.get('pier') for row in piers]
+        footings = np.array([float(row.get('footing_level', futrl)) for row in piers])
+    else:
+        nspan = max(int(parameters.get('NSPAN', 1)), 1)
+        lbridge = float(parameters.get('LBRIDGE', 30000))
+        lengths = np.full(nspan, float(parameters.get('SPAN1', 30000)))
+        # The last span takes up what the others leave of LBRIDGE
+        lengths[-1] = lbridge - lengths[:-1].sum()
+        types = [None] * (nspan - 1)
+        footings = np.full(nspan - 1, futrl)
+    if (lengths <= 0).any():
+        raise ValueError("Span lengths must be positive")
+
+    edges = left + np.concatenate([[0.0], np.cumsum(lengths)])
+    layout = {'lengths': lengths, 'edges': edges, 'centres': edges[1:-1], 'FUTRL': footings}
+    pier_types = parameters.get('PIER_TYPES') or {}
+    unknown = {name for name in types if name is not None} - set(pier_types)
+    if unknown:
+        raise ValueError(f"Unknown pier type: {sorted(unknown)[0]}")
+    for name, default in PIER_PARAMS.items():
+        values = np.full(len(types), float(parameters.get(name, default)))
+        for type_name, overrides in pier_types.items():
+            if name in overrides:
+                values[[t == type_name for t in types]] = float(overrides[name])
+        layout[name] = values
+    return layout
@@ -0,0 +1,80 @@
+# utils/spatial_index.py
+"""
+Uniform grid spatial index for bounding-box queries over drawing items
+"""
+
+import math
+
+
+class GridIndex:
+    """Uniform grid over axis-aligned bounding boxes keyed by arbitrary ids"""
+
+    # Items covering more cells than this are kept in a separate list
+    MAX_CELLS_PER_ITEM = 256
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size) if cell_size > 0 else 1.0
+        self.cells = {}
+        self.large = []
+        self.boxes = {}
+        self.bounds = None
+
+    @classmethod
+    def from_boxes(cls, boxes):
+        """Build an index from {key: bbox}, sizing cells from the overall extent"""
+        if not boxes:
+            return cls(1.0)
+        min_x = min(b[0] for b in boxes.values())
+        min_y = min(b[1] for b in boxes.values())
+        max_x = max(b[2] for b in boxes.values())
+        max_y = max(b[3] for b in boxes.values())
+        area = max((max_x - min_x) * (max_y - min_y), 1.0)
+        index = cls(math.sqrt(area / len(boxes)) * 2)
+        for key, bbox in boxes.items():
+            index.insert(key, bbox)
+        return index
+
+    def _cell_range(self, min_x, min_y, max_x, max_y):
+        size = self.cell_size
+        return (int(math.floor(min_x / size)), int(math.floor(min_y / size)),
+                int(math.floor(max_x / size)), int(math.floor(max_y / size)))
+
+    def insert(self, key, bbox):
+        """Add an item and extend the overall bounds"""
+        self.boxes[key] = bbox
+        if self.bounds is None:
+            self.bounds = list(bbox)
+        else:
+            self.bounds[0] = min(self.bounds[0], bbox[0])
+            self.bounds[1] = min(self.bounds[1], bbox[1])
+            self.bounds[2] = max(self.bounds[2], bbox[2])
+            self.bounds[3] = max(self.bounds[3], bbox[3])
+
+        cx0, cy0, cx1, cy1 = self._cell_range(*bbox)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > self.MAX_CELLS_PER_ITEM:
+            self.large.append(key)
+            return
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), []).append(key)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Keys of all items whose bounding box intersects the query box"""
+        found = set()
+        candidates = list(self.large)
+        cx0, cy0, cx1, cy1 = self._cell_range(min_x, min_y, max_x, max_y)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            for cell_keys in self.cells.values():
+                candidates.extend(cell_keys)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    candidates.extend(self.cells.get((cx, cy), ()))
+
+        for key in candidates:
+            if key in found:
+                continue
+            b = self.boxes[key]
+            if b[0] <= max_x and b[2] >= min_x and b[1] <= max_y and b[3] >= min_y:
+                found.add(key)
+        return found
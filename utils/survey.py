@@ -0,0 +1,112 @@
+# utils/survey.py
+"""
+Survey data helpers for ground profiles (chainage/RL pairs)
+"""
+
+import struct
+
+import numpy as np
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def to_float_array(values):
+    """Convert survey values to float64, turning unparseable entries into NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64).ravel()
+    except (ValueError, TypeError):
+        return np.array([_to_float(v) for v in values], dtype=np.float64)
+
+
+def clean_survey(chainages, levels):
+    """Return chainage and level arrays with invalid rows dropped in one pass"""
+    chainages = to_float_array(chainages)
+    levels = to_float_array(levels)
+    n = min(len(chainages), len(levels))
+    chainages, levels = chainages[:n], levels[:n]
+
+    valid = np.isfinite(chainages) & np.isfinite(levels)
+    return chainages[valid], levels[valid]
+
+
+# Binary survey file: a fixed header, then every chainage, then every level,
+# each as little-endian float64 sorted by chainage
+SURVEY_MAGIC = b'BGADSRV1'
+SURVEY_VERSION = 1
+SURVEY_HEADER = struct.Struct('<8sIIQdd24x')
+
+
+def write_survey(path, chainages, levels):
+    """Write a binary survey file, dropping invalid rows and sorting by chainage"""
+    chainages, levels = clean_survey(chainages, levels)
+    order = np.argsort(chainages, kind='stable')
+    chainages = chainages[order].astype('<f8')
+    levels = levels[order].astype('<f8')
+
+    lo = float(chainages[0]) if len(chainages) else 0.0
+    hi = float(chainages[-1]) if len(chainages) else 0.0
+    with open(path, 'wb') as f:
+        f.write(SURVEY_HEADER.pack(SURVEY_MAGIC, SURVEY_VERSION, 0, len(chainages), lo, hi))
+        chainages.tofile(f)
+        levels.tofile(f)
+    return len(chainages)
+
+
+class SurveyFile:
+    """Memory-mapped binary survey, read one chainage window at a time"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(SURVEY_HEADER.size)
+        if len(header) < SURVEY_HEADER.size:
+            raise ValueError(f"{path} is too short to be a survey file")
+
+        magic, version, _, count, self.min_chainage, self.max_chainage = SURVEY_HEADER.unpack(header)
+        if magic != SURVEY_MAGIC:
+            raise ValueError(f"{path} is not a survey file")
+        if version != SURVEY_VERSION:
+            raise ValueError(f"Unsupported survey file version {version}")
+
+        self.count = count
+        offset = SURVEY_HEADER.size
+        if count:
+            self.chainages = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(count,))
+            self.levels = np.memmap(path, dtype='<f8', mode='r', offset=offset + 8 * count, shape=(count,))
+        else:
+            self.chainages = self.levels = np.empty(0)
+
+    def __len__(self):
+        return self.count
+
+    def window(self, start, end):
+        """Chainages and levels covering start..end, plus one point either side.
+
+        Only the pages touched by the binary search and the window itself
+        are read from disk.
+        """
+        lo = int(np.searchsorted(self.chainages, start, side='left'))
+        hi = int(np.searchsorted(self.chainages, end, side='right'))
+        lo = max(lo - 1, 0)
+        hi = min(hi + 1, self.count)
+        return np.array(self.chainages[lo:hi]), np.array(self.levels[lo:hi])
+
+    def close(self):
+        """Release the memory maps"""
+        for column in (self.chainages, self.levels):
+            mm = getattr(column, '_mmap', None)
+            if mm is not None:
+                mm.close()
+        self.chainages = self.levels = np.empty(0)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,104 @@
+# utils/transforms.py
+"""
+3x3 affine transforms for drawing coordinates, applied to whole arrays
+"""
+
+import math
+
+import numpy as np
+
+IDENTITY = np.eye(3)
+
+
+def translation(dx, dy):
+    """Move by (dx, dy)"""
+    return np.array([[1.0, 0.0, dx], [0.0, 1.0, dy], [0.0, 0.0, 1.0]])
+
+
+def scaling(sx, sy=None, origin=(0.0, 0.0)):
+    """Scale by sx (and sy) about origin"""
+    sy = sx if sy is None else sy
+    ox, oy = origin
+    return np.array([[sx, 0.0, ox - sx * ox], [0.0, sy, oy - sy * oy], [0.0, 0.0, 1.0]])
+
+
+def rotation(angle, origin=(0.0, 0.0)):
+    """Rotate counter-clockwise by angle degrees about origin"""
+    a = math.radians(angle)
+    c, s = math.cos(a), math.sin(a)
+    ox, oy = origin
+    return np.array([[c, -s, ox - c * ox + s * oy], [s, c, oy - s * ox - c * oy], [0.0, 0.0, 1.0]])
+
+
+def apply(matrix, points):
+    """Transform an array of points shaped (..., 2)"""
+    points = np.asarray(points, dtype=float)
+    x, y = points[..., 0], points[..., 1]
+    # Written out per column: much faster than a matmul with an inner size of 2
+    result = np.empty_like(points)
+    result[..., 0] = matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2]
+    result[..., 1] = matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2]
+    return result
+
+
+def apply_segments(matrix, coords):
+    """Transform both ends of an (n, 4) segments array"""
+    coords = np.asarray(coords, dtype=float)
+    return apply(matrix, coords.reshape(-1, 2, 2)).reshape(-1, 4)
+
+
+def apply_bbox(matrix, bbox):
+    """Axis-aligned box (min_x, min_y, max_x, max_y) around a transformed box"""
+    min_x, min_y, max_x, max_y = bbox
+    corners = apply(matrix, [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)])
+    return (float(corners[:, 0].min()), float(corners[:, 1].min()),
+            float(corners[:, 0].max()), float(corners[:, 1].max()))
+
+
+def matrix_angle(matrix):
+    """Rotation in degrees the matrix gives to the x direction"""
+    return math.degrees(math.atan2(matrix[1, 0], matrix[0, 0]))
+
+
+def matrix_scale(matrix):
+    """Mean linear scale of the matrix, for text heights"""
+    return math.sqrt(abs(np.linalg.det(matrix[:2, :2])))
+
+
+class TransformStack:
+    """Nested transforms; the current one maps component to drawing coordinates.
+
+    Use as: with stack.push(matrix): ...
+    """
+
+    def __init__(self, base=IDENTITY):
+        self._stack = [np.array(base, dtype=float)]
+        self._identity = [np.array_equal(base, IDENTITY)]
+
+    @property
+    def current(self):
+        return self._stack[-1]
+
+    @property
+    def is_identity(self):
+        """True when emitting can skip transforming coordinates"""
+        return self._identity[-1]
+
+    def push(self, matrix):
+        """Compose matrix inside the current transform"""
+        current = self._stack[-1] @ matrix
+        self._stack.append(current)
+        self._identity.append(np.array_equal(current, IDENTITY))
+        return self
+
+    def pop(self):
+        if len(self._stack) == 1:
+            raise ValueError("Cannot pop the base transform")
+        self._identity.pop()
+        return self._stack.pop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pop()